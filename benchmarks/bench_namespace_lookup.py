@@ -0,0 +1,55 @@
+"""
+Measure the time to look up keys defined at the root of namespaces of
+increasing depth, with the cached lookups of ``reportengine.utils.ChainMap``
+and with a plain scan of the maps.
+
+Usage::
+
+    python benchmarks/bench_namespace_lookup.py [--lookups N] [--depths D ...]
+"""
+import argparse
+import collections
+import time
+
+from reportengine import namespaces
+from reportengine.utils import ChainMap
+
+
+def make_root(depth, nkeys=10):
+    root = ChainMap()
+    level = root.maps[0]
+    for i in range(nkeys):
+        level[f'key{i}'] = i
+    for i in range(depth):
+        level['sub'] = {'value': i}
+        level = level['sub']
+    return root
+
+
+def lookup(ns, nlookups, nkeys=10):
+    keys = [f'key{i}' for i in range(nkeys)]
+    t0 = time.perf_counter()
+    for _ in range(nlookups // nkeys):
+        for key in keys:
+            ns[key]
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lookups', type=int, default=100_000)
+    parser.add_argument('--depths', type=int, nargs='+',
+                        default=[1, 10, 100])
+    args = parser.parse_args()
+
+    print(f"{'depth':>6}{'cached (s)':>14}{'scan (s)':>12}")
+    for depth in args.depths:
+        root = make_root(depth)
+        ns = namespaces.resolve(root, ('sub',)*depth)
+        cached = lookup(ns, args.lookups)
+        scan = lookup(collections.ChainMap(*ns.maps), args.lookups)
+        print(f"{depth:>6}{cached:>14.3f}{scan:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Report the memory used per resolved namespace. A root namespace holds
+``--depth`` nested lists of ``--elements`` dictionaries each (only the
+first one is expanded below the first level). Every namespace of the
+expansion is resolved and a key of the root is looked up from it, as the
+builder does. The allocations are measured with tracemalloc and the
+largest allocation sites are listed.
+
+Usage::
+
+    python benchmarks/bench_namespace_memory.py [--elements N] [--depth D]
+"""
+import argparse
+import gc
+import tracemalloc
+
+from reportengine import namespaces
+from reportengine.utils import ChainMap
+
+
+def make_root(nelements, depth):
+    root = ChainMap()
+    root['value'] = 0
+    level = root.maps[0]
+    for i in range(depth):
+        level[f'l{i}'] = [{'x': j} for j in range(nelements)]
+        level = level[f'l{i}'][0]
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--elements', type=int, default=5000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args()
+
+    root = make_root(args.elements, args.depth)
+    #All the elements of each list, under the first element of the
+    #enclosing lists
+    specs = []
+    for i in range(1, args.depth + 1):
+        prefix = tuple((f'l{j}', 0) for j in range(i - 1))
+        specs += [(*prefix, (f'l{i-1}', k)) for k in range(args.elements)]
+    #Intern the specs before measuring
+    specs = [namespaces.as_nsspec(spec) for spec in specs]
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for spec in specs:
+        namespaces.resolve(root, spec)['value']
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'lineno')
+    total = sum(stat.size_diff for stat in stats)
+    nresolved = len(namespaces._namespace_table(root))
+    print(f"Resolved namespaces: {nresolved}")
+    print(f"Total: {total/2**20:.2f} MiB, {total/nresolved:.0f} bytes "
+          "per namespace")
+    print("\nLargest allocation sites:")
+    for stat in stats[:args.top]:
+        frame = stat.traceback[0]
+        print(f"{stat.size_diff/nresolved:>8.0f} B/ns  "
+              f"{frame.filename.rsplit('/', 1)[-1]}:{frame.lineno}")
+
+
+if __name__ == '__main__':
+    main()
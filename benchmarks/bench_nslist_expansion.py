@@ -0,0 +1,56 @@
+"""
+Measure the time to expand a fuzzyspec over an ``NSList`` and resolve the
+namespace of every element, for lists of increasing size. The time per
+element should stay constant. With ``--compare``, also run with the
+previous ``NSList.as_namespace``, which built the list of all the levels
+for each element (up to ``--max-compare`` elements, since it is
+quadratic).
+
+Usage::
+
+    python benchmarks/bench_nslist_expansion.py [--sizes N ...] [--compare]
+"""
+import argparse
+import time
+from unittest import mock
+
+from reportengine import namespaces
+from reportengine.namespaces import NSList
+from reportengine.utils import ChainMap, NSFrame
+
+
+def expand(n):
+    root = ChainMap()
+    root['elements'] = NSList(range(n), nskey='element')
+    t0 = time.perf_counter()
+    specs = namespaces.expand_fuzzyspec(root, ('elements',))
+    total = sum(namespaces.resolve(root, spec)['element'] for spec in specs)
+    assert total == n*(n-1)//2
+    return time.perf_counter() - t0
+
+
+def old_as_namespace(self):
+    return [NSFrame({self.nskey: item}) for item in self]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[2500, 5000, 10_000])
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--max-compare', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'elements':>10}{'time (s)':>12}{'us/element':>12}"
+          f"{'previous (s)':>14}")
+    for n in args.sizes:
+        t = expand(n)
+        line = f"{n:>10}{t:>12.3f}{1e6*t/n:>12.1f}"
+        if args.compare and n <= args.max_compare:
+            with mock.patch.object(NSList, 'as_namespace', old_as_namespace):
+                line += f"{expand(n):>14.3f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Measure the time to build a graph with about 10^4 nodes, with and without
+the signature cache of ``reportengine.utils.get_signature``.
+
+Usage::
+
+    python benchmarks/bench_signature_cache.py [--elements N] [--repeat R]
+"""
+import argparse
+import inspect
+import time
+from unittest import mock
+
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget
+from reportengine.checks import make_argcheck
+
+
+@make_argcheck
+def check_positive(x:int):
+    assert x >= 0
+
+
+class Providers:
+    @check_positive
+    def a(self, x:int, scale=1):
+        return x*scale
+
+    def b(self, a, offset=0):
+        return a + offset
+
+    def c(self, a, b):
+        return a*b
+
+    def d(self, c, b, label='d'):
+        return c - b
+
+
+def build(nelements):
+    inp = {'xs': [{'x': i} for i in range(nelements)]}
+    builder = ResourceBuilder(Config(inp), Providers(),
+                              [FuzzyTarget('d', ('xs',), (), ())])
+    t0 = time.perf_counter()
+    builder.resolve_fuzzytargets()
+    return time.perf_counter() - t0, len(builder.graph)
+
+
+def best_of(repeat, nelements):
+    return min(build(nelements) for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--elements', type=int, default=2500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cached, nodes = best_of(args.repeat, args.elements)
+    with mock.patch('reportengine.utils.get_signature', inspect.signature), \
+         mock.patch('reportengine.resourcebuilder.get_signature', inspect.signature), \
+         mock.patch('reportengine.configparser.get_signature', inspect.signature):
+        uncached, _ = best_of(args.repeat, args.elements)
+
+    print(f"Graph with {nodes} nodes")
+    print(f"without signature cache: {uncached:.3f} s")
+    print(f"with signature cache:    {cached:.3f} s")
+    print(f"reduction: {100*(1 - cached/uncached):.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Measure the time to load a generated runcard of about ``--size`` MB, with
+a list of many mappings, using the round trip loader (the default of
+``Config.from_yaml``), the fast safe loader and the cache of parsed
+runcards.
+
+Usage::
+
+    python benchmarks/bench_yaml_loading.py [--size MB]
+"""
+import argparse
+import tempfile
+import time
+
+from reportengine.configparser import Config
+
+
+def make_runcard(size):
+    lines = ["meta:", "  title: Generated runcard", "dataset_inputs:"]
+    nbytes = 0
+    i = 0
+    while nbytes < size*2**20:
+        entry = (f"  - {{dataset: DATASET_{i}, cfac: [QCD, EWK], "
+                 f"frac: 0.75, weight: {i % 10}}}\n"
+                 f"  - dataset: OTHER_{i}\n"
+                 f"    variant: legacy\n"
+                 f"    cuts: {{q2min: 3.49, w2min: 12.5}}")
+        lines.append(entry)
+        nbytes += len(entry) + 1
+        i += 1
+    return '\n'.join(lines) + '\n'
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    res = f()
+    return time.perf_counter() - t0, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=float, default=10)
+    args = parser.parse_args()
+
+    text = make_runcard(args.size)
+    print(f"Runcard: {len(text)/2**20:.1f} MB")
+    trt, rt = timed(lambda: Config.from_yaml(text))
+    tfast, fast = timed(lambda: Config.from_yaml(text, fast=True))
+    assert fast.input_params == rt.input_params
+    with tempfile.TemporaryDirectory() as folder:
+        tfill, _ = timed(lambda: Config.from_yaml(text, fast=True,
+                                                  cache_folder=folder))
+        tcached, cached = timed(lambda: Config.from_yaml(
+            text, fast=True, cache_folder=folder))
+    assert cached.input_params == rt.input_params
+
+    print(f"{'round trip':<20}{trt:>10.2f} s")
+    print(f"{'fast':<20}{tfast:>10.2f} s")
+    print(f"{'fast, filling cache':<20}{tfill:>10.2f} s")
+    print(f"{'fast, cached':<20}{tcached:>10.2f} s")
+
+
+if __name__ == '__main__':
+    main()
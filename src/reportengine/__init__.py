@@ -4,4 +4,4 @@ Reportengine: A framework to organize data pypelines.
 
 __version__ = "0.32"
 
-from . resourcebuilder import collect
+from . resourcebuilder import collect, reduce_collect, batchable
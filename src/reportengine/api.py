@@ -7,6 +7,7 @@ import importlib
 
 from reportengine.resourcebuilder import ResourceBuilder
 from reportengine.resourcebuilder import FuzzyTarget
+from reportengine.registry import ProviderRegistry
 
 log = logging.getLogger(__name__)
 
@@ -26,13 +27,14 @@ class API:
             prov_list.append(mod)
 
         self.provider_loaded = prov_list
+        self.provider_registry = ProviderRegistry(prov_list)
         self.config_class = config_cls
         self.loadedenv = env_cls(**kwargs)
 
     def __call__(self, actions: str, **kwargs):
         fuzzytarg = [FuzzyTarget(actions, (), (), ())]
         c = self.config_class(kwargs, environment=self.loadedenv)
-        builder = ResourceBuilder(c, self.provider_loaded, fuzzytarg, perform_final=False)
+        builder = ResourceBuilder(c, self.provider_registry, fuzzytarg, perform_final=False)
         builder.rootns.update(self.loadedenv.ns_dump())
         builder.resolve_fuzzytargets()
         builder.execute_sequential()
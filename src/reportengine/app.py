@@ -21,7 +21,13 @@ from reportengine.resourcebuilder import ResourceBuilder, ResourceError
 from reportengine.configparser import ConfigError, Config
 from reportengine.environment import Environment, EnvironmentError_
 from reportengine.baseexceptions import ErrorWithAlternatives
-from reportengine.utils import get_providers, import_from_path
+from reportengine.utils import import_from_path
+from reportengine.spill import Spiller
+from reportengine.progress import ProgressHook
+from reportengine.metrics import MetricsHook
+from reportengine.plan import DurationHistory, make_plan, format_plan
+from reportengine.buildprofile import BuildProfiler
+from reportengine.registry import ProviderRegistry
 from reportengine import colors
 from reportengine import helputils
 
@@ -66,9 +72,9 @@ class ArgumentHelpAction(argparse.Action):
 
         else:
             #TODO: This is ugly as hell
-            providermods = self.app.load_providers()
+            registry = ProviderRegistry(self.app.load_providers())
             rb = ResourceBuilder(self.app.config_class({}),
-                                 providermods,
+                                 registry,
                                  [])
             try:
                 providertree = rb.explain_provider(values)
@@ -76,9 +82,7 @@ class ArgumentHelpAction(argparse.Action):
 
                 alternatives = ['config', *self.app.default_provider_names]
 
-                alternatives += [f for mod in providermods
-                                   for f in get_providers(mod).keys()
-                                ]
+                alternatives += registry.provider_names()
 
                 msg = "No help available for %s" % values
                 print(ErrorWithAlternatives(msg, values, alternatives),
@@ -183,12 +187,78 @@ class App:
                           help = "Perform only the runcard checks without executing the actions.",
                           action='store_true')
 
+        parser.add_argument('--plan', action='store_true',
+                            help="like --dry, but also print a summary of the "
+                            "actions that would be executed, with time "
+                            "estimates based on the runs made with "
+                            "--record-durations")
+
+        parser.add_argument('--record-durations', action='store_true',
+                            help="record the duration of the actions, to "
+                            "be used for the estimates of --plan")
+
+        parser.add_argument('--profile-build', action='store_true',
+                            help="print the time spent processing each "
+                            "requirement and running each check while "
+                            "building the graph")
+
+        parser.add_argument('--build-threads', type=int, default=1,
+                            metavar='N',
+                            help="process the actions using N threads, so "
+                            "that the resources they need from the "
+                            "configuration are loaded in parallel")
+
+        parser.add_argument('--fast-yaml', action='store_true',
+                            help="load the configuration file with the "
+                            "fast YAML loader and cache the result. Line "
+                            "numbers are computed only to report errors")
+
+        parser.add_argument('--prefetch-threads', type=int, default=0,
+                            metavar='N',
+                            help="parse the top level keys of the "
+                            "configuration that have prefetchable parse "
+                            "functions in N background threads while the "
+                            "graph is built")
+
+        parser.add_argument('--lazy-config', action='store_true',
+                            help="only parse the keys of the nested "
+                            "mappings in the configuration that are needed "
+                            "by the actions. Errors in the other keys are "
+                            "not reported")
+
         parallel = parser.add_mutually_exclusive_group()
         parallel.add_argument('--parallel', action='store_true',
                               help="execute actions in parallel")
         parallel.add_argument('--no-parallel', dest='parallel',
                               action='store_false')
 
+        parser.add_argument('--progress', action='store_true',
+                            help="display the progress of the execution and "
+                            "an estimate of the remaining time")
+
+        parser.add_argument('--metrics-file', default=None,
+                            help="write metrics about the run to this file, "
+                            "in the Prometheus text format")
+
+        parser.add_argument('--spill-threshold', type=float, default=None,
+                            metavar='MB',
+                            help="when executing sequentially, write "
+                            "intermediate arrays and tables larger than this "
+                            "size to disk and keep memory mapped views instead")
+
+        parser.add_argument('--spill-folder', default=None,
+                            help="folder where --spill-threshold creates "
+                            "the scratch folder of each run. The system "
+                            "temporary folder is used by default.")
+
+        parser.add_argument('--merge-nodes', action='store_true',
+                            help="execute only once the actions that have "
+                            "equal inputs in different namespaces")
+
+        parser.add_argument('--fuse-chains', action='store_true',
+                            help="when executing in parallel, submit linear "
+                            "chains of actions as a single task")
+
         scheduler = parser.add_mutually_exclusive_group()
         scheduler.add_argument('--scheduler',action='store',
                                 help="Pass dask scheduler (e.g. tcp://192.162.1.138:8786) to \
@@ -213,6 +283,10 @@ class App:
         maybe_names = reversed(self.default_providers + extra_providers)
         providers = self.load_providers(maybe_names)
         self.providers = providers
+        self.provider_registry = ProviderRegistry(providers)
+        conflicts = self.provider_registry.format_conflicts()
+        if conflicts:
+            log.debug("Provider names defined more than once:\n%s", conflicts)
 
     def load_providers(self, maybe_names=None):
         if maybe_names is None:
@@ -343,6 +417,11 @@ class App:
         try:
             with open(config_file) as f:
                 try:
+                    if self.args.get('fast_yaml'):
+                        return self.config_class.from_yaml(
+                            f, fast=True,
+                            cache_folder=self.runcard_cache_path(),
+                            environment=self.environment)
                     return self.config_class.from_yaml(f, environment=self.environment)
                 except ConfigError as e:
                     format_rich_error(e)
@@ -360,6 +439,7 @@ class App:
         # dask scheduler when running in --parallel
         scheduler = args['scheduler']
         c = self.get_config()
+        c.lazy_inputs = args['lazy_config']
 
         try:
             self.environment.init_output()
@@ -376,12 +456,24 @@ class App:
             log.error("A key 'actions_' is needed in the top level of the config file.")
             sys.exit(1)
 
-        providers = self.providers
+        if args['prefetch_threads']:
+            c.prefetch_inputs(args['prefetch_threads'])
+
+        providers = self.provider_registry
 
         rb = ResourceBuilder(c, providers, actions, environment=self.environment)
         rb.rootns.update(self.environment.ns_dump())
+        for hook in self.execution_hooks():
+            rb.add_hook(hook)
+        profiler = BuildProfiler() if args['profile_build'] else None
         try:
-            rb.resolve_fuzzytargets()
+            if profiler is not None:
+                with profiler:
+                    rb.resolve_fuzzytargets(merge_nodes=args['merge_nodes'])
+                print(profiler.report())
+            else:
+                rb.resolve_fuzzytargets(threads=args['build_threads'],
+                                        merge_nodes=args['merge_nodes'])
         except ConfigError as e:
             format_rich_error(e)
             sys.exit(1)
@@ -391,6 +483,20 @@ class App:
                 print(e)
                 traceback_if_debug(e)
             sys.exit(1)
+        finally:
+            c.finish_prefetch()
+
+        for name, (hits, misses, _) in c.memoization_stats().items():
+            log.debug(f"Memoized {name}: {hits} hits out of "
+                      f"{hits + misses} calls")
+
+        if self.args['plan']:
+            plan = make_plan(rb.graph, rb.rootns,
+                             durations=DurationHistory.load_means(
+                                 self.duration_history_path()),
+                             figure_formats=len(self.environment.figure_formats))
+            print(format_plan(plan))
+            return
 
         if self.args['dry']:
             log.info("All requirements processed and checked successfully. ")
@@ -401,12 +507,51 @@ class App:
             "Executing actions.")
 
         if parallel:
-            rb.execute_parallel(scheduler)
+            if args['spill_threshold'] is not None:
+                log.warning("--spill-threshold is ignored in parallel mode. "
+                            "The dask workers manage their own memory.")
+            rb.execute_parallel(scheduler, fuse_chains=args['fuse_chains'])
         else:
+            if args['spill_threshold'] is not None:
+                #The spilled results are kept in rb.rootns, so the files
+                #are removed when rb is garbage collected.
+                rb.spiller = Spiller(args['spill_threshold']*2**20,
+                                     args['spill_folder'])
             rb.execute_sequential()
         return rb
 
 
+    def execution_hooks(self):
+        """Return the execution plugins (see :py:mod:`reportengine.hooks`)
+        to be registered with the resource builder. Applications can
+        override this to add their own."""
+        hooks = []
+        if self.args.get('record_durations'):
+            hooks.append(DurationHistory(self.duration_history_path()))
+        if self.args.get('progress'):
+            hooks.append(ProgressHook())
+        if self.args.get('metrics_file'):
+            env = self.environment
+            folders = {'figures': getattr(env, 'figure_folder', None),
+                       'tables': getattr(env, 'table_folder', None)}
+            folders = {k: v for k, v in folders.items() if v is not None}
+            hooks.append(MetricsHook(self.args['metrics_file'],
+                                     labels={'app': self.name},
+                                     output_folders=folders))
+        return hooks
+
+    def duration_history_path(self):
+        """Return the path of the file where the durations of the providers
+        are recorded, used for the estimates of ``--plan``."""
+        cache = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home()/'.cache'
+        return pathlib.Path(cache)/'reportengine'/f'{self.name}-durations.json'
+
+    def runcard_cache_path(self):
+        """Return the folder where the configuration files loaded with
+        ``--fast-yaml`` are cached."""
+        cache = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home()/'.cache'
+        return pathlib.Path(cache)/'reportengine'/f'{self.name}-runcards'
+
     def make_environment(self, args):
         env = self.environment_class(**args)
         return env
@@ -0,0 +1,195 @@
+"""
+buildprofile.py
+
+Measure where the time goes while the targets are processed and the graph
+is built (the phase that ends with "All requirements processed"). The
+instrumented functions of the builder, the configuration parser and the
+namespaces report their calls to the active ``BuildProfiler``, if any,
+grouped by a category (e.g. "requirement" or "check") and a name (e.g. the
+name of the requirement)::
+
+    with BuildProfiler() as profiler:
+        builder.resolve_fuzzytargets()
+    print(profiler.report())
+
+For each entry the profiler records the number of calls, the self time
+(excluding the time spent in other instrumented calls) and the cumulative
+time (including it, and counted only once for recursive calls). When no
+profiler is active, the instrumentation only costs one global lookup per
+call.
+"""
+import functools
+import inspect
+import time
+from collections import defaultdict
+
+__all__ = ('BuildProfiler', 'profiled', 'timing', 'active')
+
+_active = None
+
+
+class _Stats:
+    __slots__ = ('calls', 'self_time', 'cumulative', 'depth')
+
+    def __init__(self):
+        self.calls = 0
+        self.self_time = 0.
+        self.cumulative = 0.
+        #Number of frames with this key currently on the stack
+        self.depth = 0
+
+
+class BuildProfiler:
+    """Aggregate the time spent in the instrumented functions while it is
+    active (within a ``with`` block or between ``start`` and ``stop``)."""
+
+    def __init__(self):
+        self.stats = defaultdict(_Stats)
+        self._stack = []
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("A build profiler is already active")
+        _active = self
+
+    def stop(self):
+        global _active
+        _active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def enter(self, key, first=True):
+        """Start timing ``key``, a ``(category, name)`` tuple. ``first``
+        is false when resuming a generator, which is not counted as a new
+        call."""
+        stats = self.stats[key]
+        if first:
+            stats.calls += 1
+        stats.depth += 1
+        self._stack.append([key, time.perf_counter(), 0.])
+
+    def exit(self):
+        """Stop timing the innermost key."""
+        key, t0, children = self._stack.pop()
+        elapsed = time.perf_counter() - t0
+        stats = self.stats[key]
+        stats.depth -= 1
+        stats.self_time += elapsed - children
+        if not stats.depth:
+            stats.cumulative += elapsed
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def totals(self):
+        """Return a mapping from category to ``(calls, self_time)``."""
+        res = defaultdict(lambda: [0, 0.])
+        for (category, _), stats in self.stats.items():
+            res[category][0] += stats.calls
+            res[category][1] += stats.self_time
+        return {k: tuple(v) for k, v in res.items()}
+
+    def report(self, limit=30):
+        """Return a text report with the totals per category followed by
+        the ``limit`` entries with the largest self time."""
+        lines = ["Build profile (seconds)", "",
+                 f"{'category':<14}{'calls':>10}{'self':>12}"]
+        for category, (calls, self_time) in sorted(self.totals().items(),
+                                                   key=lambda x: -x[1][1]):
+            lines.append(f"{category:<14}{calls:>10}{self_time:>12.3f}")
+
+        lines += ["", f"{'category':<14}{'calls':>10}{'self':>12}"
+                      f"{'cumulative':>12}  name"]
+        entries = sorted(self.stats.items(), key=lambda x: -x[1].self_time)
+        for (category, name), stats in entries[:limit]:
+            lines.append(f"{category:<14}{stats.calls:>10}"
+                         f"{stats.self_time:>12.3f}{stats.cumulative:>12.3f}"
+                         f"  {name}")
+        if len(entries) > limit:
+            lines.append(f"... and {len(entries) - limit} more entries")
+        return '\n'.join(lines)
+
+
+class timing:
+    """Context manager timing the block under ``(category, name)`` if a
+    profiler is active."""
+    __slots__ = ('key', 'profiler')
+
+    def __init__(self, category, name):
+        self.key = (category, name)
+
+    def __enter__(self):
+        self.profiler = _active
+        if self.profiler is not None:
+            self.profiler.enter(self.key)
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.exit()
+
+
+def active():
+    """Return the active ``BuildProfiler``, or None."""
+    return _active
+
+
+def _profile_generator(profiler, key, gen):
+    """Drive ``gen`` timing each step separately, so that the time the
+    generator is suspended is not counted. Exceptions thrown into the
+    wrapper are passed on to ``gen``."""
+    first = True
+    value = None
+    error = None
+    while True:
+        profiler.enter(key, first)
+        first = False
+        try:
+            if error is not None:
+                value = gen.throw(error)
+            else:
+                value = gen.send(value)
+        except StopIteration as e:
+            return e.value
+        finally:
+            profiler.exit()
+        error = None
+        try:
+            value = yield value
+        except GeneratorExit:
+            gen.close()
+            raise
+        except BaseException as e:
+            error = e
+
+
+def profiled(category, name=None):
+    """Decorator instrumenting a function (or a generator function) under
+    ``category``. ``name`` is a function called with the same arguments as
+    the decorated function, which returns the name of the entry. By
+    default all the calls go to the same entry, named after the
+    function."""
+    def decorator(f):
+        isgen = inspect.isgeneratorfunction(f)
+        default_name = f.__qualname__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return f(*args, **kwargs)
+            key = (category, default_name if name is None else
+                   name(*args, **kwargs))
+            if isgen:
+                return _profile_generator(profiler, key, f(*args, **kwargs))
+            profiler.enter(key)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                profiler.exit()
+        return wrapper
+    return decorator
@@ -125,8 +125,9 @@ def make_argcheck(check_func):
     will be used to update the the inputs for the provider. If the
     decorated function doesn't return (retuns ``None``), it will have
     no effect if the checks are succesful."""
+    #Wrap the check itself too, so that it is reported under the name of
+    #check_func by e.g. the build profiler.
     @functools.wraps(check_func)
-    @make_check
     def check(ns, *args, **kwargs):
         res = saturate(check_func, ns)
         if res is not None:
@@ -136,7 +137,7 @@ def make_argcheck(check_func):
                                 f"{type(res)}.")
             ns.update(res)
 
-    return check
+    return make_check(check)
 
 def check(cond, *args, **kwargs):
     """Like ``assert`` but not dependent on the interpreter flags, and
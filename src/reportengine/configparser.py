@@ -11,13 +11,18 @@ import collections
 from collections.abc import Mapping
 import contextlib
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
 
 from ruamel.yaml import YAMLError
 
-from reportengine import namespaces
-from reportengine.utils import ChainMap, get_classmembers, yaml_rt
+from reportengine import namespaces, metrics
+from reportengine.utils import (ChainMap, NSFrame, get_classmembers,
+                                yaml_rt, get_signature, load_yaml_cached,
+                                find_path)
 from reportengine import templateparser
+from reportengine.buildprofile import profiled
 from reportengine.baseexceptions import ErrorWithAlternatives, AsInputError
 
 log = logging.getLogger(__name__)
@@ -26,6 +31,9 @@ _config_token = 'parse_'
 _produce_token = 'produce_'
 _defaults_token = 'load_default_'
 
+#Returned by Config._compute when another thread computed the value.
+_RETRY = object()
+
 def trim_token(s):
     return s.split('_', 1)[1]
 
@@ -111,7 +119,7 @@ def _parse_func(f):
     """Check that the function has at least one argument, and check that the
     argument corresponds the type declared in the annotation if any."""
 
-    sig = inspect.signature(f)
+    sig = get_signature(f)
 
     try:
         first_param = list(sig.parameters.values())[1]
@@ -134,6 +142,86 @@ def _parse_func(f):
 
     return f_
 
+def _memo_key(value, ignore_key_order=False):
+    """Return a hashable key for ``value`` that compares equal for equal
+    values of the same type, looking inside mappings, lists and tuples.
+    The items of mappings are in insertion order or, with
+    ``ignore_key_order``, sorted by key where possible. Raise
+    ``TypeError`` if some part of ``value`` is unhashable."""
+    if isinstance(value, Mapping):
+        items = value.items()
+        if ignore_key_order:
+            try:
+                items = sorted(items, key=lambda item: item[0])
+            except TypeError:
+                pass
+        return (type(value), tuple((k, _memo_key(v, ignore_key_order))
+                                   for k, v in items))
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_memo_key(v, ignore_key_order)
+                                   for v in value))
+    hash(value)
+    return (type(value), value)
+
+def memoized(f=None, *, ignore_key_order=False):
+    """Decorator for parse and produce functions whose result depends only
+    on their arguments, that is, the input value (for parse functions) and
+    the resolved parameters. The result is computed once for equal
+    arguments and the same object is shared by every namespace where the
+    key is resolved, e.g.
+
+        @memoized
+        def produce_dataset(self, dataset_input, pdf):
+            return load_dataset(dataset_input, pdf)
+
+    The function must not depend on the namespace in which it is called,
+    and the shared result should not be modified. Arguments that cannot be
+    hashed are not memoized. The number of hits and misses is available
+    from ``Config.memoization_stats`` and is recorded as the
+    ``memoized_calls_total`` counter in ``reportengine.metrics``.
+
+    The order of the keys of mappings in the arguments is part of them,
+    since it is kept from the input. If the result doesn't depend on it,
+    ``@memoized(ignore_key_order=True)`` shares the result between
+    mappings that only differ in the order of their keys."""
+    if f is None:
+        return functools.partial(memoized, ignore_key_order=ignore_key_order)
+    name = f.__name__
+
+    @functools.wraps(f)
+    def f_(self, *args, **kwargs):
+        try:
+            key = (name, _memo_key(args, ignore_key_order),
+                   _memo_key(kwargs, ignore_key_order))
+        except TypeError:
+            self._record_memo(name, 'uncacheable')
+            return f(self, *args, **kwargs)
+        try:
+            res = self._memo[key]
+        except KeyError:
+            pass
+        else:
+            self._record_memo(name, 'hit')
+            return res
+        res = self._memo[key] = f(self, *args, **kwargs)
+        self._record_memo(name, 'miss')
+        return res
+    return f_
+
+def prefetchable(f):
+    """Decorator for parse functions that can be called by
+    ``Config.prefetch_inputs`` in a background thread, before the key is
+    resolved. The function must take no parameters other than the input
+    value and must not depend on the state of the resolution (such as
+    ``self._curr_ns``), e.g.
+
+        @prefetchable
+        def parse_fit(self, fit):
+            return load_fit(fit)
+    """
+    f._prefetchable = True
+    return f
+
 def record_from_defaults(f):
     """Decorator for recording default values. Given a key, for example
     `filter_defaults` there might exist several specifications or specs of
@@ -233,10 +321,139 @@ class AutoTypeCheck(type):
 class ConfigMetaClass(ElementOfResolver, AutoTypeCheck):
     pass
 
+class _ResolutionState(threading.local):
+    """The state of the key being resolved (see ``Config.set_context``),
+    which is kept for each thread."""
+    key = None
+    ns = None
+    input = None
+    parents = None
+    spec = None
+    tainted = False
+
+
+def _state_property(name):
+    return property(lambda self: getattr(self._state, name),
+                    lambda self, value: setattr(self._state, name, value))
+
+
+class _LazyInput(NSFrame):
+    """The parsed version of a mapping in the input (see
+    ``Config.lazy_inputs``), where each key is parsed the first time it is
+    looked up. Keys not parsed yet are reported as present, so that the
+    namespace lookups find them at this level. Iterating, comparing or
+    pickling parses all the remaining keys."""
+    __slots__ = ('_config', '_raw', '_inputs', '_ns', '_parents',
+                 '_resolving')
+
+    def __init__(self, config, raw, ns, inputs, parents):
+        super().__init__()
+        self._config = config
+        self._raw = raw
+        self._inputs = inputs
+        self._ns = ns.new_child(self)
+        self._parents = parents
+        #(thread id, key) of the keys being parsed, which must not be
+        #found here meanwhile.
+        self._resolving = set()
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (key in self._raw and
+            (threading.get_ident(), key) not in self._resolving)
+
+    def __missing__(self, key):
+        token = (threading.get_ident(), key)
+        if key not in self._raw or token in self._resolving:
+            raise KeyError(key)
+        with self._config._locked():
+            if not dict.__contains__(self, key):
+                self._resolving.add(token)
+                try:
+                    self._config.resolve_key(key, self._ns, self._inputs,
+                                             parents=self._parents,
+                                             max_index=0)
+                finally:
+                    self._resolving.discard(token)
+            return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def resolve_all(self):
+        """Parse all the keys that are not parsed yet. While a key is being
+        parsed by this thread, only the keys parsed so far are visible
+        instead."""
+        ident = threading.get_ident()
+        if any(token[0] == ident for token in self._resolving):
+            return self
+        for key in self._raw:
+            if not dict.__contains__(self, key):
+                self[key]
+        return self
+
+    def __iter__(self):
+        return dict.__iter__(self.resolve_all())
+
+    def __len__(self):
+        return dict.__len__(self.resolve_all())
+
+    def keys(self):
+        return dict.keys(self.resolve_all())
+
+    def values(self):
+        return dict.values(self.resolve_all())
+
+    def items(self):
+        return dict.items(self.resolve_all())
+
+    def __eq__(self, other):
+        return dict.__eq__(self.resolve_all(), other)
+
+    def __ne__(self, other):
+        return dict.__ne__(self.resolve_all(), other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return dict.__repr__(self.resolve_all())
+
+    def copy(self):
+        return NSFrame(self.items())
+
+    def __reduce__(self):
+        return (NSFrame, (dict(self.items()),))
+
+
 class Config(metaclass=ConfigMetaClass):
 
     _traps = ('from_', 'namespaces_')
 
+    #Set by the ResourceBuilder to a ``utils.BuildLock`` while targets are
+    #resolved by several threads.
+    build_lock = None
+
+    #The text of the YAML document loaded by ``from_yaml`` with ``fast``,
+    #used to find the line numbers for the errors, and its round trip
+    #version, loaded when first needed.
+    _yaml_source = None
+    _source_doc = None
+
+    #If true, the keys of the mappings nested in the input (and in lists of
+    #mappings) are only parsed when they are first looked up, rather than
+    #all at once when the enclosing key is resolved, so that the keys that
+    #no action needs are never parsed (nor checked).
+    lazy_inputs = False
+
+    _curr_key = _state_property('key')
+    _curr_ns = _state_property('ns')
+    _curr_input = _state_property('input')
+    _curr_parents = _state_property('parents')
+    _curr_spec = _state_property('spec')
+    _tainted = _state_property('tainted')
+
     def __init__(self, input_params, environment=None):
         if not isinstance(input_params, Mapping):
             raise ConfigError("Failed to process the configuration. Expected "
@@ -248,11 +465,17 @@ class Config(metaclass=ConfigMetaClass):
         # copy here to avoid input being updated with lockfile entries
         self.lockfile = copy(input_params)
 
-        self._curr_key = None
-        self._curr_ns = None
-        self._curr_input = None
-        self._curr_parents = None
-        self._curr_spec = None
+        self._state = _ResolutionState()
+        #Maps (id(mapping), key) to (thread, event) for the keys being
+        #computed while resolving targets in several threads.
+        self._pending = {}
+        #Results of the functions decorated with ``memoized``.
+        self._memo = {}
+        self._memo_stats = collections.Counter()
+        #Maps top level keys to (input value, future) (see
+        #``prefetch_inputs``).
+        self._prefetched = {}
+        self._prefetch_executor = None
 
         #self.params = self.process_params(input_params)
 
@@ -325,7 +548,7 @@ class Config(metaclass=ConfigMetaClass):
                 return None
         result = [func]
 
-        sig = inspect.signature(func)
+        sig = get_signature(func)
         for pname, param in list(sig.parameters.items())[start_from:]:
             if self.get_parse_func(pname):
                 result.append(('config', pname, self.explain_param(pname)))
@@ -350,7 +573,7 @@ class Config(metaclass=ConfigMetaClass):
 
     def resolve_signature_params(self, f, *, start_from, ns, input_params,
                                  max_index, parents):
-        sig = inspect.signature(f)
+        sig = get_signature(f)
         kwargs = {}
         put_index = max_index
         for pname, param in list(sig.parameters.items())[start_from:]:
@@ -410,6 +633,7 @@ class Config(metaclass=ConfigMetaClass):
 
 
 
+    @profiled('resolve_key', lambda self, key, *args, **kwargs: key)
     def resolve_key(self, key, ns, input_params=None, parents=None,
                     max_index=None, write=True, currspec=None):
         """Get one key from the input params and put it in the namespace.
@@ -425,10 +649,139 @@ class Config(metaclass=ConfigMetaClass):
             parents = []
         if input_params is None:
             input_params = self.input_params
-        with self.set_context(key, ns, input_params, parents, currspec):
+        with self._locked(), self.set_context(key, ns, input_params, parents,
+                                              currspec):
             return self._resolve_key(key=key, ns=ns, input_params=input_params,
                 parents=parents, max_index=max_index, write=write)
 
+    def _locked(self):
+        lock = self.build_lock
+        return lock if lock is not None else contextlib.nullcontext()
+
+    def _compute(self, target, key, f, *args, **kwargs):
+        """Call the parse or produce function ``f`` for ``key``, which is
+        to be written in the mapping ``target``. While resolving targets in
+        several threads, the build lock is released during the call, and
+        if another thread is already computing the same key for the same
+        mapping, wait for it and return ``_RETRY``."""
+        lock = self.build_lock
+        if lock is None:
+            return f(*args, **kwargs)
+        token = (id(target), key)
+        pending = self._pending.get(token)
+        if pending is not None:
+            owner, event = pending
+            if owner is threading.current_thread():
+                return f(*args, **kwargs)
+            with lock.released():
+                event.wait()
+            return _RETRY
+        event = threading.Event()
+        self._pending[token] = (threading.current_thread(), event)
+        try:
+            with lock.released():
+                return f(*args, **kwargs)
+        finally:
+            del self._pending[token]
+            event.set()
+
+    def prefetch_inputs(self, threads, keys=None):
+        """Start parsing the top level keys of the input (or only ``keys``)
+        in a pool of ``threads`` threads, so that independent parse
+        functions that take a long time (e.g. because they load files) run
+        concurrently while the graph is built. Only the parse functions
+        decorated with ``prefetchable`` are called. Values handled by traps
+        (``from_``, ``namespaces_``) and keys ending with an underscore are
+        skipped.
+
+        The result is used the first time the key is resolved. Errors are
+        raised at that point, in the same way as if the function was
+        called then. ``finish_prefetch`` must be called once the keys are
+        resolved. Return the keys that are being prefetched."""
+        if keys is None:
+            keys = [k for k in self.input_params if not k.endswith('_')]
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(
+                threads, thread_name_prefix='prefetch')
+        submitted = []
+        for key in keys:
+            f = self.get_parse_func(key)
+            if f is None or not getattr(f, '_prefetchable', False):
+                continue
+            if len(get_signature(f).parameters) != 1:
+                raise TypeError(f"The prefetchable function {f.__name__} "
+                                "must take only the input value.")
+            val = self.input_params[key]
+            if self.get_trap_func(val):
+                continue
+            future = self._prefetch_executor.submit(f, val)
+            self._prefetched[key] = (val, future)
+            submitted.append(key)
+        log.debug(f"Prefetching {len(submitted)} keys using {threads} "
+                  "threads.")
+        return submitted
+
+    def finish_prefetch(self):
+        """Wait for the calls started by ``prefetch_inputs`` and shut down
+        its threads. Log the errors of the keys that were prefetched but
+        never resolved, which are discarded."""
+        executor = self._prefetch_executor
+        if executor is None:
+            return
+        executor.shutdown(wait=True)
+        self._prefetch_executor = None
+        unused, self._prefetched = self._prefetched, {}
+        for key, (_, future) in unused.items():
+            exc = future.exception()
+            if exc is not None:
+                log.warning(f"Prefetching the unused key '{key}' failed: "
+                            f"{exc}")
+            else:
+                log.debug(f"The prefetched key '{key}' was not used.")
+
+    def _take_prefetched(self, key, f, input_val):
+        """Return the function to call in order to parse ``input_val``:
+        either ``f`` or one waiting for the prefetched result, if it was
+        computed from the same value. Nested keys with the same name as a
+        prefetched top level key leave it in place."""
+        prefetched = self._prefetched.get(key)
+        if prefetched is not None and prefetched[0] is input_val:
+            del self._prefetched[key]
+            future = prefetched[1]
+            return lambda val: future.result()
+        return f
+
+    def _record_memo(self, name, outcome):
+        with self._locked():
+            self._memo_stats[name, outcome] += 1
+            metrics.increment('memoized_calls_total', function=name,
+                              result=outcome,
+                              help="Calls to memoized configuration "
+                              "functions.")
+
+    def memoization_stats(self):
+        """Return a mapping from the name of each function decorated with
+        ``memoized`` that has been called to a ``(hits, misses,
+        uncacheable)`` tuple."""
+        names = sorted({name for name, _ in self._memo_stats})
+        return {name: tuple(self._memo_stats[name, outcome] for outcome in
+                            ('hit', 'miss', 'uncacheable'))
+                for name in names}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_state'], state['_pending'], state['_memo']
+        del state['_prefetched'], state['_prefetch_executor']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._state = _ResolutionState()
+        self._pending = {}
+        self._memo = {}
+        self._prefetched = {}
+        self._prefetch_executor = None
+
 
     def _value_and_line_info(self, key, input_params):
         if isinstance(input_params, ChainMap):
@@ -488,7 +841,11 @@ class Config(metaclass=ConfigMetaClass):
                     return nsindex, nsval
 
                 self._tainted = False
-                val = produce_func(**kwargs)
+                val = self._compute(ns.maps[put_index], key, produce_func,
+                                    **kwargs)
+                if val is _RETRY:
+                    return self._resolve_key(key, ns, input_params, parents,
+                                             max_index, write)
                 if self._tainted:
                     put_index = 0
                 if write:
@@ -528,14 +885,22 @@ class Config(metaclass=ConfigMetaClass):
             if nsindex is not None and nsindex <= put_index:
                 return nsindex, nsval
             try:
-                val = f(input_val, **kwargs)
+                if self._prefetched:
+                    f = self._take_prefetched(key, f, input_val)
+                val = self._compute(ns.maps[put_index], key, f, input_val,
+                                    **kwargs)
             except ConfigError as e:
+                if lineinfo is None:
+                    lineinfo = self._source_line_info(key, input_params)
                 if lineinfo:
                     log.error(f"Failed processing key '{key}' at line "
                               f"{lineinfo[0]+1}, position {lineinfo[1]+1}.")
                 else:
                     log.error(f"Failed processing key {key}.")
                 raise e
+            if val is _RETRY:
+                return self._resolve_key(key, ns, input_params, parents,
+                                         max_index, write)
         elif nsindex is not None:
             return nsindex, nsval
         elif produce_func:
@@ -548,29 +913,15 @@ class Config(metaclass=ConfigMetaClass):
             #Recursively parse dicts
             if isinstance(input_val, dict):
                 put_index = 0
-                val = {}
-                res_ns = ns.new_child(val)
-                inputs = ChainMap(input_val, input_params)
-                for k in input_val.keys():
-                    self.resolve_key(k, res_ns, inputs,
-                                     parents=[*parents, key],
-                                     max_index = 0
-                                    )
+                val = self._parse_mapping(input_val, ns, input_params,
+                                          [*parents, key])
             #Recursively parse lists of dicts
             elif (isinstance(input_val, list) and
                  all(isinstance(x, dict) for x in input_val)):
                 put_index = 0
-                val = []
-                for linp in input_val:
-                    lval = {}
-                    res_ns = ns.new_child(lval)
-                    inputs = ChainMap(linp, input_params)
-                    for k in linp.keys():
-                        self.resolve_key(k, res_ns, inputs,
-                                         parents=[*parents, key],
-                                         max_index = 0
-                                        )
-                    val.append(lval)
+                val = [self._parse_mapping(linp, ns, input_params,
+                                           [*parents, key])
+                       for linp in input_val]
 
 
             else:
@@ -581,6 +932,21 @@ class Config(metaclass=ConfigMetaClass):
 
         return put_index, val
 
+    def _parse_mapping(self, input_val, ns, input_params, parents):
+        """Parse a mapping nested in the input, in a new level on top of
+        ``ns``. With ``lazy_inputs``, the keys are parsed when they are
+        looked up."""
+        inputs = ChainMap(input_val, input_params)
+        if self.lazy_inputs:
+            return _LazyInput(self, input_val, ns, inputs, parents)
+        val = NSFrame()
+        res_ns = ns.new_child(val)
+        for k in input_val.keys():
+            self.resolve_key(k, res_ns, inputs, parents=parents,
+                             max_index = 0
+                            )
+        return val
+
     def _write_val(self, ns, key ,val, put_index):
         #TODO: Need to fix this better
         if isinstance(val, ExplicitNode):
@@ -588,21 +954,38 @@ class Config(metaclass=ConfigMetaClass):
         else:
             ns.maps[put_index][key] = val
 
+    @profiled('fuzzyspec', lambda self, fuzzy, *args, **kwargs: str(fuzzy))
     def process_fuzzyspec(self, fuzzy, ns, parents=None, initial_spec=None):
+        with self._locked():
+            return self._process_fuzzyspec(fuzzy, ns, parents, initial_spec)
+
+    def _process_fuzzyspec(self, fuzzy, ns, parents=None, initial_spec=None):
         if parents is None:
             parents = []
-        gen = namespaces.expand_fuzzyspec_partial(ns, fuzzy, currspec=initial_spec)
+        def resolve_key(key, currns, currspec):
+            self.resolve_key(key, currns, parents=[*parents, currspec],
+                             currspec=currspec)
+        #The keys are still resolved, but the specs are reused if the
+        #values they were expanded from haven't changed.
+        specs = namespaces.get_cached_expansion(ns, fuzzy, initial_spec,
+                                                resolve_key)
+        if specs is not None:
+            return specs
+        checks = []
+        gen = namespaces.expand_fuzzyspec_partial(ns, fuzzy,
+            currspec=initial_spec, checks=checks)
         while True:
             try:
                 key, currspec, currns = next(gen)
             except StopIteration as e:
+                namespaces.cache_expansion(ns, fuzzy, initial_spec, e.value,
+                                           checks)
                 return e.value
             except TypeError as e:
                 raise ConfigError("Error when processing namespace "
                 "specification %s: %s" % (fuzzy, e))
             else:
-                self.resolve_key(key, currns, parents=[*parents, currspec],
-                                 currspec=currspec)
+                resolve_key(key, currns, currspec)
 
     def process_all_params(self, input_params=None, *,ns=None):
         """Simple shortcut to process all paams in a simple namespace, if
@@ -798,11 +1181,50 @@ class Config(metaclass=ConfigMetaClass):
         return item in self.input_params
 
     @classmethod
-    def from_yaml(cls, o, *args, **kwargs):
+    def from_yaml(cls, o, *args, fast=False, cache_folder=None, **kwargs):
+        """Create the configuration from the YAML document ``o``, a string
+        or a file. With ``fast``, the document is loaded with the C safe
+        loader rather than the (much slower) round trip loader, and the
+        line numbers shown in the errors are only computed, from the text,
+        when an error is reported. The result of the fast loader is cached
+        in ``cache_folder``, if given (see ``utils.load_yaml_cached``)."""
+        if not fast:
+            try:
+                return cls(yaml_rt.load(o), *args, **kwargs)
+            except YAMLError as e:
+                raise ConfigError(f"Failed to parse yaml file: {e}")
+        text = o if isinstance(o, str) else o.read()
         try:
-            return cls(yaml_rt.load(o), *args, **kwargs)
+            input_params = load_yaml_cached(text, cache_folder)
         except YAMLError as e:
             raise ConfigError(f"Failed to parse yaml file: {e}")
+        res = cls(input_params, *args, **kwargs)
+        res._yaml_source = text
+        return res
+
+    def _source_line_info(self, key, input_params):
+        """Return the line information of ``key`` in the mapping of
+        ``input_params`` where it is defined, by loading the source of a
+        configuration created by ``from_yaml`` with ``fast`` using the
+        round trip loader. Return None if it cannot be found."""
+        if self._yaml_source is None:
+            return None
+        if isinstance(input_params, ChainMap):
+            inp = input_params.maps[input_params.get_where(key)[0]]
+        else:
+            inp = input_params
+        path = find_path(self.input_params, inp)
+        if path is None:
+            return None
+        if self._source_doc is None:
+            self._source_doc = yaml_rt.load(self._yaml_source)
+        node = self._source_doc
+        try:
+            for k in path:
+                node = node[k]
+            return node.lc.item(key)
+        except (KeyError, IndexError, AttributeError):
+            return None
 
     def dump_lockfile(self):
         with open(self.environment.input_folder/"lockfile.yaml", "w+") as f:
@@ -264,6 +264,50 @@ class DAG:
                    blocked.pop(output)
                    can_run.append(output)
 
+    def linear_chains(self, can_link=None):
+        """
+        Partition the graph into maximal linear chains, where every node
+        but the last has exactly one output and every node but the first
+        has exactly one input (the previous element of the chain).
+
+        Parameters
+        ----------
+        can_link : Callable[[Node, Node], bool], optional
+            Predicate called with ``(parent, child)`` deciding whether an
+            edge that satisfies the conditions above may be part of a chain.
+            By default all such edges are accepted.
+
+        Returns
+        -------
+        chains : list[list[Node]]
+            Every node of the graph appears in exactly one chain. Nodes
+            that cannot be linked form chains of length one. The chains are
+            given in an order such that executing them sequentially
+            resolves all the dependencies.
+        """
+        def next_link(node):
+            if len(node.outputs) != 1:
+                return None
+            (child,) = node.outputs
+            if len(child.inputs) != 1:
+                return None
+            if can_link is not None and not can_link(node, child):
+                return None
+            return child
+
+        chains = []
+        seen = set()
+        for node in self.topological_iter():
+            if node in seen:
+                continue
+            chain = []
+            while node is not None:
+                chain.append(node)
+                seen.add(node)
+                node = next_link(node)
+            chains.append(chain)
+        return chains
+
     def deepfirst_iter(self, heads=None, visited=None):
         if heads is None:
             heads = self._head_nodes
@@ -142,4 +142,8 @@ def figuregen(func):
     def wrapper(*args, **kwargs):
         return list(func(*args, **kwargs))
 
+    # When executing in-process, reportengine streams the items of the
+    # generator to the final action instead. See reportengine.streaming.
+    wrapper.generator = func
+
     return wrapper
@@ -26,13 +26,13 @@ def get_nice_name(ns, nsspec, suffix=None):
     tuple with a valid specification
     (see the ``namespaces`` documentation for more details)"""
     parts = []
-    currspec = []
+    currspec = namespaces.as_nsspec(())
     prefix = ns.get("filename_prefix", None)
     if prefix:
         parts.append(prefix)
     currns = ns
     for ele in nsspec:
-        currspec.append(ele)
+        currspec = currspec.child(ele)
         val = namespaces.value_from_spcec_ele(currns, ele)
 
 
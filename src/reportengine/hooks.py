@@ -0,0 +1,76 @@
+"""
+hooks.py
+
+Plugin interface to observe the execution of the graph. Subclass
+``ExecutionHook``, overriding the methods for the events of interest, and
+register an instance with ``ResourceExecutor.add_hook`` (or return it from
+``App.execution_hooks``)::
+
+    class SlowNodes(ExecutionHook):
+        def on_node_end(self, spec, duration, size):
+            if duration > 60:
+                print(f"{spec} took {duration:.0f} seconds")
+
+The hooks are called for both the sequential and the parallel executors.
+In the parallel executor, the nodes are computed by the dask workers. Then
+``on_node_start`` is called when a node is submitted, and the duration
+passed to ``on_node_end`` is measured from the moment all the inputs of the
+node were available, so it can include some waiting in the dask queue.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+__all__ = ('ExecutionHook', 'result_size', 'provider_name')
+
+
+class ExecutionHook:
+    """Base class for execution plugins. All methods do nothing by
+    default."""
+
+    def on_build_start(self):
+        """Called before processing the targets."""
+        pass
+
+    def on_graph_built(self, graph):
+        """Called with the ``DAG`` once all the targets are processed."""
+        pass
+
+    def on_node_start(self, spec):
+        """Called before computing the node corresponding to ``spec``."""
+        pass
+
+    def on_node_end(self, spec, duration, size):
+        """Called after a node is computed successfully. ``duration`` is in
+        seconds and ``size`` is the approximate size of the result in bytes
+        (see ``result_size``), or None if not known."""
+        pass
+
+    def on_node_error(self, spec, error):
+        """Called when computing a node raises the exception ``error``."""
+        pass
+
+    def on_run_end(self):
+        """Called when the execution finishes, successfully or not."""
+        pass
+
+
+def provider_name(spec):
+    """Return the name of the function called by the node ``spec``, used to
+    group the nodes by provider."""
+    f = spec.function
+    return getattr(f, '__name__', type(f).__name__)
+
+
+def result_size(obj):
+    """Return an approximation of the memory used by ``obj``, in bytes. Only
+    the contents of NumPy arrays and pandas objects are taken into account.
+    For any other object, only the shallow size is returned."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True))
+    return sys.getsizeof(obj)
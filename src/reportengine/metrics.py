@@ -0,0 +1,215 @@
+"""
+metrics.py
+
+Export metrics about a run in the Prometheus text format, so that they
+can be picked up by e.g. the textfile collector of a node exporter and
+tracked over time.
+
+``MetricsHook`` is an execution plugin that writes the metrics file
+periodically during the run and once more at the end. Besides the metrics
+it computes itself (graph size, build time, calls and durations per
+provider, peak memory and size of the output files), it includes any
+counter recorded with ``increment`` by other parts of the code (e.g. the
+time spent running pandoc, or cache hits). Note that counters incremented
+by code running in dask workers are recorded in the worker processes and
+are not visible here.
+"""
+import logging
+import os
+import pathlib
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from reportengine.hooks import ExecutionHook, provider_name
+
+log = logging.getLogger(__name__)
+
+__all__ = ('MetricsHook', 'increment', 'get_counters', 'reset_counters')
+
+PREFIX = 'reportengine_'
+
+_counters = defaultdict(float)
+_counter_help = {}
+
+
+def increment(name, value=1, *, help=None, **labels):
+    """Add ``value`` to the counter ``name`` with the given ``labels``."""
+    _counters[name, tuple(sorted(labels.items()))] += value
+    if help is not None:
+        _counter_help[name] = help
+
+
+def get_counters():
+    """Return a dictionary mapping ``(name, labels)`` to the value of each
+    counter, where ``labels`` is a sorted tuple of ``(key, value)``
+    pairs."""
+    return dict(_counters)
+
+
+def reset_counters():
+    """Remove all the counters recorded with ``increment``."""
+    _counters.clear()
+    _counter_help.clear()
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return '{' + inner + '}'
+
+
+def peak_rss():
+    """Return the peak resident memory of the process, in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kilobytes and macOS bytes.
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def _folder_size(folder):
+    folder = pathlib.Path(folder)
+    if not folder.is_dir():
+        return 0, 0
+    sizes = [p.stat().st_size for p in folder.rglob('*') if p.is_file()]
+    return len(sizes), sum(sizes)
+
+
+class MetricsHook(ExecutionHook):
+    """Execution plugin writing a metrics file at ``path``. The file is
+    rewritten atomically at most every ``interval`` seconds while the
+    graph executes, and once more at the end of the run.
+
+    ``labels`` is a mapping of labels added to every metric (e.g. the name
+    of the application). ``output_folders`` maps a kind (e.g. "figures") to
+    a folder whose number of files and total size are reported.
+    """
+
+    def __init__(self, path, *, labels=None, output_folders=None,
+                 interval=15):
+        self.path = pathlib.Path(path)
+        self.labels = tuple(sorted((labels or {}).items()))
+        self.output_folders = output_folders or {}
+        self.interval = interval
+
+        self.graph_nodes = None
+        self.build_seconds = None
+        self._build_start = None
+        self._run_start = None
+        self._last_write = None
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.durations = defaultdict(float)
+        self.finished = False
+
+    def on_build_start(self):
+        self._build_start = time.monotonic()
+
+    def on_graph_built(self, graph):
+        self.graph_nodes = len(graph)
+        if self._build_start is not None:
+            self.build_seconds = time.monotonic() - self._build_start
+        self.write()
+
+    def on_node_start(self, spec):
+        if self._run_start is None:
+            self._run_start = time.monotonic()
+
+    def on_node_end(self, spec, duration, size):
+        name = provider_name(spec)
+        self.calls[name] += 1
+        self.durations[name] += duration
+        self._maybe_write()
+
+    def on_node_error(self, spec, error):
+        self.errors[provider_name(spec)] += 1
+        self._maybe_write()
+
+    def on_run_end(self):
+        self.finished = True
+        self.write()
+
+    def _maybe_write(self):
+        if (self._last_write is None or
+                time.monotonic() - self._last_write >= self.interval):
+            self.write()
+
+    def _metric(self, lines, name, tp, help, samples):
+        """Append the lines for a metric. ``samples`` is an iterable of
+        ``(labels, value)``."""
+        lines.append(f'# HELP {PREFIX}{name} {help}')
+        lines.append(f'# TYPE {PREFIX}{name} {tp}')
+        for labels, value in samples:
+            alllabels = _format_labels((*self.labels, *labels))
+            lines.append(f'{PREFIX}{name}{alllabels} {value}')
+
+    def render(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        if self.graph_nodes is not None:
+            self._metric(lines, 'graph_nodes', 'gauge',
+                         "Number of nodes in the execution graph.",
+                         [((), self.graph_nodes)])
+        if self.build_seconds is not None:
+            self._metric(lines, 'build_seconds', 'gauge',
+                         "Time taken to process the targets and build the graph.",
+                         [((), self.build_seconds)])
+        if self._run_start is not None:
+            self._metric(lines, 'execution_seconds', 'gauge',
+                         "Time since the execution of the graph started.",
+                         [((), time.monotonic() - self._run_start)])
+        self._metric(lines, 'provider_calls_total', 'counter',
+                     "Number of nodes computed for each provider.",
+                     [((('provider', k),), v) for k, v in sorted(self.calls.items())])
+        self._metric(lines, 'provider_seconds_total', 'counter',
+                     "Cumulative duration of the nodes of each provider.",
+                     [((('provider', k),), v) for k, v in sorted(self.durations.items())])
+        self._metric(lines, 'provider_errors_total', 'counter',
+                     "Number of nodes that failed for each provider.",
+                     [((('provider', k),), v) for k, v in sorted(self.errors.items())])
+        self._metric(lines, 'peak_rss_bytes', 'gauge',
+                     "Peak resident memory of the main process.",
+                     [((), peak_rss())])
+        folder_samples = [(k, _folder_size(v)) for k, v in
+                          sorted(self.output_folders.items())]
+        self._metric(lines, 'output_files', 'gauge',
+                     "Number of output files of each kind.",
+                     [((('kind', k),), n) for k, (n, _) in folder_samples])
+        self._metric(lines, 'output_bytes', 'gauge',
+                     "Total size of the output files of each kind.",
+                     [((('kind', k),), size) for k, (_, size) in folder_samples])
+
+        bynames = defaultdict(list)
+        for (name, labels), value in sorted(get_counters().items()):
+            bynames[name].append((labels, value))
+        for name, samples in bynames.items():
+            self._metric(lines, name, 'counter',
+                         _counter_help.get(name, name.replace('_', ' ')),
+                         samples)
+
+        self._metric(lines, 'run_finished', 'gauge',
+                     "Whether the run has finished.",
+                     [((), int(self.finished))])
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """Write the metrics file atomically, so that a collector never
+        reads a partial file."""
+        self._last_write = time.monotonic()
+        folder = self.path.parent
+        try:
+            fd, tmpname = tempfile.mkstemp(dir=folder, prefix='.' + self.path.name)
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.replace(tmpname, self.path)
+        except OSError as e:
+            log.warning(f"Could not write metrics file {self.path}: {e}")
@@ -33,20 +33,103 @@ For example,
     ns[0] #z
     ns[1] #c
 
+The namespaces are ``utils.ChainMap`` objects, which cache where each key
+is found so that the lookups don't get slower with the depth of the
+specification. Dictionaries that become namespace levels (the values
+referenced by the specification) are assumed not to gain or lose keys
+afterwards. Values written through the namespace go to a separate
+``NSFrame`` on top of them (see ``utils.NSOverlay``).
+
 Created on Fri Mar  4 15:02:20 2016
 
 @author: Zahari Kassabov
 """
+import weakref
 from collections import UserList, UserDict
 from collections.abc import Sequence, Mapping
 
-from reportengine.utils import ChainMap, ordinal
+from reportengine.utils import ChainMap, NSFrame, NSOverlay, ordinal
+from reportengine.buildprofile import profiled
 
-__all__ = ('AsNamespace', 'NSList', 'NSItemsDict', 'push_nslevel',
-           'expand_fuzzyspec_partial', 'resolve',
+__all__ = ('AsNamespace', 'NSList', 'NSItemsDict', 'NsSpec', 'as_nsspec',
+           'push_nslevel', 'expand_fuzzyspec_partial', 'expand_fuzzyspec',
+           'iter_fuzzyspec', 'resolve',
            'value_from_spcec_ele')
 
 
+class _SpecRef:
+    """Weak reference target standing for an ``NsSpec``, which can't be
+    referenced weakly itself. They keep each other alive."""
+    __slots__ = ('spec', '__weakref__')
+
+
+class NsSpec(tuple):
+    """An interned namespace specification. Instances are obtained with
+    ``as_nsspec`` or ``NsSpec.child`` and form a prefix tree: the ``parent``
+    attribute is the specification without the last element, and there is
+    only one instance for each specification in use, so that they can be
+    compared by identity. The tree only refers weakly to the children,
+    so the specifications that are no longer used are freed. The hash is
+    computed once. The namespace that the specification resolves to is
+    attached to it by ``resolve`` for the most recently used root
+    namespace.
+
+    ``NsSpec`` compares equal to the tuple with the same elements, and
+    slicing it returns a tuple."""
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (as_nsspec, (tuple(self),))
+
+    @classmethod
+    def _new(cls, elements, parent):
+        res = tuple.__new__(cls, elements)
+        res._hash = tuple.__hash__(res)
+        res.parent = parent
+        #Created with the first child, since most specs have none.
+        res._children = None
+        #Weak reference to the namespace it resolved to last
+        res._resolved = None
+        ref = res._ref = _SpecRef()
+        ref.spec = res
+        return res
+
+    def child(self, ele):
+        """Return the specification with ``ele`` appended."""
+        children = self._children
+        if children is None:
+            children = self._children = weakref.WeakValueDictionary()
+        else:
+            ref = children.get(ele)
+            if ref is not None:
+                return ref.spec
+        res = NsSpec._new((*self, ele), self)
+        #A concurrent call could create an equal spec, which is harmless.
+        children[ele] = res._ref
+        return res
+
+    def ancestor(self, n):
+        """Return the specification with the last ``n`` elements
+        removed."""
+        res = self
+        for _ in range(n):
+            res = res.parent
+        return res
+
+
+_root_spec = NsSpec._new((), None)
+
+def as_nsspec(spec):
+    """Return the ``NsSpec`` corresponding to the sequence ``spec``."""
+    if type(spec) is NsSpec:
+        return spec
+    res = _root_spec
+    for ele in spec:
+        res = res.child(ele)
+    return res
+
 
 
 class AsNamespace:
@@ -60,92 +143,260 @@ class AsNamespace:
     def nsitem(self, item):
         return self[item]
 
+class _NSListView(Sequence):
+    """Read only view of an ``NSList`` as a list of namespace levels, each
+    mapping ``nskey`` to the corresponding item. The levels are created
+    when they are accessed, so that resolving one element doesn't cost
+    the length of the list, and always reflect the current contents of
+    the list."""
+    __slots__ = ('_nslist',)
+
+    def __init__(self, nslist):
+        self._nslist = nslist
+
+    def __len__(self):
+        return len(self._nslist.data)
+
+    def __getitem__(self, index):
+        nslist = self._nslist
+        if isinstance(index, slice):
+            return [NSFrame({nslist.nskey: item}) for item in
+                    nslist.data[index]]
+        return NSFrame({nslist.nskey: nslist.data[index]})
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class NSList(AsNamespace, UserList):
 
     def as_namespace(self):
-        return [{self.nskey: item} for item in self]
+        #The view doesn't depend on the contents, so it is created only
+        #once (but not shared with copies of the list).
+        view = self.__dict__.get('_nsview')
+        if view is None or view._nslist is not self:
+            view = self._nsview = _NSListView(self)
+        return view
 
 class NSItemsDict(AsNamespace, UserDict):
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
         self._nsdicts = {}
+        super().__init__(*args, **kwargs)
 
     def nsitem(self, item):
-        return {self.nskey: self[item]}
+        """Return a dictionary mapping ``nskey`` to the value of ``item``.
+        The result is cached until the value changes, and should not be
+        modified."""
+        val = self[item]
+        cached = self._nsdicts.get(item)
+        if cached is None or cached.get(self.nskey, cached) is not val:
+            cached = self._nsdicts[item] = NSFrame({self.nskey: val})
+        return cached
 
 
 
 class _namespaces: pass
 
-def expand_fuzzyspec_partial(ns, fuzzyspec, currspec=None):
+class _NamespaceTable(dict):
+    """Map the ``NsSpec`` objects to the namespaces they resolve to, for a
+    given root namespace. It also holds the cached fuzzyspec expansions
+    for that root."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        #(currspec, fuzzyspec) -> (checks, specs)
+        self.expansions = {}
+
+    def __reduce__(self):
+        #The expansions refer to the values by identity.
+        return (_NamespaceTable, (dict(self),))
+
+    def get_resolved(self, spec, root):
+        """Return the namespace for ``spec``, or None. ``root`` is the last
+        map of the namespaces of the table, which tells whether the
+        namespace attached to the spec belongs to it."""
+        attached = spec._resolved
+        if attached is not None:
+            attached = attached()
+            if attached is not None and attached.maps[-1] is root:
+                return attached
+        res = self.get(spec)
+        if res is not None:
+            spec._resolved = weakref.ref(res)
+        return res
+
+    def add(self, spec, ns):
+        self[spec] = ns
+        spec._resolved = weakref.ref(ns)
+
+
+def _namespace_table(ns):
+    nsmap = ns.get(_namespaces)
+    if nsmap is None:
+        nsmap = ns.maps[-1][_namespaces] = _NamespaceTable()
+    return nsmap
+
+
+def get_cached_expansion(ns, fuzzyspec, currspec=None, resolve_key=None):
+    """Return the list of specs stored with ``cache_expansion`` for the
+    fuzzyspec, if the values it was computed from are still the same.
+    Otherwise return None.
+
+    The expansion depends on the value of each key of the fuzzyspec at
+    each level it was expanded from, so these are looked up again: the
+    cached specs are used only if the values are the same objects, and
+    the lists have the same length. ``resolve_key(key, ns, spec)`` is
+    called before each lookup, in the same order as the expansion looks
+    up the keys, so that the values can be computed in the namespaces."""
+    if not isinstance(ns, ChainMap):
+        ns = ChainMap(ns)
+    expansions = _namespace_table(ns).expansions
+    entry = expansions.get((as_nsspec(() if currspec is None else currspec),
+                            tuple(fuzzyspec)))
+    if entry is None:
+        return None
+    checks, specs = entry
+    for spec, key, value, size in checks:
+        currns = resolve(ns, spec)
+        if resolve_key is not None:
+            resolve_key(key, currns, spec)
+        if (currns.get(key, _marker) is not value or
+                _expansion_size(value) != size):
+            return None
+    return list(specs)
+
+
+def cache_expansion(ns, fuzzyspec, currspec, specs, checks):
+    """Store ``specs`` as the expansion of the fuzzyspec. ``checks`` is
+    the list filled by the expansion with the values it looked up, which
+    ``get_cached_expansion`` validates."""
+    if not isinstance(ns, ChainMap):
+        ns = ChainMap(ns)
+    key = (as_nsspec(() if currspec is None else currspec), tuple(fuzzyspec))
+    _namespace_table(ns).expansions[key] = (tuple(checks), tuple(specs))
+
+
+_marker = object()
+
+def _expansion_size(val):
+    """The part of ``val`` other than its identity that the expansion
+    depends on."""
+    if isinstance(val, Sequence) and not isinstance(val, Mapping):
+        return len(val)
+    return None
+
+
+def _spec_children(ns, key, currspec, checks=None):
+    """Yield the specs resulting from expanding ``key`` in the namespace
+    ``ns`` corresponding to ``currspec``, and record the value in
+    ``checks`` if given."""
+    val = ns[key]
+    if checks is not None:
+        checks.append((currspec, key, val, _expansion_size(val)))
+    if isinstance(val, Mapping):
+        yield currspec.child(key)
+    elif isinstance(val, Sequence):
+        for i,val_ in enumerate(val):
+            if not isinstance(val_, Mapping) and not hasattr(val, 'as_namespace'):
+                raise TypeError("Cannot expand non-dict "
+                                "list item '%s' (the %s item) of list %s." %
+                                (val_, ordinal(i+1), val))
+            yield currspec.child((key, i))
+    else:
+        raise TypeError("In spec %s, namespace specification '%s' must resolve "
+        "to a dict or a list of dicts, not %r." % (currspec,
+                                                   key, type(val).__name__))
+
+
+def expand_fuzzyspec_partial(ns, fuzzyspec, currspec=None, checks=None):
     """Convert a fuzzyspec to a list of specs. Four each key that can't be
     found, yield a tuple:
 
         key, currspec, ns
 
     The caller should arange that the key is in the namespace when the
-    generator is resumed.
+    generator is resumed. The values that the expansion depends on are
+    appended to ``checks``, if given (see ``cache_expansion``).
     """
     if not isinstance(ns, ChainMap):
         ns = ChainMap(ns)
 
-    if currspec is None:
-        currspec = ()
+    currspec = as_nsspec(() if currspec is None else currspec)
     if not fuzzyspec:
         return (currspec,)
 
     ns = resolve(ns, currspec)
 
     results = []
-    #ns = ChainMap(d)
     key, remainder = fuzzyspec[0], fuzzyspec[1:]
     yield key, currspec, ns
-    val = ns[key]
-
-    if isinstance(val, Mapping):
+    for cs_ in _spec_children(ns, key, currspec, checks):
+        ret = yield from expand_fuzzyspec_partial(ns, remainder, cs_, checks)
+        results += ret
+    return results
 
-        cs_ = (*currspec, key)
 
-        ret = yield from expand_fuzzyspec_partial(ns, remainder, cs_)
-        results += [r for r in ret]
-    elif isinstance(val, Sequence):
-        for i,val_ in enumerate(val):
-            if not isinstance(val_, Mapping) and not hasattr(val, 'as_namespace'):
-                raise TypeError("Cannot expand non-dict "
-                                "list item '%s' (the %s item) of list %s." %
-                                (val_, ordinal(i+1), val))
-            cs_ = (*currspec, (key, i))
-
-            ret = yield from expand_fuzzyspec_partial(ns, remainder, cs_)
-            results += [r for r in ret]
-    else:
-        raise TypeError("In spec %s, namespace specification '%s' must resolve "
-        "to a dict or a list of dicts, not %r." % (currspec,
-                                                   key, type(val).__name__))
-    return results
+def _iter_fuzzyspec(ns, fuzzyspec, currspec, checks=None):
+    #Depth first traversal with a stack of the pending children at each
+    #level, so that only one path of the product is held at a time.
+    levels = [iter((currspec,))]
+    while levels:
+        spec = next(levels[-1], None)
+        if spec is None:
+            levels.pop()
+            continue
+        depth = len(levels) - 1
+        if depth == len(fuzzyspec):
+            yield spec
+            continue
+        key = fuzzyspec[depth]
+        currns = resolve(ns, spec)
+        if key not in currns:
+            raise ElementNotFound(
+                "Could not resolve a fuzzyspec. "
+                f"A key is missing: '{key}', at the level {spec}."
+            )
+        levels.append(_spec_children(currns, key, spec, checks))
+
+
+def iter_fuzzyspec(ns, fuzzyspec, currspec=None):
+    """Lazily yield the nsspecs that spawn from the fuzzyspec, in the same
+    order as ``expand_fuzzyspec``, without building the whole list. Raise
+    ElementNotFound if some part is missing."""
+    if not isinstance(ns, ChainMap):
+        ns = ChainMap(ns)
+    currspec = as_nsspec(() if currspec is None else currspec)
+    return _iter_fuzzyspec(ns, tuple(fuzzyspec), currspec)
 
 
 def expand_fuzzyspec(ns, fuzzyspec, currspec=None):
     """Return all the nsspecs that spawn from the fuzzyspec.
-    Raise ElementNotFound if some part is missing."""
-    gen = expand_fuzzyspec_partial(ns, fuzzyspec, currspec)
-    while True:
-        try:
-            key, nsspec, currns = gen.send(None)
-        except StopIteration as e:
-            return e.value
-        else:
-            if key not in currns:
-                raise ElementNotFound(
-                    "Could not resolve a fuzzyspec. "
-                    f"A key is missing: '{key}', at the level {nsspec}."
-                )
+    Raise ElementNotFound if some part is missing.
+
+    The result is cached in the root namespace and reused while the values
+    it depends on don't change (see ``get_cached_expansion``)."""
+    if not isinstance(ns, ChainMap):
+        ns = ChainMap(ns)
+    fuzzyspec = tuple(fuzzyspec)
+    res = get_cached_expansion(ns, fuzzyspec, currspec)
+    if res is not None:
+        return res
+    checks = []
+    currspec = as_nsspec(() if currspec is None else currspec)
+    res = list(_iter_fuzzyspec(ns, fuzzyspec, currspec, checks))
+    cache_expansion(ns, fuzzyspec, currspec, res, checks)
+    return res
 
 
 def collect_fuzzyspec(ns, key, fuzzyspec, currspec=None):
     """Return the value of key for each spec in the fuzzyspec."""
-    specs = expand_fuzzyspec(ns, fuzzyspec, currspec)
-    return [resolve(ns, spec)[key] for spec in specs]
+    return [resolve(ns, spec)[key] for spec in
+            iter_fuzzyspec(ns, fuzzyspec, currspec)]
 
 
 
@@ -169,11 +420,9 @@ def extract_nsval(ns, ele):
         name, index = ele, None
 
     try:
-        if hasattr(ns, 'nsitem'):
-            val = ns.nsitem(name)
-        else:
-            val = ns[name]
-            old = True
+        val = ns[name] if not hasattr(ns, 'nsitem') else ns.nsitem(name)
+        #nsitem and plain values are shared, and should not be written.
+        old = True
     except KeyError as e:
         raise ElementNotFound(*e.args   ) from e
     if hasattr(val, 'as_namespace'):
@@ -195,7 +444,7 @@ def extract_nsval(ns, ele):
         raise TypeError("Value %s of type %s in %s is not expandable "
                             "as namespace" % (val, type(val), ns))
     if old:
-        val = ChainMap({}, val)
+        val = NSOverlay(val)
     return val
 
 
@@ -203,39 +452,43 @@ def extract_nsval(ns, ele):
 def resolve_partial(ns, spec):
     if not isinstance(ns, ChainMap):
         ns = ChainMap(ns)
-    if _namespaces not in ns:
-        ns.maps[-1][_namespaces] = {}
+    nsmap = _namespace_table(ns)
 
-    remainder = ()
     if not spec:
         return (), ns
-    nsmap = ns[_namespaces]
-
-    if spec in nsmap:
-        return tuple(), nsmap[spec]
-
-
-    for i  in range(len(spec)):
+    spec = as_nsspec(spec)
+    root = ns.maps[-1]
+    attached = spec._resolved
+    if attached is not None:
+        attached = attached()
+        if attached is not None and attached.maps[-1] is root:
+            return (), attached
+
+    #Walk up to the longest prefix that is already resolved.
+    missing = []
+    currspec = spec
+    while currspec:
+        found = nsmap.get_resolved(currspec, root)
+        if found is not None:
+            ns = found
+            break
+        missing.append(currspec)
+        currspec = currspec.parent
 
-        currspec = spec[:i+1]
-        if currspec in nsmap:
-            ns = nsmap[currspec]
-            continue
-        ele = currspec[-1]
+    for currspec in reversed(missing):
         try:
-            val = extract_nsval(ns, ele)
+            val = extract_nsval(ns, currspec[-1])
         except ElementNotFound:
             #currspec and remainder overlap in one element
-            remainder = spec[i:]
-            break
+            return spec[len(currspec)-1:], ns
         ns = ns.new_child(val)
-        nsmap[currspec] = ns
+        nsmap.add(currspec, ns)
 
-    return remainder, ns
+    return (), ns
 
 
+@profiled('namespace')
 def resolve(d, spec):
-    spec = tuple(spec)
     rem, ns = resolve_partial(d, spec)
     if rem:
         raise KeyError("The following parts cannot be expanded %s" % list(rem))
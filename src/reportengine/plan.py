@@ -0,0 +1,221 @@
+"""
+plan.py
+
+Summarize the execution graph before running it: how many nodes each
+provider contributes, how many elements each collect expands to, the shape
+of the graph, the expected number of output files and, based on the
+durations recorded in previous runs, an estimate of the total and
+critical path times.
+
+The durations are recorded by ``DurationHistory``, an execution plugin
+that keeps the number of calls and the cumulative time of each provider
+in a JSON file.
+"""
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from reportengine import namespaces
+from reportengine.hooks import ExecutionHook, provider_name
+from reportengine.resourcebuilder import (CollectSpec, BatchSpec, collect,
+                                          batchkey)
+from reportengine.figure import savefig, savefiglist
+from reportengine.table import savetable, savetablelist
+
+log = logging.getLogger(__name__)
+
+__all__ = ('DurationHistory', 'make_plan', 'format_plan')
+
+
+class DurationHistory(ExecutionHook):
+    """Execution plugin recording the durations of the providers in the
+    JSON file ``path``, adding to the records of previous runs. The
+    durations of the run are added to the contents of the file when the
+    run ends, while holding an exclusive lock on a ``.lock`` file next to
+    it, so that concurrent runs sharing the file add to each other's
+    records. The file is replaced atomically, so that it is never read
+    half written. Without ``fcntl`` (on Windows) the file is not locked,
+    and concurrent runs may lose records, but not corrupt the file."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        #The records of this run only
+        self.records = {}
+
+    @staticmethod
+    def load(path):
+        """Return a mapping from provider name to ``[calls, seconds]``
+        read from ``path``, or an empty mapping if it cannot be read."""
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning(f"Could not read the duration history {path}: {e}")
+            return {}
+
+    @classmethod
+    def load_means(cls, path):
+        """Return a mapping from provider name to the mean duration of its
+        nodes in seconds, as recorded in ``path``."""
+        return {k: seconds/calls for k, (calls, seconds) in cls.load(path).items()
+                if calls}
+
+    def on_node_end(self, spec, duration, size):
+        calls, seconds = self.records.get(provider_name(spec), (0, 0.))
+        self.records[provider_name(spec)] = [calls + 1, seconds + duration]
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold an exclusive lock shared by the runs using ``path``."""
+        if fcntl is None:
+            yield
+            return
+        lockpath = self.path.with_name(f'.{self.path.name}.lock')
+        with open(lockpath, 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def on_run_end(self):
+        if not self.records:
+            return
+        folder = self.path.parent
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            with self._locked():
+                records = self.load(self.path)
+                for name, (calls, seconds) in self.records.items():
+                    oldcalls, oldseconds = records.get(name, (0, 0.))
+                    records[name] = [oldcalls + calls, oldseconds + seconds]
+                fd, tmpname = tempfile.mkstemp(dir=folder,
+                                               prefix='.' + self.path.name)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(records, f)
+                os.replace(tmpname, self.path)
+        except OSError as e:
+            log.warning(f"Could not save the duration history {self.path}: {e}")
+        else:
+            self.records = {}
+
+
+def _fanout(rootns, spec):
+    ns = namespaces.resolve(rootns, spec.nsspec)
+    if isinstance(spec, BatchSpec):
+        return len(ns[batchkey])
+    return len(ns[collect.resultkey])
+
+
+def make_plan(graph, rootns, *, durations=None, figure_formats=1):
+    """Return a dictionary summarizing the ``graph``. ``durations`` maps
+    provider names to their mean duration in seconds and
+    ``figure_formats`` is the number of files written for each figure."""
+    if durations is None:
+        durations = {}
+    nodes = list(graph)
+
+    providers = Counter(provider_name(node.value) for node in nodes)
+
+    fanouts = [(node.value, _fanout(rootns, node.value)) for node in nodes
+               if isinstance(node.value, (CollectSpec, BatchSpec))]
+    fanouts.sort(key=lambda x: x[1], reverse=True)
+
+    #Depth of each node: length of the longest path from a head node.
+    depth = {}
+    for node in nodes:
+        depth[node] = 1 + max((depth[i] for i in node.inputs), default=0)
+    width = Counter(depth.values())
+
+    unknown = Counter()
+    total_time = 0.
+    finish = {}
+    for node in nodes:
+        name = provider_name(node.value)
+        if isinstance(node.value, CollectSpec):
+            cost = 0.
+        elif name in durations:
+            cost = durations[name]
+        else:
+            cost = 0.
+            unknown[name] += 1
+        total_time += cost
+        finish[node] = cost + max((finish[i] for i in node.inputs), default=0.)
+
+    files = Counter()
+    open_ended = Counter()
+    for node in nodes:
+        final = getattr(node.value.function, 'final_action', None)
+        if final is savefig:
+            files['figure'] += figure_formats
+        elif final is savetable:
+            files['table'] += 1
+        elif final is savefiglist:
+            open_ended['figure'] += 1
+        elif final is savetablelist:
+            open_ended['table'] += 1
+
+    return {
+        'nodes': len(nodes),
+        'providers': providers,
+        'collect_fanouts': fanouts,
+        'depth': max(depth.values(), default=0),
+        'width': max(width.values(), default=0),
+        'estimated_total_time': total_time,
+        'estimated_critical_path_time': max(finish.values(), default=0.),
+        'unknown_durations': unknown,
+        'files': files,
+        'generator_nodes': open_ended,
+    }
+
+
+def _format_time(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def format_plan(plan, max_lines=20):
+    """Return a human readable text describing ``plan``, the output of
+    ``make_plan``. Listings are truncated to ``max_lines`` entries."""
+    lines = [f"Execution plan: {plan['nodes']} nodes, depth {plan['depth']}, "
+             f"maximum width {plan['width']}.", "", "Nodes per provider:"]
+    for name, count in plan['providers'].most_common(max_lines):
+        lines.append(f"  {count:>8}  {name}")
+    if len(plan['providers']) > max_lines:
+        lines.append(f"  ... and {len(plan['providers']) - max_lines} more")
+
+    if plan['collect_fanouts']:
+        lines += ["", "Largest collects:"]
+        for spec, fanout in plan['collect_fanouts'][:max_lines]:
+            where = ' -> '.join(str(ele) for ele in spec.nsspec[:-1]) or 'root'
+            lines.append(f"  {fanout:>8}  {spec.resultname} (in {where})")
+
+    lines += ["", "Expected output files:"]
+    files, generators = plan['files'], plan['generator_nodes']
+    for kind in ('figure', 'table'):
+        txt = f"  {files[kind]:>8}  {kind}s"
+        if generators[kind]:
+            txt += f" (plus those of {generators[kind]} {kind} generators)"
+        lines.append(txt)
+
+    lines += ["", "Estimated time from previous runs:",
+              f"  total:         {_format_time(plan['estimated_total_time'])}",
+              f"  critical path: {_format_time(plan['estimated_critical_path_time'])}"]
+    unknown = plan['unknown_durations']
+    if unknown:
+        lines.append(f"  No records for {sum(unknown.values())} nodes of "
+                     f"{len(unknown)} providers: "
+                     + ', '.join(sorted(unknown)[:max_lines]))
+    return '\n'.join(lines)
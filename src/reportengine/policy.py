@@ -0,0 +1,123 @@
+"""
+policy.py
+
+Timeout and retry policies for providers. Use::
+
+    from reportengine.policy import execution_policy
+
+    @execution_policy(timeout=600, retries=3, delay=5)
+    def provider(arg):
+        ...
+
+to have reportengine retry the provider (and its final action, if any)
+when it fails, waiting ``delay*backoff**n`` seconds before the ``n``-th
+retry, and to abort each attempt that takes more than ``timeout``
+seconds. Both the sequential and the parallel executors honour the policy.
+
+Python threads cannot be killed, so an attempt that times out is
+abandoned rather than stopped: it keeps running in a daemon thread, but
+the node fails and the execution does not block on it. Since a new attempt
+would run at the same time as the abandoned one (and e.g. write the same
+outputs), calls that time out are only retried if the provider is
+declared safe to run concurrently with ``rerun_after_timeout=True``.
+"""
+from collections import namedtuple
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+__all__ = ('execution_policy', 'ExecutionPolicy', 'ProviderTimeoutError',
+           'run_with_policy')
+
+
+class ProviderTimeoutError(TimeoutError):
+    """Error raised when a call takes longer than allowed by its policy."""
+    pass
+
+
+ExecutionPolicy = namedtuple('ExecutionPolicy', ('timeout', 'retries',
+                                                 'delay', 'backoff',
+                                                 'retry_on',
+                                                 'rerun_after_timeout'),
+                             defaults=(False,))
+
+
+def execution_policy(*, timeout=None, retries=0, delay=1, backoff=2,
+                     retry_on=Exception, rerun_after_timeout=False):
+    """Decorator attaching an ``ExecutionPolicy`` to a provider.
+
+    timeout: Maximum time in seconds of each attempt, or None for no limit.
+
+    retries: Number of times the call is repeated after failing.
+
+    delay, backoff: The ``n``-th retry (starting from 0) happens after
+    waiting ``delay*backoff**n`` seconds.
+
+    retry_on: Exception type or tuple of types that trigger a retry.
+    Other exceptions are raised immediately.
+
+    rerun_after_timeout: Whether an attempt that timed out can be retried
+    while it is still running in the background.
+    """
+    if timeout is not None and not timeout > 0:
+        raise ValueError(f"timeout must be positive, not {timeout!r}")
+    if retries < 0:
+        raise ValueError(f"retries must be non negative, not {retries!r}")
+    policy = ExecutionPolicy(timeout, retries, delay, backoff, retry_on,
+                             rerun_after_timeout)
+
+    def decorator(f):
+        f.execution_policy = policy
+        return f
+    return decorator
+
+
+def _call_with_timeout(timeout, f, args, kwargs):
+    if timeout is None:
+        return f(*args, **kwargs)
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = f(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    name = getattr(f, '__qualname__', repr(f))
+    thread = threading.Thread(target=target, daemon=True,
+                              name=f"reportengine-{name}")
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise ProviderTimeoutError(f"Call to {name} did not finish "
+                                   f"after {timeout} seconds.")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def run_with_policy(policy, f, args, kwargs):
+    """Call ``f(*args, **kwargs)`` honouring ``policy``, which is an
+    ``ExecutionPolicy`` or None. The arguments are passed explicitly
+    rather than unpacked so that they cannot clash with the names used
+    here."""
+    if policy is None:
+        return f(*args, **kwargs)
+    attempt = 0
+    while True:
+        try:
+            return _call_with_timeout(policy.timeout, f, args, kwargs)
+        except policy.retry_on as e:
+            if attempt >= policy.retries:
+                raise
+            if (isinstance(e, ProviderTimeoutError) and
+                    not policy.rerun_after_timeout):
+                raise
+            wait = policy.delay * policy.backoff**attempt
+            log.warning("Call to %s failed (%s). Retrying in %s seconds "
+                        "(%d of %d).", getattr(f, '__qualname__', f), e,
+                        wait, attempt + 1, policy.retries)
+            time.sleep(wait)
+            attempt += 1
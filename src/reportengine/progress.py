@@ -0,0 +1,160 @@
+"""
+progress.py
+
+Report the progress of the execution: number of completed nodes, the
+providers currently running, the throughput and an estimate of the
+remaining time.
+
+The estimate uses the average duration observed so far for each provider
+(or for all the nodes, for providers that haven't completed yet). The
+remaining time is the largest of the remaining critical path (the longest
+chain of nodes still to be computed) and the remaining work divided by
+the parallelism observed so far.
+
+When the output is a terminal, a single status line is updated in place.
+Otherwise a line is logged periodically.
+"""
+import datetime
+import logging
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+from reportengine.hooks import ExecutionHook, provider_name
+
+log = logging.getLogger(__name__)
+
+__all__ = ('ProgressHook',)
+
+
+def _format_seconds(seconds):
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+class ProgressHook(ExecutionHook):
+    """Execution plugin displaying the progress to ``stream``
+    (``sys.stderr`` by default). ``interval`` is the minimum time in
+    seconds between updates. It defaults to half a second for terminals
+    and to 30 seconds otherwise."""
+
+    def __init__(self, stream=None, interval=None):
+        if stream is None:
+            stream = sys.stderr
+        self.stream = stream
+        self.isatty = hasattr(stream, 'isatty') and stream.isatty()
+        if interval is None:
+            interval = 0.5 if self.isatty else 30
+        self.interval = interval
+
+        self.graph = None
+        self.total = 0
+        self._start_times = {}
+        self._completed = set()
+        self._durations = defaultdict(list)
+        self._busy_time = 0.
+        self._t0 = None
+        self._last_update = None
+
+    def on_graph_built(self, graph):
+        self.graph = graph
+        self.total = len(graph)
+
+    def on_node_start(self, spec):
+        now = time.monotonic()
+        if self._t0 is None:
+            self._t0 = self._last_update = now
+        self._start_times[spec] = now
+
+    def on_node_end(self, spec, duration, size):
+        self._completed.add(spec)
+        self._durations[provider_name(spec)].append(duration)
+        self._busy_time += duration
+        self._maybe_update()
+
+    def on_node_error(self, spec, error):
+        self._completed.add(spec)
+        self._maybe_update()
+
+    def on_run_end(self):
+        if self._t0 is None:
+            return
+        self.update()
+        if self.isatty:
+            self.stream.write('\n')
+            self.stream.flush()
+
+    def _maybe_update(self):
+        if time.monotonic() - self._last_update >= self.interval:
+            self.update()
+
+    def _estimate(self, spec):
+        durations = self._durations.get(provider_name(spec))
+        if durations:
+            return sum(durations)/len(durations)
+        ndone = len(self._completed)
+        return self._busy_time/ndone if ndone else 0.
+
+    def running(self):
+        """Return the specs that have started and whose inputs are all
+        completed."""
+        res = []
+        for spec in self._start_times:
+            if spec in self._completed:
+                continue
+            if self.graph is not None and spec in self.graph:
+                inputs = self.graph[spec].inputs
+                if any(i.value not in self._completed for i in inputs):
+                    continue
+            res.append(spec)
+        return res
+
+    def remaining_time(self):
+        """Estimate the time in seconds until the end of the execution."""
+        if self.graph is None:
+            return None
+        now = time.monotonic()
+        running = set(self.running())
+        remaining_work = 0.
+        longest = {}
+        for node in reversed(list(self.graph)):
+            spec = node.value
+            if spec in self._completed:
+                continue
+            cost = self._estimate(spec)
+            if spec in running:
+                cost = max(0., cost - (now - self._start_times[spec]))
+            remaining_work += cost
+            longest[node] = cost + max((longest.get(o, 0.) for o in node.outputs),
+                                       default=0.)
+        critical_path = max(longest.values(), default=0.)
+        elapsed = now - self._t0
+        parallelism = max(1., self._busy_time/elapsed) if elapsed > 0 else 1.
+        return max(critical_path, remaining_work/parallelism)
+
+    def status_line(self):
+        ndone = len(self._completed)
+        elapsed = time.monotonic() - self._t0
+        parts = [f"[{ndone}/{self.total}]"]
+        if self.total:
+            parts.append(f"{100*ndone/self.total:.0f}%")
+        if elapsed > 0:
+            parts.append(f"{ndone/elapsed:.2f} nodes/s")
+        eta = self.remaining_time()
+        if eta is not None and ndone:
+            parts.append(f"ETA {_format_seconds(eta)}")
+        running = sorted({provider_name(spec) for spec in self.running()})
+        if running:
+            parts.append(f"running: {', '.join(running)}")
+        return ' | '.join(parts)
+
+    def update(self):
+        """Display the current status."""
+        self._last_update = time.monotonic()
+        line = self.status_line()
+        if self.isatty:
+            width = shutil.get_terminal_size().columns - 1
+            self.stream.write('\r' + line[:width].ljust(width))
+            self.stream.flush()
+        else:
+            log.info("Progress: %s", line)
@@ -0,0 +1,108 @@
+"""
+registry.py
+
+Index of the names defined by the provider modules (or objects), so that
+looking up a provider doesn't require scanning every module for every
+requirement.
+
+The precedence is that of the order of the providers: a name is resolved
+to the first provider that defines it with a true value. A name is
+considered to be a provider if any of the providers has an attribute with
+that name. Names defined by more than one provider with different values
+are reported by ``ProviderRegistry.conflicts``.
+
+The names of the attributes are indexed when the registry is created, and
+the values are looked up (and cached) the first time they are requested.
+Attributes that don't appear in ``dir`` (e.g. computed by a
+``__getattr__``) are found by scanning the providers, as before.
+"""
+import logging
+from collections import defaultdict
+from collections.abc import Sequence
+
+from reportengine.utils import get_providers
+
+log = logging.getLogger(__name__)
+
+__all__ = ('ProviderRegistry',)
+
+
+class ProviderRegistry:
+    """Map names to the provider functions of ``providers``, a sequence of
+    modules or objects in order of precedence (or a single one)."""
+
+    def __init__(self, providers):
+        if not isinstance(providers, Sequence):
+            providers = [providers]
+        self.providers = list(providers)
+        self._owners = defaultdict(list)
+        for provider in self.providers:
+            for name in dir(provider):
+                self._owners[name].append(provider)
+        self._cache = {}
+
+    def _lookup(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        owners = self._owners.get(name)
+        if owners is None:
+            #Not in the index: maybe a dynamic attribute.
+            owners = [p for p in self.providers if hasattr(p, name)]
+        if not owners:
+            res = None
+        else:
+            res = False
+            for provider in owners:
+                func = getattr(provider, name, False)
+                if func:
+                    res = func
+                    break
+        self._cache[name] = res
+        return res
+
+    def __contains__(self, name):
+        """Whether any provider has an attribute called ``name``."""
+        return self._lookup(name) is not None
+
+    def get(self, name):
+        """Return the provider function for ``name``. Raise an
+        ``AttributeError`` if there is none."""
+        func = self._lookup(name)
+        if not func:
+            raise AttributeError("No such provider function: %s" % name)
+        return func
+
+    def provider_names(self):
+        """Return the names of the objects that look like providers (as
+        returned by ``utils.get_providers``), in order of precedence."""
+        names = {}
+        for provider in self.providers:
+            names.update(dict.fromkeys(get_providers(provider)))
+        return list(names)
+
+    def conflicts(self):
+        """Return a mapping from the public names that are defined with
+        different callable values by more than one provider, to the list of
+        providers defining them. The first one takes precedence."""
+        res = {}
+        for name, owners in self._owners.items():
+            if name.startswith('_') or len(owners) < 2:
+                continue
+            found = [(p, getattr(p, name, None)) for p in owners]
+            found = [(p, v) for p, v in found if callable(v)]
+            #Bound methods are created anew each time, so compare them
+            #through their functions.
+            unique = {id(getattr(v, '__func__', v)) for _, v in found}
+            if len(unique) > 1:
+                res[name] = [p for p, _ in found]
+        return res
+
+    def format_conflicts(self):
+        """Return a text describing ``conflicts()``."""
+        lines = []
+        for name, owners in sorted(self.conflicts().items()):
+            descr = ', '.join(getattr(p, '__name__', repr(p)) for p in owners)
+            lines.append(f"{name}: defined in {descr}. Using the first one.")
+        return '\n'.join(lines)
@@ -35,6 +35,7 @@ import os
 import logging
 import subprocess
 import shutil
+import time
 from collections import UserList
 import pathlib
 
@@ -50,6 +51,7 @@ from . checks import make_check, CheckError, make_argcheck
 from . import styles
 from . import filefinder
 from . import floatformatting
+from . import metrics
 from . utils import yaml_rt
 
 log = logging.getLogger(__name__)
@@ -305,11 +307,15 @@ def report(template_text, report_style, output_path,
             *bib_args,
             ]
 
+    t0 = time.monotonic()
     try:
         subprocess.run(args, check=True, universal_newlines=True)
     except Exception as e:
         log.error("Could not run pandoc to process the report: %s" % e)
         raise
+    finally:
+        metrics.increment('pandoc_seconds_total', time.monotonic() - t0,
+                          help="Time spent running pandoc.")
 
     log.debug("Report written to %s" % pandoc_path.absolute())
 
@@ -442,6 +448,7 @@ class report_generator(target_map):
                     ns=ns, spec = spec,
                     collect_fuzzyspec=format_collect_fuzzyspec,
                     expand_fuzzyspec=namespaces.expand_fuzzyspec,
+                    iter_fuzzyspec=namespaces.iter_fuzzyspec,
                )
 
 
@@ -7,22 +7,31 @@ Created on Fri Nov 13 21:18:06 2015
 from __future__ import generator_stop
 
 from collections import namedtuple, defaultdict, OrderedDict
-from collections.abc import Sequence
 import os
 import logging
 import inspect
 import functools
+import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABCMeta
 import warnings
 
 from reportengine import dag
 from reportengine import namespaces
+from reportengine import metrics
 from reportengine.configparser import InputNotFoundError, BadInputType, ExplicitNode
 from reportengine.checks import CheckError
-from reportengine.utils import ChainMap
+from reportengine.utils import ChainMap, get_signature, BuildLock
 from reportengine.targets import FuzzyTarget
+from reportengine.policy import run_with_policy
+from reportengine.streaming import stream
+from reportengine.hooks import result_size
+from reportengine import buildprofile
+from reportengine.buildprofile import profiled, timing
+from reportengine.registry import ProviderRegistry
 
-from dask.distributed import Client, WorkerPlugin
+from dask.distributed import Client, WorkerPlugin, Future, as_completed
 
 log = logging.getLogger(__name__)
 
@@ -37,6 +46,15 @@ EMPTY = inspect.Signature.empty
 
 class resultkey:pass
 
+#Instructions yielded by the tasks that build the graph to the worklist
+#driver (ResourceBuilder._run_worklist). A _Require is answered with
+#``(put_index, value, handle)``, where ``handle`` is None if the requirement
+#was satisfied without creating a node, and otherwise must be passed to a
+#_Finish once the node that requires it is known.
+_Require = namedtuple('_Require', ('name', 'nsspec', 'extraargs', 'default',
+                                   'parents'))
+_Finish = namedtuple('_Finish', ('handle', 'required_by'))
+
 
 class DefaultStylePlugin(WorkerPlugin):
     """
@@ -70,10 +88,83 @@ class collect:
         self.function = function
         self.element_default = element_default
 
+    def make_results(self, size):
+        """Return the container where the result of each of the ``size``
+        elements is set by index."""
+        return OrderedDict.fromkeys(range(size))
+
     def __call__(self, ns, nsspec):
         ns = namespaces.resolve(ns, nsspec)
         return list(ns[resultkey].values())
 
+class _fold_results:
+    """Container for the results of a ``reduce_collect``. Values are
+    combined with the accumulated result as soon as all the previous
+    elements are available, so that they don't need to be kept. Futures are
+    kept instead and combined with a tree reduction at the end."""
+    def __init__(self, size, combine, initial):
+        self.size = size
+        self.combine = combine
+        self._acc = initial
+        self._next = 0
+        self._pending = {}
+
+    def __len__(self):
+        return self.size
+
+    def __setitem__(self, index, value):
+        self._pending[index] = value
+        while (self._next in self._pending and
+               not isinstance(self._pending[self._next], Future)):
+            value = self._pending.pop(self._next)
+            if self._acc is EMPTY:
+                self._acc = value
+            else:
+                self._acc = self.combine(self._acc, value)
+            self._next += 1
+
+    def result(self):
+        items = [self._pending[i] for i in sorted(self._pending)]
+        if self._acc is not EMPTY:
+            items.insert(0, self._acc)
+        if not items:
+            raise ValueError("Cannot reduce an empty collect with no "
+                             "initial value")
+        futures = [item for item in items if isinstance(item, Future)]
+        if not futures:
+            return functools.reduce(self.combine, items)
+        client = futures[0].client
+        while len(items) > 1:
+            pairs = [client.submit(self.combine, a, b)
+                     for a, b in zip(items[::2], items[1::2])]
+            if len(items) % 2:
+                pairs.append(items[-1])
+            items = pairs
+        return items[0]
+
+class reduce_collect(collect):
+    """Like ``collect``, but instead of a list with the result for each
+    element, return the result of folding them with ``combine``, an
+    associative function of two arguments, starting from ``initial`` if
+    given.
+
+    When executing sequentially, the results are combined as they are
+    computed, in order, and the results of the elements that are not
+    needed otherwise are released from the namespace. When executing in
+    parallel, the results are combined with a tree reduction."""
+    def __init__(self, function, fuzzyspec, combine, *, initial=EMPTY,
+                 element_default=EMPTY):
+        super().__init__(function, fuzzyspec, element_default=element_default)
+        self.combine = combine
+        self.initial = initial
+
+    def make_results(self, size):
+        return _fold_results(size, self.combine, self.initial)
+
+    def __call__(self, ns, nsspec):
+        ns = namespaces.resolve(ns, nsspec)
+        return ns[resultkey].result()
+
 class target_map(collect):
     class targetlenskey:pass
     def __init__(self, targets):
@@ -94,6 +185,46 @@ def add_to_dict_flag(result, ns ,origin, target, index):
 async def _async_identity(f, *args, **kwargs):
     return f(*args, **kwargs)
 
+class batchkey:pass
+
+def batchable(f):
+    """Decorator marking a provider as able to process all the elements of
+    a ``collect`` at once. Each argument of the decorated function receives
+    a list with the value of that argument for every element of the
+    collect, and the function must return the list of the results for each
+    element. The collect is then computed by a single node instead of one
+    node per element.
+
+    Outside of a collect, the function is called normally. The type
+    annotations are verified for each element of a batch. Collects over
+    providers with checks (which can modify the namespace of each element)
+    are not batched, but computed one node per element."""
+    f.batchable = True
+    return f
+
+class _BatchCall:
+    """The function of a ``BatchSpec``: call the batchable provider and
+    verify that it returns one result for each of the ``size`` elements.
+    It has the same attributes as the provider (e.g. its name or final
+    action)."""
+    def __init__(self, function, size):
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.size = size
+
+    def __call__(self, *args, **kwargs):
+        res = self.function(*args, **kwargs)
+        try:
+            n = len(res)
+        except TypeError:
+            raise TypeError(f"The batchable provider {self.__name__} must "
+                            f"return a list, not {type(res).__name__}.")
+        if n != self.size:
+            raise ValueError(f"The batchable provider {self.__name__} "
+                             f"returned {n} results for a batch of "
+                             f"{self.size} elements.")
+        return res
+
 class provider:
     """Decorator intended to be used for the functions that are to
     be exposed as providers, either directly or through more specialized
@@ -117,9 +248,14 @@ CollectSpec = namedtuple('CollectSpec', ('function', 'kwargs', 'resultname',
 
 CollectMapSpec = namedtuple('CollectMapSpec', ('function', 'kwargs' ,'resultname', 'nsspec'))
 
+#A call to a batchable function over all the elements of a collect.
+BatchSpec = namedtuple('BatchSpec', ('function', 'kwargs', 'resultname',
+                                     'nsspec'))
+
 Node.register(CallSpec)
 Node.register(CollectSpec)
 Node.register(CollectMapSpec)
+Node.register(BatchSpec)
 
 
 #TODO; Improve namespace spec
@@ -146,7 +282,7 @@ def print_callspec(spec, nsname = None):
 CallSpec.__str__ = print_callspec
 
 def check_types(f, ns):
-    s = inspect.signature(f)
+    s = get_signature(f)
     for param_name, param_value in s.parameters.items():
         tps = param_value.annotation
         if tps is not s.empty and param_name in ns:
@@ -154,15 +290,64 @@ def check_types(f, ns):
             if not isinstance(val, tps):
                 raise BadInputType(param_name, val, tps)
 
+def _stream_to_final_action(function, kwdict, prepare_args):
+    """Pass the items yielded by the generator of ``function`` to its final
+    action as they are produced."""
+    items = stream(function.generator(**kwdict),
+                   getattr(function, 'stream_buffer', 0))
+    return function.final_action(items, **prepare_args)
+
+def _can_fuse(parent, child):
+    """Whether the edge between the two nodes can be part of a fused
+    chain of calls."""
+    return (isinstance(parent.value, CallSpec) and
+            isinstance(child.value, CallSpec) and
+            parent.value.resultname in child.value.kwargs)
+
+def _execute_chain(steps, perform_final):
+    """Execute a fused linear chain of calls in a single task.
+    ``steps`` is a sequence of ``[function, kwdict, prepare_args, link]``
+    items, where ``link`` is the name of the argument that receives the
+    result of the previous step. Return a tuple with the result of each
+    step."""
+    results = []
+    for function, kwdict, prepare_args, link in steps:
+        if link is not None:
+            kwdict = {**kwdict, link: results[-1]}
+        results.append(ResourceExecutor.get_result(function, kwdict,
+                                                   prepare_args,
+                                                   perform_final))
+    return tuple(results)
+
 class ResourceExecutor:
     def __init__(self, graph, rootns, environment=None, perform_final=True):
         self.graph = graph
         self.rootns = rootns
         self.environment = environment
         self._node_flags = defaultdict(lambda: set())
+        #Nodes removed from the graph, whose result is that of another node.
+        self._aliases = defaultdict(list)
         self.perform_final = perform_final
-
-    def resolve_callargs(self, callspec):
+        #Optional callable (e.g. a reportengine.spill.Spiller) applied to
+        #the results before they are set in the namespace.
+        self.spiller = None
+        #Elements of reduce_collect nodes, and nodes requested as targets,
+        #used to decide which results can be released after being folded.
+        self._reduced_elements = set()
+        self._targets = set()
+        self.hooks = []
+
+    def add_hook(self, hook):
+        """Register an execution plugin. See :py:mod:`reportengine.hooks`."""
+        self.hooks.append(hook)
+
+    def _emit(self, event, *args):
+        for hook in self.hooks:
+            method = getattr(hook, event, None)
+            if method is not None:
+                method(*args)
+
+    def resolve_callargs(self, callspec, exclude=()):
         """
         Resolve arguments for an action.
 
@@ -170,6 +355,10 @@ class ResourceExecutor:
         ----------
         callspec : CallSpec
 
+        exclude : Container[str]
+                Names of arguments that are not to be looked up in the
+                namespace, because they are supplied otherwise.
+
         Returns
         -------
 
@@ -182,7 +371,14 @@ class ResourceExecutor:
         """
         function, kwargs, resultname, nsspec = callspec
         namespace = namespaces.resolve(self.rootns, nsspec)
-        kwdict = {kw: namespace[kw] for kw in kwargs}
+        if isinstance(callspec, BatchSpec):
+            kwdict = {kw: [] for kw in kwargs if kw not in exclude}
+            for spec, defaults in namespace[batchkey]:
+                elens = namespaces.resolve(self.rootns, spec)
+                for kw, values in kwdict.items():
+                    values.append(defaults[kw] if kw in defaults else elens[kw])
+        else:
+            kwdict = {kw: namespace[kw] for kw in kwargs if kw not in exclude}
 
         if hasattr(function, 'prepare') and self.perform_final:
             prepare_args = function.prepare(
@@ -201,19 +397,47 @@ class ResourceExecutor:
         topological order, resolving the inputs and executing the functions as
         needed.
         """
-        for node in self.graph:
-            callspec = node.value
-            if isinstance(callspec, (CollectSpec, CollectMapSpec)):
-                #my_ns = namespaces.resolve(self.rootns, callspec.nsspec)
-                result = callspec.function(self.rootns, callspec.nsspec)
-            else:
-                result = self.get_result(callspec.function,
-                                         *self.resolve_callargs(callspec),
-                                         perform_final=self.perform_final)
-            self.set_result(result, callspec)
+        transient = self._transient_results()
+        try:
+            for node in self.graph:
+                callspec = node.value
+                self._emit('on_node_start', callspec)
+                t0 = time.perf_counter()
+                try:
+                    if isinstance(callspec, (CollectSpec, CollectMapSpec)):
+                        #my_ns = namespaces.resolve(self.rootns, callspec.nsspec)
+                        result = callspec.function(self.rootns, callspec.nsspec)
+                    else:
+                        result = self.get_result(callspec.function,
+                                                 *self.resolve_callargs(callspec),
+                                                 perform_final=self.perform_final)
+                except Exception as e:
+                    self._emit('on_node_error', callspec, e)
+                    raise
+                duration = time.perf_counter() - t0
+                self.set_result(result, callspec)
+                if self.hooks:
+                    self._emit('on_node_end', callspec, duration,
+                               result_size(result))
+                if callspec in transient:
+                    #The result has been folded and nothing else needs it.
+                    log.debug("Releasing result of %s", callspec)
+                    namespace = namespaces.resolve(self.rootns, callspec.nsspec)
+                    del namespace.maps[1][callspec.resultname]
+        finally:
+            self._emit('on_run_end')
+
+    def _transient_results(self):
+        """Return the specs of the nodes that are only used as elements
+        of one ``reduce_collect``, so that their result doesn't need to be
+        kept once it is set."""
+        return {spec for spec in self._reduced_elements
+                if spec in self.graph and spec not in self._targets
+                and len(self.graph[spec].outputs) == 1
+                and not self._aliases.get(spec)}
 
 
-    def execute_parallel(self, scheduler=None):
+    def execute_parallel(self, scheduler=None, fuse_chains=False):
         """
         Execute the  directed acyclic graph in parallell using the dask
         library.
@@ -235,6 +459,12 @@ class ResourceExecutor:
                 The socket port number should be passed to, e.g. valiphys, command line
                 when running it in --parallel mode.
 
+        fuse_chains : bool, default: False
+                If True, linear chains of ``CallSpec`` nodes (where each
+                element is the only input of the next one) are submitted
+                as a single task, reducing the scheduler overhead and the
+                serialization of the intermediate results.
+
         """
         log.info("Initializing dask.distributed Client")
 
@@ -266,44 +496,143 @@ class ResourceExecutor:
 
         leaf_callspecs = []
 
-        for node in self.graph:
-            callspec = node.value
+        if fuse_chains:
+            units = self.graph.linear_chains(can_link=_can_fuse)
+        else:
+            units = ([node] for node in self.graph)
 
-            if isinstance(callspec, (CollectSpec, CollectMapSpec)):
-                # CollectSpec: collect function only has to collect already existing futures
-                # CollectMapSpec: used for the generation of a report
-                future = callspec.function(self.rootns, callspec.nsspec)
+        # node -> (future, submission time), only needed for the hooks
+        tracked = {}
 
-            else:
-                # CallSpec:
-                kwdict = self.resolve_callargs(callspec)[0]
-                future = client.submit(callspec.function, **kwdict)
+        try:
+            for chain in units:
+                for node in chain:
+                    self._emit('on_node_start', node.value)
+                if len(chain) > 1:
+                    log.debug("Fusing linear chain of %d nodes ending in %s",
+                              len(chain), chain[-1].value)
+                    self._submit_chain(chain, client)
+                else:
+                    self._submit_node(chain[0].value, client)
 
-                # perform final action if needed. Final action is
-                # needed for tables and figures only. final_action
-                # saves figures and tables to a certain memory location
+                if self.hooks:
+                    self._track_submitted(chain, tracked)
 
-                if hasattr(callspec.function, 'final_action') and self.perform_final:
-                    namespace = namespaces.resolve(self.rootns, callspec.nsspec)
-                    put_map = namespace.maps[1]
-                    put_map[callspec.resultname] = future
-                    prepare_args = self.resolve_callargs(callspec)[1]
+                node = chain[-1]
+                if not node.outputs:
+                    # gather results from leaf nodes only
+                    leaf_callspecs.append(node.value)
+
+            if tracked:
+                self._emit_completed(tracked, client)
+
+            # gather futures once all jobs have been submitted
+            self.gather_results(leaf_callspecs, client)
+        finally:
+            self._emit('on_run_end')
+
+        return client
+
+    def _track_submitted(self, chain, tracked):
+        """Record the futures of the nodes in ``chain`` so that the hooks
+        can be notified when they complete. Nodes computed in place (i.e.
+        collects of futures) are reported as finished immediately."""
+        now = time.perf_counter()
+        for node in chain:
+            spec = node.value
+            namespace = namespaces.resolve(self.rootns, spec.nsspec)
+            future = namespace.maps[1][spec.resultname]
+            if isinstance(future, Future):
+                tracked[node] = (future, now)
+            else:
+                self._emit('on_node_end', spec, 0., None)
+
+    def _emit_completed(self, tracked, client):
+        """Wait for all the ``tracked`` futures, emitting the node end and
+        error events as they complete."""
+        nodes = {future: node for node, (future, _) in tracked.items()}
+        done_times = {}
+        completed = as_completed(list(nodes), with_results=False)
+        for batch in completed.batches():
+            now = time.perf_counter()
+            finished = [f.key for f in batch if f.status == 'finished']
+            sizes = client.nbytes(finished, summary=False) if finished else {}
+            for future in batch:
+                node = nodes[future]
+                done_times[node] = now
+                if future.status == 'error':
+                    self._emit('on_node_error', node.value, future.exception())
+                    continue
+                if future.status != 'finished':
+                    continue
+                # The node can only start once all of its inputs are done.
+                ready = max([tracked[node][1],
+                             *(done_times.get(inp, 0.) for inp in node.inputs)])
+                self._emit('on_node_end', node.value, now - ready,
+                           sizes.get(future.key))
+
+    def _submit_node(self, callspec, client):
+        """Submit the task corresponding to a single node of the graph
+        and store the resulting future in the namespace."""
+        if isinstance(callspec, (CollectSpec, CollectMapSpec)):
+            # CollectSpec: collect function only has to collect already existing futures
+            # CollectMapSpec: used for the generation of a report
+            future = callspec.function(self.rootns, callspec.nsspec)
+
+        else:
+            # CallSpec:
+            kwdict = self.resolve_callargs(callspec)[0]
+            policy = getattr(callspec.function, 'execution_policy', None)
+            if policy is None:
+                future = client.submit(callspec.function, **kwdict)
+            else:
+                future = client.submit(run_with_policy, policy,
+                                       callspec.function, [], kwdict)
+
+            # perform final action if needed. Final action is
+            # needed for tables and figures only. final_action
+            # saves figures and tables to a certain memory location
+
+            if hasattr(callspec.function, 'final_action') and self.perform_final:
+                namespace = namespaces.resolve(self.rootns, callspec.nsspec)
+                put_map = namespace.maps[1]
+                put_map[callspec.resultname] = future
+                prepare_args = self.resolve_callargs(callspec)[1]
+                if policy is None:
                     future = client.submit(
                         callspec.function.final_action,
                         put_map[callspec.resultname],
                         **prepare_args,
                     )
+                else:
+                    future = client.submit(
+                        run_with_policy, policy,
+                        callspec.function.final_action,
+                        [put_map[callspec.resultname]],
+                        prepare_args,
+                    )
 
-            self.set_future(future, callspec)
+        self.set_future(future, callspec)
 
-            if not node.outputs:
-                # gather results from leaf nodes only
-                leaf_callspecs.append(callspec)
+    def _submit_chain(self, chain, client):
+        """Submit a linear chain of ``CallSpec`` nodes as a single task.
+        The result of every element is still set in its own namespace, as
+        a future extracted from the fused task."""
+        steps = []
+        link = None
+        for node in chain:
+            callspec = node.value
+            exclude = () if link is None else (link,)
+            kwdict, prepare_args = self.resolve_callargs(callspec,
+                                                         exclude=exclude)
+            # Note: Not a tuple, because dask would interpret it as a task.
+            steps.append([callspec.function, kwdict, prepare_args, link])
+            link = callspec.resultname
 
-        # gather futures once all jobs have been submitted
-        self.gather_results(leaf_callspecs, client)
-
-        return client
+        fused = client.submit(_execute_chain, steps, self.perform_final)
+        for i, node in enumerate(chain):
+            future = client.submit(operator.itemgetter(i), fused)
+            self.set_future(future, node.value)
 
 
     def set_future(self, future, callspec):
@@ -327,6 +656,9 @@ class ResourceExecutor:
         for action, args in self._node_flags[callspec]:
             action(put_map[resultname], self.rootns, callspec, **dict(args))
 
+        for alias in self._aliases.get(callspec, ()):
+            self.set_future(future, alias)
+
     def gather_results(self, callspecs, client):
         """
         Helper to gather futures from callspecs.
@@ -376,10 +708,24 @@ class ResourceExecutor:
 
         perform_final : bool
                     default = True
+
+        If the function has a ``generator`` attribute (as set by e.g.
+        ``figuregen``), the items it yields are streamed to the final action
+        one at a time (see :py:mod:`reportengine.streaming`).
+
+        If the function has an ``execution_policy`` attribute (see
+        :py:mod:`reportengine.policy`), both the function and the final
+        action are called honouring it.
         """
-        fres = function(**kwdict)
+        policy = getattr(function, 'execution_policy', None)
+        if (hasattr(function, 'final_action') and perform_final and
+                hasattr(function, 'generator')):
+            return run_with_policy(policy, _stream_to_final_action,
+                                   (function, kwdict, prepare_args), {})
+        fres = run_with_policy(policy, function, (), kwdict)
         if hasattr(function, 'final_action') and perform_final:
-            return function.final_action(fres, **prepare_args)
+            return run_with_policy(policy, function.final_action, (fres,),
+                                   prepare_args)
         return fres
 
     def set_result(self, result, spec):
@@ -398,11 +744,17 @@ class ResourceExecutor:
         put_map = namespace.maps[1]
         log.debug("Setting result for %s %s", spec, nsspec)
 
+        if self.spiller is not None:
+            result = self.spiller(result)
+
         put_map[resultname] = result
 
         for action, args in self._node_flags[spec]:
             action(result, self.rootns ,spec, **dict(args))
 
+        for alias in self._aliases.get(spec, ()):
+            self.set_result(result, alias)
+
     def __str__(self):
         return "\n".join(print_callspec(node.value) for node in self.graph)
 
@@ -435,12 +787,17 @@ class ResourceBuilder(ResourceExecutor):
                     Instance or instance of subclass of the Config class.
                     Instance has ``produce_``, ``parse_``, methods.
 
+        providers: ProviderRegistry, Sequence or object
+                    Modules or objects defining the provider functions, in
+                    order of precedence, or a registry made from them.
+
         """
         self.input_parser = input_parser
 
-        if not isinstance(providers, Sequence):
-            providers = [providers]
-        self.providers = providers
+        if not isinstance(providers, ProviderRegistry):
+            providers = ProviderRegistry(providers)
+        self.provider_registry = providers
+        self.providers = providers.providers
         self.fuzzytargets = fuzzytargets
 
         rootns = ChainMap()
@@ -449,14 +806,10 @@ class ResourceBuilder(ResourceExecutor):
 
 
     def is_provider_func(self, name):
-        return any(hasattr(provider, name) for provider in self.providers)
+        return name in self.provider_registry
 
     def get_provider_func(self, name):
-        for provider in self.providers:
-            func = getattr(provider, name, False)
-            if func:
-                return func
-        raise AttributeError("No such provider function: %s" % name)
+        return self.provider_registry.get(name)
 
     def explain_provider(self, provider_name):
         """Collect the dependencies of a given provider name, by analizing
@@ -497,7 +850,7 @@ class ResourceBuilder(ResourceExecutor):
         else:
             raise NotImplementedError(func)
 
-        sig = inspect.signature(func)
+        sig = get_signature(func)
 
         for param_name, param in sig.parameters.items():
             try:
@@ -524,9 +877,57 @@ class ResourceBuilder(ResourceExecutor):
         return specs
 
 
-    def resolve_fuzzytargets(self):
-        for target in self.fuzzytargets:
-            self.resolve_fuzzytarget(target)
+    def resolve_fuzzytargets(self, threads=1, merge_nodes=False):
+        """Process all the targets and build the graph. If ``threads`` is
+        larger than one, the targets are processed concurrently by a pool
+        of threads (see ``_resolve_fuzzytargets_threaded``). If
+        ``merge_nodes`` is true, ``merge_equivalent_nodes`` is called
+        before the hooks are notified that the graph is built."""
+        self._emit('on_build_start')
+        if threads > 1 and len(self.fuzzytargets) > 1:
+            self._resolve_fuzzytargets_threaded(threads)
+        else:
+            for target in self.fuzzytargets:
+                self.resolve_fuzzytarget(target)
+        if merge_nodes:
+            self.merge_equivalent_nodes()
+        self._emit('on_graph_built', self.graph)
+
+    def _resolve_fuzzytargets_threaded(self, threads):
+        """Process each target in a separate thread. The construction of
+        the graph is serialized by a lock, which the configuration parser
+        releases while running parse and produce functions, so that the
+        expensive resources needed by different targets are loaded in
+        parallel. A resource needed by several targets is computed only
+        once. The resulting graph is the same as with a single thread. If
+        several targets fail, the error of the first one is raised."""
+        if buildprofile.active() is not None:
+            log.warning("The build profiler requires a single thread. "
+                        "Processing the targets sequentially.")
+            for target in self.fuzzytargets:
+                self.resolve_fuzzytarget(target)
+            return
+        lock = BuildLock()
+        self.input_parser.build_lock = lock
+
+        def work(target):
+            with lock:
+                self.resolve_fuzzytarget(target)
+
+        try:
+            with ThreadPoolExecutor(threads,
+                    thread_name_prefix='reportengine-build') as pool:
+                futures = [pool.submit(work, target)
+                           for target in self.fuzzytargets]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            self.input_parser.build_lock = None
 
     def resolve_fuzzytarget(self, fuzzytarget):
         if not isinstance(fuzzytarget, FuzzyTarget):
@@ -537,25 +938,176 @@ class ResourceBuilder(ResourceExecutor):
         for spec in specs:
             self.process_targetspec(fuzzytarget.name, spec, fuzzytarget.extraargs)
 
+    def _value_key(self, node):
+        """Return a key identifying the computation performed by ``node``
+        in terms of its function and the values of its inputs, so that
+        nodes with equal keys compute the same result. Return None if the
+        node cannot be merged with others."""
+        callspec = node.value
+        #Nodes with a prepare step (e.g. figures and tables) produce
+        #different outputs for each namespace.
+        if (not isinstance(callspec, CallSpec) or
+                hasattr(callspec.function, 'prepare')):
+            return None
+        from_nodes = {n.value.resultname: n.value for n in node.inputs}
+        namespace = namespaces.resolve(self.rootns, callspec.nsspec)
+        tokens = []
+        for kw in callspec.kwargs:
+            if kw in from_nodes:
+                tokens.append((kw, Node, from_nodes[kw]))
+                continue
+            try:
+                val = namespace[kw]
+            except KeyError:
+                return None
+            try:
+                hash(val)
+            except TypeError:
+                #Unhashable values can only be shared by identity.
+                tokens.append((kw, id, id(val)))
+            else:
+                tokens.append((kw, type(val), val))
+        return (callspec.function, callspec.resultname, tuple(tokens))
+
+    def merge_equivalent_nodes(self):
+        """Merge the nodes that call the same function with equal input
+        values, even if they are in different namespaces. Only one of them
+        is executed and the result is set in the namespaces of all of
+        them. This is meant to be called by ``resolve_fuzzytargets`` (with
+        ``merge_nodes``), so that the hooks see the merged graph.
+        Return the number of nodes removed from the graph."""
+        canonical = {}
+        merged = 0
+        #Iterating in topological order guarantees that the inputs of a
+        #node have already been merged when processing it.
+        for node in list(self.graph):
+            key = self._value_key(node)
+            if key is None:
+                continue
+            target = canonical.setdefault(key, node)
+            if target is node:
+                continue
+            log.debug("Merging node %s into %s", node.value, target.value)
+            outputs = set(node.outputs)
+            self.graph.delete_node(node)
+            self.graph.add_or_update_node(target.value, outputs=outputs)
+            self._aliases[target.value].append(node.value)
+            merged += 1
+        log.info("Merged %d nodes with equal inputs.", merged)
+        metrics.increment('merged_nodes_total', merged,
+                          help="Nodes merged into others with equal inputs.")
+        return merged
+
     def process_targetspec(self, name, nsspec, extraargs=None,
                             default=EMPTY):
-
-        log.debug("Processing target %s" % name)
-
-        gen = self._process_requirement(name, nsspec, extraargs=extraargs,
-                                        default=default, parents=[])
-        gen.send(None)
-        try:
-            gen.send(None)
-        except StopIteration:
-            pass
-        else:
-            raise RuntimeError()
+        self.process_targetspecs([(name, nsspec, extraargs)], default=default)
+
+    def process_targetspecs(self, targets, default=EMPTY):
+        """Process a batch of independent targets, given as
+        ``(name, nsspec, extraargs)`` tuples. The nodes for all of them
+        are created first, and then they are connected and checked, as
+        for the elements of a collect. The resulting graph is the same as
+        when processing them one by one, but if there are several errors,
+        a different one may be raised first."""
+        self._run_worklist(self._targets_task(targets, default))
+
+    def _targets_task(self, targets, default):
+        handles = []
+        for name, nsspec, extraargs in targets:
+            log.debug("Processing target %s" % name)
+            _, val, handle = yield _Require(name, nsspec, extraargs, default,
+                                            [])
+            if isinstance(val, Node):
+                self._targets.add(val)
+            if handle is not None:
+                handles.append(handle)
+        for handle in handles:
+            yield _Finish(handle, None)
+
+    def _run_worklist(self, task):
+        """Run ``task`` and all the tasks it requires, using an explicit
+        stack instead of recursion.
+
+        The tasks are generators, which yield ``_Require`` and ``_Finish``
+        instructions. A task created for a requirement (see
+        ``_process_requirement``) has two phases: it first yields a
+        ``(put_index, value)`` tuple, which is sent to the task that
+        required it, and is then resumed by a ``_Finish`` with the node
+        that requires it, to add the edge and run the checks. Exceptions
+        raised by a task are thrown into the task that required it."""
+        profiler = buildprofile.active()
+        #Items are (generator, is in its first phase, profile key).
+        stack = [(task, False, None)]
+        value = error = None
+        while stack:
+            gen, first_phase, key = stack[-1]
+            try:
+                if error is not None:
+                    instruction = gen.throw(error)
+                    error = None
+                else:
+                    instruction = gen.send(value)
+            except StopIteration:
+                stack.pop()
+                if profiler is not None and key is not None:
+                    profiler.exit()
+                if first_phase:
+                    raise RuntimeError(f"Task {gen} finished without a result")
+                value = None
+                continue
+            except Exception as e:
+                stack.pop()
+                if profiler is not None and key is not None:
+                    profiler.exit()
+                if not stack:
+                    raise
+                error = e
+                continue
+
+            tp = type(instruction)
+            if tp is _Require:
+                name, nsspec, extraargs, default, parents = instruction
+                key = ('requirement', name)
+                if profiler is not None:
+                    profiler.enter(key)
+                try:
+                    res = self._process_requirement(name, nsspec,
+                            extraargs=extraargs, default=default,
+                            parents=parents)
+                except Exception as e:
+                    if profiler is not None:
+                        profiler.exit()
+                    error = e
+                    continue
+                if isinstance(res, tuple):
+                    if profiler is not None:
+                        profiler.exit()
+                    value = (*res, None)
+                else:
+                    stack.append((res, True, key))
+                    value = None
+            elif tp is _Finish:
+                (child, childkey), required_by = instruction
+                if profiler is not None:
+                    profiler.enter(childkey, first=False)
+                stack.append((child, False, childkey))
+                value = required_by
+            else:
+                if not first_phase:
+                    raise RuntimeError(f"Task {gen} returned more than one "
+                                       "result")
+                stack.pop()
+                if profiler is not None:
+                    profiler.exit()
+                put_index, val = instruction
+                value = (put_index, val, (gen, key))
 
     def _process_requirement(self, name, nsspec, *, extraargs=None,
                             default=EMPTY, parents=None):
-        """Create nodes so as to satisfy the requirement specified by the
-        arguments."""
+        """Satisfy the requirement specified by the arguments. Return
+        a ``(put_index, value)`` tuple if it can be satisfied without
+        creating a new node, and otherwise a task making the node (see
+        ``_run_worklist``)."""
         if parents is None:
             parents = []
 
@@ -569,8 +1121,7 @@ class ResourceBuilder(ResourceExecutor):
         is_provider = self.is_provider_func(name)
         if ( is_provider and isinstance(self.get_provider_func(name), collect)):
             log.debug("Resolving collect node for %s", name)
-            yield from self._make_node(name, nsspec, extraargs, parents)
-            return
+            return self._make_node(name, nsspec, extraargs, parents)
         #First try to find the name in the namespace
         try:
             put_index, val = self.input_parser.resolve_key(name, ns, parents=parents, currspec=nsspec)
@@ -588,10 +1139,8 @@ class ResourceBuilder(ResourceExecutor):
                 "passed to compute it: %s" % (name, extraargs), parents[-1])
 
             if isinstance(val, ExplicitNode):
-                yield from self._make_node((name, val.value), nsspec, extraargs, parents)
-            else:
-                yield put_index, val
-            return
+                return self._make_node((name, val.value), nsspec, extraargs, parents)
+            return put_index, val
 
         #If the name is not in the providers, either it is an extra argument
         #or is missing
@@ -601,28 +1150,27 @@ class ResourceBuilder(ResourceExecutor):
                 raise saved_exception
             else:
                 put_index = None
-                yield put_index, default
-                return
+                return put_index, default
 
         #here we handle the case where the requirement is a provider and
         #make a new node for it.
-        yield from self._make_node(name, nsspec, extraargs, parents)
+        return self._make_node(name, nsspec, extraargs, parents)
 
 
     def _make_node(self, name_or_tuple, nsspec, extraargs, parents):
-        """Make a node from the input arguments as well as any nodes required
-        from that node."""
+        """Return a task that makes a node from the input arguments as well
+        as any nodes required from that node."""
         if isinstance(name_or_tuple, tuple):
             name, f = name_or_tuple
         else:
             name = name_or_tuple
             f = self.get_provider_func(name)
         if isinstance(f, target_map):
-            yield from self._make_collect_targets(f, name, nsspec, parents)
+            return self._make_collect_targets(f, name, nsspec, parents)
         elif isinstance(f, collect):
-            yield from self._make_collect(f, name, nsspec, parents)
+            return self._make_collect(f, name, nsspec, parents)
         else:
-            yield from self._make_callspec(f, name, nsspec, extraargs, parents)
+            return self._make_callspec(f, name, nsspec, extraargs, parents)
 
     def _create_default_key(self, name, nsspec, put_index=None, defaults=None):
         """Push a namespace level for a node to store input values.
@@ -633,35 +1181,37 @@ class ResourceBuilder(ResourceExecutor):
             put_index = 0
 
         defaults_label = '_' + name + '_defaults'
-        nsspec = (*nsspec[:len(nsspec)-put_index], defaults_label)
-        parent_ns = namespaces.resolve(self.rootns, nsspec[:-1])
+        parent_spec = namespaces.as_nsspec(nsspec).ancestor(put_index)
+        nsspec = parent_spec.child(defaults_label)
+        parent_ns = namespaces.resolve(self.rootns, parent_spec)
         namespaces.push_nslevel(parent_ns, defaults_label, defaults)
         return nsspec
 
 
+    @profiled('callspec', lambda self, f, name, *args, **kwargs: name)
     def _make_callspec(self, f, name, nsspec, extraargs, parents):
         """Make a normal node that calls a function."""
 
         defaults = {}
-        s = inspect.signature(f)
+        s = get_signature(f)
         if(extraargs):
             defaults.update(dict(extraargs))
 
         #Note that this is the latest possible put_index and not len - 1
         #because there is also the root namespace.
         put_index = len(nsspec)
-        gens = []
+        handles = []
         for param_name, param in s.parameters.items():
             default = defaults.get(param_name, param.default)
-            gen = self._process_requirement(param_name, nsspec, extraargs=None,
-                                     default=default, parents=[name, *parents])
-            index, _ = gen.send(None)
+            index, _, handle = yield _Require(param_name, nsspec, None,
+                                              default, [name, *parents])
             log.debug("put_index for %s is %s" % (param_name, index))
             if index is None:
                 defaults[param_name] = default
             elif index < put_index:
                 put_index = index
-            gens.append(gen)
+            if handle is not None:
+                handles.append(handle)
 
         #The namespace stack (put_index) goes in the opposite direction
         #of the nsspec. put_index==len(nsspec)==len(ns.maps)-1
@@ -683,13 +1233,8 @@ class ResourceBuilder(ResourceExecutor):
         else:
             log.debug("Appending node '%s'." % (cs,))
             self.graph.add_or_update_node(cs)
-        for gen in gens:
-            try:
-               gen.send(cs)
-            except StopIteration:
-                pass
-            else:
-                raise RuntimeError()
+        for handle in handles:
+            yield _Finish(handle, cs)
 
 
         required_by = yield put_index, cs
@@ -704,18 +1249,22 @@ class ResourceBuilder(ResourceExecutor):
             return
 
         try:
-            check_types(f, ns)
+            with timing('check', 'check_types'):
+                check_types(f, ns)
         except BadInputType as e:
             raise ResourceError(name, e, parents) from e
 
         if hasattr(f, 'checks'):
             for check in f.checks:
                 try:
-                    check(callspec=cs, ns=ns, graph=self.graph,
-                          environment=self.environment)
+                    with timing('check', getattr(check, '__qualname__',
+                                                 repr(check))):
+                        check(callspec=cs, ns=ns, graph=self.graph,
+                              environment=self.environment)
                 except CheckError as e:
                     raise ResourceError(name, e, parents) from e
 
+    @profiled('collect', lambda self, f, name, *args, **kwargs: name)
     def _make_collect(self, f, name, nsspec, parents):
         """Make a node that spans a function over the values in a list and
         collects them in another list."""
@@ -729,37 +1278,42 @@ class ResourceBuilder(ResourceExecutor):
                                                     self.rootns,
                                                     parents=newparents,
                                                     initial_spec=nsspec)
-        myns = namespaces.resolve(self.rootns, myspec)
-        myns[collect.resultkey] = OrderedDict.fromkeys(range(len(specs)))
-
         if not isinstance(f.function, str):
             newname = f.function.__name__
         else:
             newname = f.function
 
+        if self._can_batch(f, newname, specs):
+            yield from self._make_batch(name, newname, myspec, specs,
+                                        newparents)
+            return
+
+        myns = namespaces.resolve(self.rootns, myspec)
+        myns[collect.resultkey] = f.make_results(len(specs))
+
         compiletime = True
 
         collspec = CollectSpec(f, (), name, myspec)
 
-        gens = []
+        handles = []
         for i, spec in enumerate(specs):
 
-            gen = self._process_requirement(newname, spec,
-                                            parents=newparents)
-
-
             try:
-                _, newcs = gen.send(None)
+                _, newcs, handle = yield _Require(newname, spec, None, EMPTY,
+                                                  newparents)
             except InputNotFoundError:
                 if f.element_default is EMPTY:
                     raise
                 newcs = f.element_default
             else:
-                gens.append(gen)
+                if handle is not None:
+                    handles.append(handle)
 
             if isinstance(newcs, Node):
                 flagargs = (('target', collspec), ('index', i))
                 self._node_flags[newcs].add((add_to_dict_flag, flagargs))
+                if isinstance(f, reduce_collect):
+                    self._reduced_elements.add(newcs)
                 compiletime = False
             else:
                 #TODO: Find a better way to do this: E.g. input nodes
@@ -778,13 +1332,69 @@ class ResourceBuilder(ResourceExecutor):
                 outputs = set([required_by])
             value = collspec
             self.graph.add_or_update_node(collspec, outputs=outputs)
-        for gen in gens:
+        for handle in handles:
+            yield _Finish(handle, value)
+
+    def _can_batch(self, f, newname, specs):
+        """Whether the collect ``f`` can be computed with a single call to
+        a batchable provider. This requires that the collect is not empty,
+        that the provider has no checks and that the name is not
+        overwritten by the input in any of the elements."""
+        if (not specs or isinstance(f, reduce_collect) or
+                f.element_default is not EMPTY or
+                not self.is_provider_func(newname)):
+            return False
+        func = self.get_provider_func(newname)
+        if not getattr(func, 'batchable', False):
+            return False
+        if hasattr(func, 'checks'):
+            log.debug("Not batching %s because it has checks.", newname)
+            return False
+        if newname in self.input_parser:
+            return False
+        return not any(newname in namespaces.resolve(self.rootns, spec)
+                       for spec in specs)
+
+    def _make_batch(self, name, newname, myspec, specs, parents):
+        """Make a single node calling the batchable provider ``newname``
+        with the arguments of all the ``specs``."""
+        func = self.get_provider_func(newname)
+        s = get_signature(func)
+        elements = []
+        handles = []
+        for spec in specs:
+            defaults = {}
+            for param_name, param in s.parameters.items():
+                index, _, handle = yield _Require(param_name, spec, None,
+                                                  param.default,
+                                                  [newname, *parents])
+                if index is None:
+                    defaults[param_name] = param.default
+                if handle is not None:
+                    handles.append(handle)
             try:
-                gen.send(value)
-            except StopIteration:
-                pass
-            else:
-                raise RuntimeError()
+                with timing('check', 'check_types'):
+                    check_types(func, namespaces.resolve(self.rootns, spec))
+            except BadInputType as e:
+                raise ResourceError(newname, e, parents) from e
+            elements.append((spec, defaults))
+
+        myns = namespaces.resolve(self.rootns, myspec)
+        myns[batchkey] = elements
+
+        bs = BatchSpec(_BatchCall(func, len(elements)),
+                       tuple(s.parameters.keys()), name, myspec)
+        log.debug("Appending batch node %s over %d elements", bs, len(specs))
+        self.graph.add_or_update_node(bs)
+        for handle in handles:
+            yield _Finish(handle, bs)
+
+        required_by = yield 0, bs
+        if required_by is None:
+            outputs = set()
+        else:
+            outputs = set([required_by])
+        self.graph.add_or_update_node(bs, outputs=outputs)
 
     def _make_collect_targets(self, colltargets, name, nsspec, parents):
 
@@ -810,21 +1420,16 @@ class ResourceBuilder(ResourceExecutor):
 
                 target_specs = self.expand_fuzzytarget_spec(target)
                 for i, tspec in enumerate(target_specs):
-                    gen = self._process_requirement(name=target.name, nsspec=tspec,
-                                                    extraargs=target.extraargs, parents=newparents)
-                    index, tnode = gen.send(None)
-                    try:
-                        gen.send(my_node)
-                    except StopIteration:
-                        pass
-                    else:
-                        raise RuntimeError()
+                    index, tnode, handle = yield _Require(target.name, tspec,
+                            target.extraargs, EMPTY, newparents)
+                    if handle is not None:
+                        yield _Finish(handle, my_node)
 
             for fuzzy, newd in d['withs'].items():
                 newspecs = self.input_parser.process_fuzzyspec(fuzzy,
                                                 self.rootns, parents=newparents,
                                                 initial_spec=spec)
                 for newspec in newspecs:
-                    walk(newd, newspec)
+                    yield from walk(newd, newspec)
 
-        walk(colltargets.root, nsspec)
+        yield from walk(colltargets.root, nsspec)
@@ -0,0 +1,94 @@
+"""
+spill.py
+
+Write large intermediate results to a scratch folder and replace them by
+memory mapped views of the files. Consumers see an object with the same
+interface, but the data can be paged in and out by the operating system,
+so that the resident memory stays bounded when e.g. collecting results
+over many replicas.
+
+Only plain NumPy arrays and pandas DataFrames with a single non object
+dtype are spilled. Anything else (including subclasses such as the tables
+produced by ``@table``) is kept in memory unchanged.
+"""
+import itertools
+import logging
+import pathlib
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+__all__ = ('Spiller',)
+
+
+class Spiller:
+    """Callable that takes a result and returns it unchanged, or, if it is
+    larger than ``threshold`` bytes and of a supported type, a copy on write
+    memory mapped view of a file containing it.
+
+    The files are written to a new temporary directory, created inside
+    ``folder`` if given, so that several runs can share it. The directory
+    is removed when ``cleanup`` is called, or else when the object is
+    garbage collected or the interpreter exits, so that the spilled
+    results can be used as long as the spiller is alive (e.g. by keeping
+    the ``ResourceBuilder`` that uses it).
+    """
+    def __init__(self, threshold, folder=None):
+        self.threshold = threshold
+        if folder is not None:
+            pathlib.Path(folder).mkdir(parents=True, exist_ok=True)
+        self.folder = pathlib.Path(tempfile.mkdtemp(
+            prefix='reportengine-spill-', dir=folder))
+        #Files that are still mapped can't be removed on some platforms.
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.folder,
+                                           ignore_errors=True)
+        self._counter = itertools.count()
+        self.bytes_spilled = 0
+
+    def _new_path(self):
+        return self.folder / f'{next(self._counter)}.npy'
+
+    def _map_array(self, arr):
+        path = self._new_path()
+        log.debug("Spilling array of %d bytes to %s", arr.nbytes, path)
+        np.save(path, arr)
+        self.bytes_spilled += arr.nbytes
+        #Copy on write keeps the array writable, without changing the file.
+        return np.load(path, mmap_mode='c')
+
+    def spill_array(self, arr):
+        if arr.dtype.hasobject or arr.nbytes < self.threshold:
+            return arr
+        return self._map_array(arr)
+
+    def spill_frame(self, df):
+        dtypes = set(df.dtypes)
+        if len(dtypes) != 1:
+            return df
+        (dtype,) = dtypes
+        if not isinstance(dtype, np.dtype) or dtype.hasobject:
+            return df
+        values = df.to_numpy()
+        if values.nbytes < self.threshold:
+            return df
+        res = pd.DataFrame(self._map_array(values), index=df.index,
+                           columns=df.columns, copy=False)
+        res.attrs = df.attrs
+        return res
+
+    def __call__(self, result):
+        if type(result) is np.ndarray:
+            return self.spill_array(result)
+        if type(result) is pd.DataFrame:
+            return self.spill_frame(result)
+        return result
+
+    def cleanup(self):
+        """Remove the temporary folder. The spilled results must not be
+        used afterwards."""
+        self._finalizer()
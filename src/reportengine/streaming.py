@@ -0,0 +1,90 @@
+"""
+streaming.py
+
+Connect providers that yield items (such as those decorated with
+``figuregen`` or ``tablegen``) to the final action that consumes them, so
+that each item is saved and released as soon as it is produced, instead of
+first collecting all of them in memory.
+
+By default the items are produced lazily, as the consumer requests them.
+Use::
+
+    @figuregen
+    @prefetch(2)
+    def plot_datasets(datasets):
+        for ds in datasets:
+            yield plot(ds)
+
+to compute the items in a separate thread, keeping at most two of them
+waiting to be consumed. This way item N+1 is computed while item N is
+being saved. Note that the producer then runs in a different thread than
+the consumer, which only makes sense if the provider is thread safe (e.g.
+it builds its figures with the object oriented matplotlib interface
+rather than with ``pyplot``).
+"""
+import queue
+import threading
+
+__all__ = ('prefetch', 'stream')
+
+
+def prefetch(maxsize):
+    """Decorator setting the number of items of a generator provider that
+    are computed ahead of the consumer in a separate thread."""
+    if maxsize < 0:
+        raise ValueError(f"maxsize must be non negative, not {maxsize!r}")
+
+    def decorator(f):
+        f.stream_buffer = maxsize
+        return f
+    return decorator
+
+
+def _put(q, stop, item):
+    """Put ``item`` in the queue, waiting for space unless ``stop`` is
+    set. Return whether the item was put."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+        except queue.Full:
+            continue
+        return True
+    return False
+
+
+def stream(iterable, maxsize=0):
+    """Iterate over ``iterable``. If ``maxsize`` is positive, the items are
+    produced in a separate thread and at most ``maxsize`` of them are kept
+    in a buffer waiting to be consumed (blocking the producer otherwise).
+    Exceptions raised by the producer are raised by the consumer. If the
+    consumer stops early, so does the producer."""
+    if not maxsize:
+        yield from iterable
+        return
+
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(q, stop, (True, item)):
+                    return
+        except BaseException as e:
+            _put(q, stop, (False, e))
+        else:
+            _put(q, stop, (False, None))
+
+    thread = threading.Thread(target=produce, daemon=True,
+                              name='reportengine-stream')
+    thread.start()
+    try:
+        while True:
+            is_item, value = q.get()
+            if not is_item:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stop.set()
@@ -100,4 +100,5 @@ def tablegen(f):
     """Save each table of the generator. See ``table``."""
     f.prepare = prepare_path
     f.final_action = savetablelist
+    f.generator = f
     return f
@@ -68,7 +68,7 @@ class BadToken(BadTemplate): pass
 def parse_with(with_match, line, lineno, out):
 
     newfuzzy = tokenize_fuzzy(with_match.group(1))
-    line = "{{% for spec in expand_fuzzyspec(ns, {newfuzzy!r}, spec) %}}".format(newfuzzy=newfuzzy)
+    line = "{{% for spec in iter_fuzzyspec(ns, {newfuzzy!r}, spec) %}}".format(newfuzzy=newfuzzy)
     out.write(line)
     return Match('with', tuple(newfuzzy))
 
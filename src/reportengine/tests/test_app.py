@@ -4,9 +4,12 @@ Created on Tue Jun  7 10:00:19 2016
 
 @author: Zahari Kassabov
 """
+import gc
+
+import numpy as np
 import pytest
 
-from reportengine import app
+from reportengine import app, namespaces
 from reportengine.utils import yaml_safe
 from reportengine.tests.utils import tmp
 
@@ -79,3 +82,23 @@ def test_app_runs(tmp):
         bad_app.main(badargs)
 
 
+class BigProvider:
+    @staticmethod
+    def big(a):
+        return np.full(10000, a, dtype=float)
+
+def test_spilled_results_outlive_run(tmp):
+    runcardfile = tmp/'runcard.yaml'
+    with open(runcardfile, 'w') as f:
+        f.write("a: 1\n\nactions_:\n    - big\n")
+    spill_folder = tmp/'spill'
+    a = app.App('spilltest', [BigProvider()])
+    a.init([str(runcardfile), '-o', str(tmp/'output'),
+            '--spill-threshold', '0.001', '--spill-folder', str(spill_folder)])
+    rb = a.run()
+    big = namespaces.resolve(rb.rootns, ())['big']
+    assert isinstance(big, np.memmap)
+    assert big.sum() == 10000
+    del big, rb
+    gc.collect()
+    assert list(spill_folder.iterdir()) == []
@@ -10,8 +10,10 @@ import unittest.mock as mock
 
 from reportengine.configparser import Config
 from reportengine.resourcebuilder import (ResourceBuilder, FuzzyTarget,
-                                          ResourceError, collect)
-from reportengine.checks import require_one, remove_outer
+                                          ResourceError, collect, batchable,
+                                          BatchSpec, reduce_collect)
+from reportengine.checks import require_one, remove_outer, check_not_empty
+from reportengine.hooks import ExecutionHook
 from reportengine import namespaces
 
 class Provider():
@@ -167,6 +169,200 @@ class TestBuilder(unittest.TestCase):
         # close the client
         client.close()
 
+    def test_merge_equivalent_nodes(self):
+        inp = {
+        'a': {'oranges': 'Valencia'},
+        'b': {'oranges': 'Valencia'},
+        'c': {'oranges': 'Ivrea'},
+        }
+        calls = []
+        class CountingProvider(Provider):
+            def juice(self, oranges):
+                calls.append(oranges)
+                return 'juice from %s' % oranges
+
+        c = Config(inp)
+        fuzzytargets = [FuzzyTarget('juice', (ns,), (), ()) for ns in 'abc']
+        builder = ResourceBuilder(fuzzytargets=fuzzytargets,
+                                  providers=CountingProvider(), input_parser=c)
+        builder.resolve_fuzzytargets()
+        self.assertEqual(len(builder.graph), 3)
+        self.assertEqual(builder.merge_equivalent_nodes(), 1)
+        self.assertEqual(len(builder.graph), 2)
+        builder.execute_sequential()
+        self.assertEqual(sorted(calls), ['Ivrea', 'Valencia'])
+        for ns, origin in zip('abc', ('Valencia', 'Valencia', 'Ivrea')):
+            res = namespaces.resolve(builder.rootns, (ns,))['juice']
+            self.assertEqual(res, 'juice from %s' % origin)
+
+        #The hooks see the merged graph
+        sizes = []
+        class GraphSize(ExecutionHook):
+            def on_graph_built(self, graph):
+                sizes.append(len(graph))
+        builder = ResourceBuilder(fuzzytargets=fuzzytargets,
+                                  providers=CountingProvider(), input_parser=c)
+        builder.add_hook(GraphSize())
+        builder.resolve_fuzzytargets(merge_nodes=True)
+        self.assertEqual(sizes, [2])
+
+    def test_batchable_collect(self):
+        inp = {
+        'restaurants': [{'restaurant': x} for x in "ABC"],
+        'time': '9AM',
+        }
+        calls = []
+        class BatchProvider(Provider):
+            @batchable
+            def menu(self, restaurant, time, size='small'):
+                calls.append(restaurant)
+                return [f"{r} at {t} ({s})"
+                        for r, t, s in zip(restaurant, time, size)]
+            menus = collect('menu', ('restaurants',))
+
+        fuzzytargets = [FuzzyTarget('menus', (), (), ())]
+        builder = ResourceBuilder(fuzzytargets=fuzzytargets,
+                                  providers=BatchProvider(),
+                                  input_parser=Config(inp))
+        builder.resolve_fuzzytargets()
+        self.assertEqual(len(builder.graph), 1)
+        node, = builder.graph
+        self.assertIsInstance(node.value, BatchSpec)
+        builder.execute_sequential()
+        self.assertEqual(calls, [['A', 'B', 'C']])
+        self.assertEqual(builder.rootns['menus'],
+                         [f"{r} at 9AM (small)" for r in "ABC"])
+
+        #Inputs overriding the provider disable the batching
+        inp['restaurants'][1]['menu'] = "Closed"
+        builder = ResourceBuilder(fuzzytargets=fuzzytargets,
+                                  providers=BatchProvider(),
+                                  input_parser=Config(inp))
+        builder.resolve_fuzzytargets()
+        self.assertNotIsInstance(next(iter(builder.graph)).value, BatchSpec)
+
+    def test_batchable_validation(self):
+        def build(provider, restaurants=("A", "B")):
+            inp = {'restaurants': [{'restaurant': x} for x in restaurants]}
+            builder = ResourceBuilder(
+                fuzzytargets=[FuzzyTarget('menus', (), (), ())],
+                providers=provider, input_parser=Config(inp))
+            builder.resolve_fuzzytargets()
+            return builder
+
+        class Typed(Provider):
+            @batchable
+            def menu(self, restaurant:int):
+                return restaurant
+            menus = collect('menu', ('restaurants',))
+
+        with self.assertRaises(ResourceError):
+            build(Typed())
+        #Empty collects are not batched
+        builder = build(Typed(), restaurants=())
+        self.assertEqual(len(builder.graph), 0)
+        self.assertEqual(builder.rootns['menus'], [])
+
+        class Checked(Provider):
+            @check_not_empty('restaurant')
+            @batchable
+            def menu(self, restaurant):
+                return restaurant
+            menus = collect('menu', ('restaurants',))
+
+        builder = build(Checked())
+        self.assertEqual(len(builder.graph), 3)
+        with self.assertRaises(ResourceError):
+            build(Checked(), restaurants=("A", ""))
+
+        class Short(Provider):
+            @batchable
+            def menu(self, restaurant):
+                return restaurant[:-1]
+            menus = collect('menu', ('restaurants',))
+
+        builder = build(Short())
+        with self.assertRaisesRegex(ValueError, "1 results for a batch of 2"):
+            builder.execute_sequential()
+
+    def test_reduce_collect(self):
+        inp = {
+        'restaurants': [{'restaurant': x} for x in ["Wok", "Tapas", "Bar"]],
+        }
+        class ReduceProvider(Provider):
+            def name_length(self, restaurant):
+                return len(restaurant)
+
+            def initial(self, restaurant):
+                return restaurant[0]
+
+            total_length = reduce_collect('name_length', ('restaurants',),
+                                          lambda x, y: x + y)
+            initials = reduce_collect('initial', ('restaurants',),
+                                      lambda x, y: x + y, initial='>')
+            all_lengths = collect('name_length', ('restaurants',))
+
+        fuzzytargets = [FuzzyTarget('total_length', (), (), ()),
+                        FuzzyTarget('initials', (), (), ())]
+        builder = ResourceBuilder(fuzzytargets=fuzzytargets,
+                                  providers=ReduceProvider(),
+                                  input_parser=Config(inp))
+        builder.resolve_fuzzytargets()
+        builder.execute_sequential()
+        self.assertEqual(builder.rootns['total_length'], 11)
+        self.assertEqual(builder.rootns['initials'], '>WTB')
+        #The element results are not kept
+        ns = namespaces.resolve(builder.rootns, [('restaurants', 0)])
+        self.assertNotIn('name_length', ns)
+
+        #Unless something else needs them
+        fuzzytargets.append(FuzzyTarget('all_lengths', (), (), ()))
+        builder = ResourceBuilder(fuzzytargets=fuzzytargets,
+                                  providers=ReduceProvider(),
+                                  input_parser=Config(inp))
+        builder.resolve_fuzzytargets()
+        builder.execute_sequential()
+        self.assertEqual(builder.rootns['total_length'], 11)
+        self.assertEqual(builder.rootns['all_lengths'], [3, 5, 3])
+
+    def test_deep_chain(self):
+        #Deeper than the recursion limit
+        depth = 3000
+        members = {'p0': lambda self, x: x}
+        for i in range(1, depth):
+            exec(f"def p{i}(self, p{i-1}): pass", members)
+        DeepProvider = type('DeepProvider', (),
+                            {k: v for k, v in members.items()
+                             if k.startswith('p')})
+        builder = ResourceBuilder(fuzzytargets=[FuzzyTarget(f'p{depth-1}',
+                                                            (), (), ())],
+                                  providers=DeepProvider(),
+                                  input_parser=Config({'x': 0}))
+        builder.resolve_fuzzytargets()
+        self.assertEqual(len(builder.graph), depth)
+
+    def test_process_targetspecs(self):
+        inp = {'restaurants': [{'restaurant': x} for x in "ABC"],
+               'apple': "Golden"}
+        fuzzy = FuzzyTarget('english_breakfast', ('restaurants',), (), ())
+
+        def targets(builder):
+            res = [('english_breakfast', spec, ())
+                   for spec in builder.expand_fuzzytarget_spec(fuzzy)]
+            return [*res, ('sweet_breakfast', (), (('oranges', 'x'),))]
+
+        provider = Provider()
+        one_by_one = ResourceBuilder(Config(inp), provider, [])
+        for target in targets(one_by_one):
+            one_by_one.process_targetspec(*target)
+        batched = ResourceBuilder(Config(inp), provider, [])
+        batched.process_targetspecs(targets(batched))
+        self.assertEqual(len(batched.graph), 8)
+        self.assertEqual({n.value: {i.value for i in n.inputs}
+                          for n in batched.graph},
+                         {n.value: {i.value for i in n.inputs}
+                          for n in one_by_one.graph})
+
     def test_collect_raises(self):
         with self.assertRaises(TypeError):
             collect(1, ['a', 'b', 'c'])
@@ -0,0 +1,70 @@
+"""
+test_buildprofile.py
+
+Tests for the graph build profiler.
+"""
+import pytest
+
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget, collect
+from reportengine.checks import make_argcheck
+from reportengine.buildprofile import BuildProfiler, profiled
+
+
+@make_argcheck
+def check_small(x):
+    assert x < 10
+
+
+class Provider:
+    @check_small
+    def double(self, x):
+        return 2*x
+
+    doubles = collect('double', ('xs',))
+
+    def total(self, doubles):
+        return sum(doubles)
+
+
+def test_build_profile():
+    inp = {'xs': [{'x': i} for i in range(3)]}
+    builder = ResourceBuilder(Config(inp), Provider(),
+                              [FuzzyTarget('total', (), (), ())])
+    with BuildProfiler() as profiler:
+        builder.resolve_fuzzytargets()
+    stats = profiler.stats
+    assert stats['requirement', 'double'].calls == 3
+    assert stats['requirement', 'x'].calls == 3
+    assert stats['callspec', 'double'].calls == 3
+    assert stats['collect', 'doubles'].calls == 1
+    assert stats['check', 'check_small'].calls == 3
+    assert stats['fuzzyspec', "('xs',)"].calls == 1
+    assert stats['resolve_key', 'x'].calls >= 3
+    assert stats['namespace', 'resolve'].calls > 0
+    #The requirement for total includes everything else.
+    total = stats['requirement', 'total']
+    assert total.cumulative >= stats['collect', 'doubles'].cumulative
+    assert total.self_time <= total.cumulative
+    assert 'check_small' in profiler.report()
+
+    #Nothing is recorded once the profiler is stopped.
+    calls = stats['requirement', 'total'].calls
+    ResourceBuilder(Config(inp), Provider(),
+                    [FuzzyTarget('total', (), (), ())]).resolve_fuzzytargets()
+    assert stats['requirement', 'total'].calls == calls
+
+
+def test_recursion():
+    @profiled('test', lambda n: 'fact')
+    def fact(n):
+        return 1 if n <= 1 else n*fact(n-1)
+
+    with BuildProfiler() as profiler:
+        assert fact(5) == 120
+        with pytest.raises(RuntimeError):
+            BuildProfiler().start()
+    stats = profiler.stats['test', 'fact']
+    assert stats.calls == 5
+    assert stats.depth == 0
+    assert stats.self_time == pytest.approx(stats.cumulative)
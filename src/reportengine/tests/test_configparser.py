@@ -6,12 +6,16 @@ Created on Mon Jan 18 11:09:28 2016
 """
 
 from collections import OrderedDict
+import pickle
 import unittest
 
+import pytest
+
 from reportengine.utils import ChainMap, yaml_safe
 from reportengine import namespaces
 from reportengine.configparser import (Config, BadInputType, element_of,
-                                       named_element_of, ConfigError)
+                                       named_element_of, ConfigError,
+                                       memoized, _memo_key)
 
 
 class BaseConfig(Config):
@@ -128,6 +132,18 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(namespaces.resolve(ns, spec).maps[0],
                          {'sum': 3, 'y': -4})
 
+        #The expansion is reused until the values change, but the keys are
+        #still resolved.
+        calls = []
+        c.resolve_key = lambda key, *args, **kwargs: calls.append(key)
+        self.assertEqual(c.process_fuzzyspec(('ys',), ns=ns), ret)
+        self.assertEqual(calls, ['ys'])
+        ns['ys'] = ns['ys'][:2]
+        self.assertEqual(c.process_fuzzyspec(('ys',), ns=ns), ret[:2])
+        #In place modifications are seen too
+        ns['ys'].append({'y': 1})
+        self.assertEqual(len(c.process_fuzzyspec(('ys',), ns=ns)), 3)
+
     def test_parse_complex_dicts(self):
         inp = {
 
@@ -188,6 +204,120 @@ class TestConfig(unittest.TestCase):
 
 
 
+class CountingConfig(BaseConfig):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parsed = []
+
+    def parse_three(self, number:int):
+        self.parsed.append(number)
+        return number
+
+
+def test_lazy_inputs():
+    inp = {'A': {'three': 33, 'y': 10},
+           'B': {'three': 'bad', 'y': 5},
+           'Cs': [{'three': 1, 'y': 1}, {'three': 2, 'y': 2}],
+           'four': 4}
+    eager = CountingConfig(inp)
+    eager_ns = ChainMap()
+    for key in ('A', 'Cs'):
+        eager.process_fuzzyspec((key,), ns=eager_ns)
+
+    c = CountingConfig(inp)
+    c.lazy_inputs = True
+    ns = ChainMap()
+    c.process_fuzzyspec(('A',), ns=ns)
+    #Not parsed until needed
+    c.process_fuzzyspec(('B',), ns=ns)
+    specs = c.process_fuzzyspec(('Cs',), ns=ns)
+    assert c.parsed == []
+
+    d = namespaces.resolve(ns, ('A',))
+    assert c.resolve_key('sum', d)[1] == 47
+    assert c.parsed == [33]
+    d = namespaces.resolve(ns, specs[1])
+    assert c.resolve_key('sum', d)[1] == 8
+    assert c.parsed == [33, 2]
+    #The bad input is only reported when used
+    d = namespaces.resolve(ns, ('B',))
+    with pytest.raises(BadInputType):
+        d['three']
+    assert d['y'] == 5
+
+    #Iterating parses everything
+    assert ns['A'] == eager_ns['A']
+    assert ns['Cs'] == eager_ns['Cs']
+    assert sorted(c.parsed) == sorted(eager.parsed)
+    assert pickle.loads(pickle.dumps(ns['A'])) == eager_ns['A']
+
+
+class MemoConfig(BaseConfig):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    @memoized
+    def parse_dataset(self, spec:dict):
+        self.calls.append('dataset')
+        return dict(spec)
+
+    @memoized
+    def produce_loaded(self, dataset, four):
+        self.calls.append('loaded')
+        return [dataset['name'], four]
+
+    @memoized
+    def parse_columns(self, spec:dict):
+        return list(spec)
+
+    @memoized(ignore_key_order=True)
+    def parse_options(self, spec:dict):
+        self.calls.append('options')
+        return dict(spec)
+
+
+def test_memoized():
+    inp = {'pdfs': [{'four': 4, 'dataset': {'name': 'a'}}
+                    for _ in range(3)],
+           'other': {'four': 4, 'dataset': {'name': 'b'}},
+           'four': 4}
+    c = MemoConfig(inp)
+    ns = ChainMap()
+    specs = [*c.process_fuzzyspec(('pdfs',), ns=ns),
+             *c.process_fuzzyspec(('other',), ns=ns)]
+    results = [c.resolve_key('loaded', namespaces.resolve(ns, spec))[1]
+               for spec in specs]
+    assert results == [['a', 4]]*3 + [['b', 4]]
+    assert results[0] is results[1] is results[2]
+    assert c.calls.count('dataset') == 2
+    assert c.calls.count('loaded') == 2
+    assert c.memoization_stats() == {'parse_dataset': (2, 2, 0),
+                                     'produce_loaded': (2, 2, 0)}
+    assert pickle.loads(pickle.dumps(c))._memo == {}
+    #The order of the keys is part of the arguments
+    assert c.parse_columns({'a': 1, 'b': 2}) == ['a', 'b']
+    assert c.parse_columns({'b': 2, 'a': 1}) == ['b', 'a']
+    #Unless it is ignored
+    options = c.parse_options({'a': 1, 'b': [2]})
+    assert c.parse_options({'b': [2], 'a': 1}) is options
+    assert c.calls.count('options') == 1
+    #Keys that can't be sorted keep their order
+    assert (_memo_key({1: 'x', 'a': 'y'}, ignore_key_order=True) !=
+            _memo_key({'a': 'y', 1: 'x'}, ignore_key_order=True))
+
+
+def test_fast_yaml(caplog):
+    text = "four: 4\nA:\n  y: 1\n  three: bad\n"
+    c = BaseConfig.from_yaml(text, fast=True)
+    assert type(c.input_params) is dict
+    assert c.input_params == BaseConfig.from_yaml(text).input_params
+    ns = ChainMap()
+    with pytest.raises(BadInputType):
+        c.process_fuzzyspec(('A',), ns=ns)
+    assert "Failed processing key 'three' at line 4" in caplog.text
+
+
 def test_rewrite_actions():
     inp = {'actions_': [{'pdfs':[{'report':{'main':True}}]}, {'fits':{'fitcontext': ['fits_chi2_table']}}]}
     c = BaseConfig(inp)
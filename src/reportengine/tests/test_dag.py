@@ -121,6 +121,20 @@ class TestDAG(unittest.TestCase):
         assert refs.keys() == g._node_refs.keys()
         assert oldleafs == g._leaf_nodes
 
+    def test_linear_chains(self):
+        g = self.make_diamond()
+        g.add_node(4, inputs={3})
+        g.add_node(5, inputs={4})
+        chains = [[n.value for n in chain] for chain in g.linear_chains()]
+        self.assertEqual(len(chains), 4)
+        self.assertEqual(chains[0], [0])
+        self.assertEqual(sorted(chains[1:3]), [[1], [2]])
+        self.assertEqual(chains[3], [3, 4, 5])
+
+        chains = g.linear_chains(can_link=lambda parent, child: parent.value != 4)
+        chains = [[n.value for n in chain] for chain in chains]
+        self.assertEqual(chains[-2:], [[3, 4], [5]])
+
     def test_dependency_resolver(self):
         g = self.make_diamond()
         resolver = g.dependency_resolver()
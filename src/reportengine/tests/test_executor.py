@@ -45,6 +45,16 @@ def node_3(node_2_1_result, node_2_2_result, param=None):
     return (node_2_1_result + node_2_2_result) * (param // 2)
 
 
+def node_4(node_3_result):
+    print("Executing node_4")
+    return len(node_3_result)
+
+
+def node_5(node_4_result, param):
+    print("Executing node_5")
+    return node_4_result + param
+
+
 class TestResourceExecutor(unittest.TestCase, ResourceExecutor):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -93,6 +103,25 @@ class TestResourceExecutor(unittest.TestCase, ResourceExecutor):
         self.graph.add_node(node_2_2_call, inputs={node_1_call})
         self.graph.add_node(node_3_call, inputs={node_2_1_call, node_2_2_call})
 
+        self.nsspec = nsspec
+        self.node_3_call = node_3_call
+
+    def _add_chain(self):
+        """
+        Append a linear chain node_3 -> node_4 -> node_5 to the diamond.
+        """
+        node_4_call = CallSpec(
+            node_4, ("node_3_result",), "node_4_result", self.nsspec(node_4)
+        )
+        node_5_call = CallSpec(
+            node_5,
+            ("node_4_result", "param"),
+            "node_5_result",
+            self.nsspec(node_5),
+        )
+        self.graph.add_node(node_4_call, inputs={self.node_3_call})
+        self.graph.add_node(node_5_call, inputs={node_4_call})
+
     def _test_ns(self, promise=False):
         """
         Asserts that the namespace contains the expected results.
@@ -120,6 +149,21 @@ class TestResourceExecutor(unittest.TestCase, ResourceExecutor):
         self._test_ns(promise=True)
         client.close()
 
+    def test_parallel_execute_fused(self):
+        """
+        Execute the DAG in parallel fusing the linear chain at the end.
+        Every node of the chain must still have its result in the
+        namespace.
+        """
+        self._add_chain()
+        chains = self.graph.linear_chains()
+        self.assertEqual(len(chains[-1]), 3)
+        client = self.execute_parallel(fuse_chains=True)
+        self._test_ns(promise=True)
+        self.assertEqual(self.rootns["node_4_result"].result(), 160)
+        self.assertEqual(self.rootns["node_5_result"].result(), 164)
+        client.close()
+
 
 if __name__ == "__main__":
     unittest.main()
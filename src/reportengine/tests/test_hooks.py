@@ -0,0 +1,87 @@
+"""
+test_hooks.py
+
+Tests for the execution plugin interface.
+"""
+import numpy as np
+import pytest
+
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget
+from reportengine.hooks import ExecutionHook, result_size
+
+
+class Recorder(ExecutionHook):
+    def __init__(self):
+        self.events = []
+
+    def on_graph_built(self, graph):
+        self.events.append(('graph', len(graph)))
+
+    def on_node_start(self, spec):
+        self.events.append(('start', spec.resultname))
+
+    def on_node_end(self, spec, duration, size):
+        assert duration >= 0
+        self.events.append(('end', spec.resultname, size))
+
+    def on_node_error(self, spec, error):
+        self.events.append(('error', spec.resultname, type(error)))
+
+    def on_run_end(self):
+        self.events.append(('run_end',))
+
+
+class Provider:
+    def array(self, n):
+        return np.zeros(n)
+
+    def total(self, array):
+        return array.sum()
+
+    def broken(self, array):
+        raise ValueError("Broken")
+
+
+def make_builder(target, hook):
+    builder = ResourceBuilder(Config({'n': 10}), Provider(),
+                              [FuzzyTarget(target, (), (), ())])
+    builder.add_hook(hook)
+    builder.resolve_fuzzytargets()
+    return builder
+
+
+def test_sequential_hooks():
+    hook = Recorder()
+    builder = make_builder('total', hook)
+    builder.execute_sequential()
+    assert hook.events == [
+        ('graph', 2),
+        ('start', 'array'),
+        ('end', 'array', 80),
+        ('start', 'total'),
+        ('end', 'total', result_size(np.float64(0))),
+        ('run_end',),
+    ]
+
+
+def test_error_hooks():
+    hook = Recorder()
+    builder = make_builder('broken', hook)
+    with pytest.raises(ValueError):
+        builder.execute_sequential()
+    assert hook.events[-2:] == [('error', 'broken', ValueError), ('run_end',)]
+
+
+def test_parallel_hooks():
+    hook = Recorder()
+    builder = make_builder('total', hook)
+    client = builder.execute_parallel()
+    client.close()
+    events = hook.events
+    assert events[0] == ('graph', 2)
+    assert events[-1] == ('run_end',)
+    assert {e[1] for e in events if e[0] == 'start'} == {'array', 'total'}
+    ends = {e[1]: e[2] for e in events if e[0] == 'end'}
+    assert ends.keys() == {'array', 'total'}
+    assert ends['array'] >= 80
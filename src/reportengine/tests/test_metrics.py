@@ -0,0 +1,49 @@
+"""
+test_metrics.py
+
+Tests for the metrics file exporter.
+"""
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget
+from reportengine.metrics import MetricsHook, increment
+from reportengine.tests.utils import tmp, counters
+
+
+class Provider:
+    def double(self, x):
+        return 2*x
+
+    def total(self, double):
+        return double + 1
+
+
+def test_metrics_file(tmp, counters):
+    figures = tmp/'figures'
+    figures.mkdir()
+    (figures/'plot.png').write_bytes(b'x'*10)
+    path = tmp/'metrics.prom'
+    hook = MetricsHook(path, labels={'app': 'test "app"'},
+                       output_folders={'figures': figures})
+    builder = ResourceBuilder(Config({'x': 3}), Provider(),
+                              [FuzzyTarget('total', (), (), ())])
+    builder.add_hook(hook)
+    builder.resolve_fuzzytargets()
+    assert 'reportengine_graph_nodes{app="test \\"app\\""} 2' in path.read_text()
+
+    increment('test_events_total', 2, kind='a')
+    builder.execute_sequential()
+    text = path.read_text()
+    lines = text.splitlines()
+    assert '# TYPE reportengine_provider_calls_total counter' in lines
+    assert ('reportengine_provider_calls_total'
+            '{app="test \\"app\\"",provider="double"} 1') in lines
+    assert ('reportengine_output_bytes'
+            '{app="test \\"app\\"",kind="figures"} 10') in lines
+    assert ('reportengine_test_events_total'
+            '{app="test \\"app\\"",kind="a"} 2.0') in lines
+    assert 'reportengine_run_finished{app="test \\"app\\""} 1' in lines
+    assert any(line.startswith('reportengine_build_seconds') for line in lines)
+    assert any(line.startswith('reportengine_peak_rss_bytes') for line in lines)
+    assert counters() == {('test_events_total', (('kind', 'a'),)): 2}
+    #No temporary files are left behind
+    assert [p.name for p in tmp.iterdir() if p.is_file()] == ['metrics.prom']
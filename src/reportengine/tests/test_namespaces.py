@@ -7,7 +7,9 @@ Created on Fri Mar  4 17:02:38 2016
 from __future__ import generator_stop
 import unittest
 import copy
+import gc
 import itertools
+import pickle
 
 from reportengine import namespaces
 
@@ -112,6 +114,111 @@ class TestNamespaces(unittest.TestCase):
 
 
 
+    def test_nsspec(self):
+        spec = namespaces.as_nsspec(('a', ('c', 1)))
+        self.assertIs(spec, namespaces.as_nsspec(['a', ('c', 1)]))
+        self.assertIs(spec.parent, namespaces.as_nsspec(('a',)))
+        self.assertIs(spec.parent.child(('c', 1)), spec)
+        self.assertIs(spec.ancestor(2), namespaces.as_nsspec(()))
+        self.assertEqual(spec, ('a', ('c', 1)))
+        self.assertEqual(hash(spec), hash(('a', ('c', 1))))
+        self.assertEqual(spec[:-1], ('a',))
+        self.assertIs(pickle.loads(pickle.dumps(spec)), spec)
+        #The specs that are no longer used are removed from the tree.
+        parent = spec.parent
+        del spec
+        gc.collect()
+        self.assertNotIn(('c', 1), parent._children)
+
+    def test_resolve_roots(self):
+        #The namespaces attached to the specs don't leak between roots.
+        d1 = copy.deepcopy(d)
+        d2 = copy.deepcopy(d)
+        d2['a'][4] = 'other'
+        spec = ('a', 'b')
+        for _ in range(2):
+            ns1 = namespaces.resolve(d1, spec)
+            ns2 = namespaces.resolve(d2, spec)
+            self.assertEqual(ns1[4], 5)
+            self.assertEqual(ns2[4], 'other')
+        self.assertIs(namespaces.resolve(ns1.maps[-1], spec), ns1)
+        deep = namespaces.resolve(d1, ('a', 'b', ('c', 0), ('l2', 0)))
+        self.assertIs(deep.maps[2], ns1.maps[0])
+        self.assertTrue(deep['nested'])
+
+    def test_expansion_cache(self):
+        ns = ChainMap()
+        ns['l'] = [{'x': 1}, {'x': 2}]
+        ns['m'] = {'y': 3}
+        fuzzy = ('l', 'm')
+        res = namespaces.expand_fuzzyspec(ns, fuzzy)
+        self.assertEqual(res, [(('l', 0), 'm'), (('l', 1), 'm')])
+        self.assertIsNotNone(namespaces.get_cached_expansion(ns, fuzzy))
+        self.assertEqual(namespaces.expand_fuzzyspec(ns, fuzzy), res)
+        #Writing one of the keys invalidates the expansion
+        ns['l'] = [{'x': 1}]
+        self.assertIsNone(namespaces.get_cached_expansion(ns, fuzzy))
+        self.assertEqual(namespaces.expand_fuzzyspec(ns, fuzzy),
+                         [(('l', 0), 'm')])
+        #Also when the key is shadowed in a deeper level
+        namespaces.resolve(ns, (('l', 0),)).maps[0]['m'] = [{}, {}]
+        self.assertEqual(namespaces.expand_fuzzyspec(ns, fuzzy),
+                         [(('l', 0), ('m', 0)), (('l', 0), ('m', 1))])
+        #Lists modified in place
+        ns['l'].append({'x': 2})
+        self.assertIsNone(namespaces.get_cached_expansion(ns, fuzzy))
+        self.assertEqual(len(namespaces.expand_fuzzyspec(ns, fuzzy)), 3)
+        #Levels that are plain dictionaries
+        d = {'l': [{}]}
+        self.assertEqual(namespaces.expand_fuzzyspec(d, ('l',)), [(('l', 0),)])
+        d['l'] = [{}, {}]
+        self.assertIsNone(namespaces.get_cached_expansion(d, ('l',)))
+        self.assertEqual(len(namespaces.expand_fuzzyspec(d, ('l',))), 2)
+
+    def test_iter_fuzzyspec(self):
+        n = 1000
+        d = {'l1': [{} for _ in range(n)], 'l2': [{} for _ in range(n)],
+             'l3': [{} for _ in range(n)]}
+        fuzzy = ('l1', 'l2', 'l3')
+        it = namespaces.iter_fuzzyspec(d, fuzzy)
+        first = list(itertools.islice(it, n + 1))
+        self.assertEqual(first[0], (('l1', 0), ('l2', 0), ('l3', 0)))
+        self.assertEqual(first[-1], (('l1', 0), ('l2', 1), ('l3', 0)))
+        self.assertEqual(list(namespaces.iter_fuzzyspec(self.d, ('c', 'l2'))),
+                         namespaces.expand_fuzzyspec(self.d, ('c', 'l2')))
+        with self.assertRaises(namespaces.ElementNotFound):
+            list(namespaces.iter_fuzzyspec(self.d, ('c', 'xx')))
+
+    def test_nslist_view(self):
+        l = namespaces.NSList([1, 2], nskey='x')
+        view = l.as_namespace()
+        self.assertIs(l.as_namespace(), view)
+        self.assertEqual(view, [{'x': 1}, {'x': 2}])
+        l.append(3)
+        self.assertEqual(view[2], {'x': 3})
+        #Each resolution gets its own level
+        self.assertIsNot(view[0], view[0])
+        cp = copy.copy(l)
+        self.assertIsNot(cp.as_namespace(), view)
+        cp.append(4)
+        self.assertEqual(len(view), 3)
+
+        root = ChainMap()
+        root['l'] = l
+        ns = namespaces.resolve(root, (('l', 1),))
+        self.assertEqual(ns['x'], 2)
+
+    def test_nsitem(self):
+        d = namespaces.NSItemsDict({'a': [1]}, nskey='x')
+        item = d.nsitem('a')
+        self.assertEqual(item, {'x': [1]})
+        self.assertIs(d.nsitem('a'), item)
+        d['a'] = [2]
+        self.assertEqual(d.nsitem('a'), {'x': [2]})
+        #The shared items are not written through the namespace.
+        ns = namespaces.extract_nsval(d, 'a')
+        ns['y'] = 1
+        self.assertNotIn('y', d.nsitem('a'))
 
 
 
@@ -0,0 +1,121 @@
+"""
+test_plan.py
+
+Tests for the execution plan summary.
+"""
+import threading
+
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget, collect
+from reportengine.plan import DurationHistory, make_plan, format_plan
+from reportengine.figure import figure
+from reportengine.tests.utils import tmp
+
+TIMEOUT = 10
+
+
+class Provider:
+    def double(self, x):
+        return 2*x
+
+    @figure
+    def plot(self, double):
+        return double
+
+    doubles = collect('double', ('xs',))
+
+    def total(self, doubles):
+        return sum(doubles)
+
+
+def test_plan(tmp):
+    inp = {'xs': [{'x': i} for i in range(4)]}
+    targets = [FuzzyTarget('total', (), (), ()),
+               FuzzyTarget('plot', ('xs',), (), ())]
+    builder = ResourceBuilder(Config(inp), Provider(), targets)
+    path = tmp/'history.json'
+    builder.add_hook(DurationHistory(path))
+    builder.resolve_fuzzytargets()
+
+    plan = make_plan(builder.graph, builder.rootns, figure_formats=2)
+    assert plan['nodes'] == 10
+    assert plan['providers']['double'] == 4
+    assert plan['providers']['plot'] == 4
+    assert [(spec.resultname, n) for spec, n in plan['collect_fanouts']] == [
+        ('doubles', 4)]
+    assert plan['depth'] == 3
+    assert plan['width'] == 5
+    assert plan['files']['figure'] == 8
+    assert plan['unknown_durations']['double'] == 4
+    assert 'doubles (in root)' in format_plan(plan)
+
+    #Fake a previous run in which each node took one second.
+    path.write_text('{"double": [2, 2.0], "total": [1, 1.0]}')
+    plan = make_plan(builder.graph, builder.rootns,
+                     durations=DurationHistory.load_means(path))
+    assert plan['estimated_total_time'] == 5
+    assert plan['estimated_critical_path_time'] == 2
+    assert set(plan['unknown_durations']) == {'plot'}
+
+
+def test_history(tmp):
+    path = tmp/'cache'/'history.json'
+    builder = ResourceBuilder(Config({'x': 3}), Provider(),
+                              [FuzzyTarget('double', (), (), ())])
+    builder.add_hook(DurationHistory(path))
+    builder.resolve_fuzzytargets()
+    builder.execute_sequential()
+    assert DurationHistory.load(path)['double'][0] == 1
+
+    builder = ResourceBuilder(Config({'x': 3}), Provider(),
+                              [FuzzyTarget('double', (), (), ())])
+    builder.add_hook(DurationHistory(path))
+    builder.resolve_fuzzytargets()
+    builder.execute_sequential()
+    assert DurationHistory.load(path)['double'][0] == 2
+    assert set(DurationHistory.load_means(path)) == {'double'}
+
+    #Concurrent runs add their records
+    node, = builder.graph
+    first, second = DurationHistory(path), DurationHistory(path)
+    for hook in (first, second):
+        hook.on_node_end(node.value, 1., None)
+    first.on_run_end()
+    second.on_run_end()
+    assert DurationHistory.load(path)['double'][0] == 4
+    assert sorted(p.name for p in path.parent.iterdir()) == [
+        '.history.json.lock', 'history.json']
+
+
+class PausedHistory(DurationHistory):
+    """Wait for ``proceed`` after loading the file."""
+    def __init__(self, path, loaded, proceed):
+        super().__init__(path)
+        self.loaded = loaded
+        self.proceed = proceed
+
+    def load(self, path):
+        res = DurationHistory.load(path)
+        self.loaded.set()
+        self.proceed.wait(TIMEOUT)
+        return res
+
+
+def test_history_overlapping_runs(tmp):
+    path = tmp/'history.json'
+    loaded, proceed = threading.Event(), threading.Event()
+    first = PausedHistory(path, loaded, proceed)
+    second = DurationHistory(path)
+    first.records = {'double': [1, 1.]}
+    second.records = {'double': [2, 1.]}
+    thread = threading.Thread(target=first.on_run_end)
+    thread.start()
+    assert loaded.wait(TIMEOUT)
+    #The second run loads the file after the first one writes it.
+    other = threading.Thread(target=second.on_run_end)
+    other.start()
+    other.join(0.2)
+    proceed.set()
+    thread.join()
+    other.join()
+    assert DurationHistory.load(path)['double'] == [3, 2.]
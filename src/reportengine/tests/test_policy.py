@@ -0,0 +1,123 @@
+"""
+test_policy.py
+
+Tests for the timeout and retry policies of providers.
+"""
+import os
+import time
+
+import pytest
+
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget
+from reportengine.policy import (execution_policy, run_with_policy,
+                                 ProviderTimeoutError)
+from reportengine.tests.utils import tmp
+
+
+class Flaky:
+    def __init__(self, failures, exc=OSError):
+        self.failures = failures
+        self.calls = 0
+        self.exc = exc
+
+    def __call__(self, x):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc("Flaky failure")
+        return x
+
+
+def test_retries():
+    f = Flaky(2)
+    execution_policy(retries=2, delay=0)(f)
+    assert run_with_policy(f.execution_policy, f, (), {'x': 1}) == 1
+    assert f.calls == 3
+
+    f = Flaky(3)
+    execution_policy(retries=2, delay=0)(f)
+    with pytest.raises(OSError):
+        run_with_policy(f.execution_policy, f, (), {'x': 1})
+    assert f.calls == 3
+
+    f = Flaky(1, exc=KeyError)
+    execution_policy(retries=2, delay=0, retry_on=OSError)(f)
+    with pytest.raises(KeyError):
+        run_with_policy(f.execution_policy, f, (), {'x': 1})
+    assert f.calls == 1
+
+
+def test_timeout():
+    @execution_policy(timeout=0.05)
+    def slow():
+        time.sleep(5)
+
+    t0 = time.monotonic()
+    with pytest.raises(ProviderTimeoutError):
+        run_with_policy(slow.execution_policy, slow, (), {})
+    assert time.monotonic() - t0 < 1
+
+    #Not retried while the first attempt is still running
+    calls = []
+    @execution_policy(timeout=0.05, retries=2, delay=0)
+    def slow_once():
+        calls.append(1)
+        time.sleep(0.5)
+
+    with pytest.raises(ProviderTimeoutError):
+        run_with_policy(slow_once.execution_policy, slow_once, (), {})
+    assert len(calls) == 1
+
+    execution_policy(timeout=0.05, retries=2, delay=0,
+                     rerun_after_timeout=True)(slow_once)
+    with pytest.raises(ProviderTimeoutError):
+        run_with_policy(slow_once.execution_policy, slow_once, (), {})
+    assert len(calls) == 4
+
+    with pytest.raises(ValueError):
+        execution_policy(timeout=0)
+
+
+class Provider:
+    def __init__(self):
+        self.calls = 0
+
+    @execution_policy(retries=1, delay=0)
+    def flaky(self, x):
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError("Flaky failure")
+        return x
+
+
+def test_sequential_policy():
+    provider = Provider()
+    builder = ResourceBuilder(Config({'x': 3}), provider,
+                              [FuzzyTarget('flaky', (), (), ())])
+    builder.resolve_fuzzytargets()
+    builder.execute_sequential()
+    assert builder.rootns['flaky'] == 3
+    assert provider.calls == 2
+
+
+class FileProvider:
+    """Fails the first time, keeping the state in a file, since the dask
+    workers run on copies of the provider."""
+    @execution_policy(retries=1, delay=0)
+    def flaky(self, marker):
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            raise OSError("Flaky failure")
+        return 'done'
+
+
+def test_parallel_policy(tmp):
+    marker = str(tmp/'marker')
+    builder = ResourceBuilder(Config({'marker': marker}), FileProvider(),
+                              [FuzzyTarget('flaky', (), (), ())])
+    builder.resolve_fuzzytargets()
+    client = builder.execute_parallel()
+    try:
+        assert builder.rootns['flaky'].result() == 'done'
+    finally:
+        client.close()
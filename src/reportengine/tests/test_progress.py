@@ -0,0 +1,67 @@
+"""
+test_progress.py
+
+Tests for the progress reporting plugin.
+"""
+import io
+import logging
+import time
+
+import pytest
+
+from reportengine.configparser import Config
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget, collect
+from reportengine.progress import ProgressHook
+
+
+class Provider:
+    def slow(self, x):
+        time.sleep(0.01)
+        return x
+
+    def total(self, slows):
+        return sum(slows)
+
+    slows = collect('slow', ('xs',))
+
+
+def test_progress(caplog):
+    inp = {'xs': [{'x': i} for i in range(5)]}
+    builder = ResourceBuilder(Config(inp), Provider(),
+                              [FuzzyTarget('total', (), (), ())])
+    stream = io.StringIO()
+    hook = ProgressHook(stream=stream, interval=0)
+    builder.add_hook(hook)
+    builder.resolve_fuzzytargets()
+    assert hook.total == 7
+
+    with caplog.at_level(logging.INFO, logger='reportengine.progress'):
+        builder.execute_sequential()
+    assert builder.rootns['total'] == 10
+    lines = [r.getMessage() for r in caplog.records]
+    assert lines[0].startswith("Progress: [1/7]")
+    assert lines[-1].startswith("Progress: [7/7] | 100%")
+    assert hook.remaining_time() == 0
+    #Not a terminal
+    assert not stream.getvalue()
+
+
+def test_eta():
+    inp = {'xs': [{'x': i} for i in range(4)]}
+    builder = ResourceBuilder(Config(inp), Provider(),
+                              [FuzzyTarget('total', (), (), ())])
+    hook = ProgressHook(stream=io.StringIO(), interval=3600)
+    builder.add_hook(hook)
+    builder.resolve_fuzzytargets()
+    nodes = list(builder.graph)
+    #Pretend the first element took one second
+    hook.on_node_start(nodes[0].value)
+    hook.on_node_end(nodes[0].value, 1., None)
+    hook._t0 -= 1
+    slows = [n for n in nodes if n.value.resultname == 'slow']
+    assert len(slows) == 4
+    #Three more 'slow' nodes, running one at a time, plus the collect and
+    #'total', which are estimated from the mean.
+    eta = hook.remaining_time()
+    assert eta == pytest.approx(5, abs=0.1)
+    assert "ETA" in hook.status_line()
@@ -0,0 +1,65 @@
+"""
+test_registry.py
+
+Tests for the provider registry.
+"""
+import types
+
+import pytest
+
+from reportengine.registry import ProviderRegistry
+
+
+def f(x):
+    return x
+
+def g(x):
+    return 2*x
+
+
+class Dynamic:
+    def __getattr__(self, name):
+        if name == 'dynamic':
+            return f
+        raise AttributeError(name)
+
+
+def test_registry():
+    first = types.ModuleType('first')
+    first.f = f
+    first.empty = None
+    second = types.ModuleType('second')
+    second.f = g
+    second.g = g
+    second.empty = g
+    second.shared = f
+    first.shared = f
+    registry = ProviderRegistry([first, second, Dynamic()])
+
+    assert registry.get('f') is f
+    assert registry.get('g') is g
+    #Falsy values are skipped, as with the linear scan
+    assert registry.get('empty') is g
+    assert registry.get('dynamic') is f
+    assert 'f' in registry
+    assert 'dynamic' in registry
+    assert 'missing' not in registry
+    with pytest.raises(AttributeError):
+        registry.get('missing')
+
+    conflicts = registry.conflicts()
+    assert conflicts['f'] == [first, second]
+    assert 'shared' not in conflicts
+    assert 'empty' not in conflicts
+    assert 'f: defined in first, second' in registry.format_conflicts()
+
+
+def test_single_provider():
+    class Provider:
+        def f(self):
+            pass
+
+    registry = ProviderRegistry(Provider())
+    assert registry.get('f').__func__ is Provider.f
+    assert registry.provider_names() == []
+    assert registry.conflicts() == {}
@@ -0,0 +1,54 @@
+"""
+test_spill.py
+
+Tests for writing large results to memory mapped files.
+"""
+import numpy as np
+import pandas as pd
+
+from reportengine.spill import Spiller
+from reportengine.table import Table
+from reportengine.tests.utils import tmp
+
+
+def test_spill_array(tmp):
+    spiller = Spiller(threshold=1000, folder=tmp)
+    small = np.arange(10.)
+    assert spiller(small) is small
+
+    big = np.arange(1000.)
+    res = spiller(big)
+    assert isinstance(res, np.memmap)
+    np.testing.assert_array_equal(res, big)
+    assert spiller.bytes_spilled == big.nbytes
+    #Each spiller writes in its own folder
+    other = Spiller(threshold=1000, folder=tmp)
+    other(big)
+    assert spiller.folder.parent == other.folder.parent == tmp
+    assert spiller.folder != other.folder
+    assert len(list(spiller.folder.iterdir())) == 1
+    #Copy on write: the result is writable but the file is not modified
+    res[0] = 7
+    assert np.load(next(spiller.folder.iterdir()))[0] == 0
+
+    objects = np.array([object()]*1000)
+    assert spiller(objects) is objects
+    spiller.cleanup()
+    assert list(tmp.iterdir()) == [other.folder]
+
+
+def test_spill_frame(tmp):
+    spiller = Spiller(threshold=1000)
+    df = pd.DataFrame(np.random.rand(100, 3), columns=list('abc'),
+                      index=range(100, 200))
+    res = spiller(df)
+    assert res is not df
+    pd.testing.assert_frame_equal(res, df)
+    assert spiller.bytes_spilled == df.to_numpy().nbytes
+
+    mixed = df.assign(d='x')
+    assert spiller(mixed) is mixed
+    table = Table.fromdf(df)
+    assert spiller(table) is table
+    spiller.cleanup()
+    assert not spiller.folder.exists()
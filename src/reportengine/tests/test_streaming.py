@@ -0,0 +1,81 @@
+"""
+test_streaming.py
+
+Tests for streaming the items of generator providers to their consumers.
+"""
+import time
+
+import pytest
+
+from reportengine.streaming import stream, prefetch
+from reportengine.resourcebuilder import ResourceExecutor
+
+
+def test_stream_lazy():
+    events = []
+    def gen():
+        for i in range(3):
+            events.append(('produce', i))
+            yield i
+
+    for i in stream(gen()):
+        events.append(('consume', i))
+    assert events == [(tp, i) for i in range(3)
+                      for tp in ('produce', 'consume')]
+
+
+def test_stream_prefetch():
+    produced = []
+    def gen():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    it = stream(gen(), maxsize=2)
+    assert next(it) == 0
+    #Wait for the producer to fill the buffer
+    for _ in range(50):
+        if len(produced) >= 4:
+            break
+        time.sleep(0.02)
+    #One consumed, two in the buffer and one blocked on put
+    assert len(produced) == 4
+    assert list(it) == list(range(1, 10))
+
+
+def test_stream_errors():
+    def gen():
+        yield 1
+        raise KeyError("bad")
+
+    it = stream(gen(), maxsize=1)
+    assert next(it) == 1
+    with pytest.raises(KeyError):
+        next(it)
+    with pytest.raises(ValueError):
+        prefetch(-1)
+
+
+def test_final_action_streaming():
+    events = []
+    def gen(n):
+        for i in range(n):
+            events.append(('produce', i))
+            yield i
+
+    def save(items, suffix):
+        res = []
+        for i in items:
+            events.append(('save', i))
+            res.append(f"{i}{suffix}")
+        return res
+
+    def provider(n):
+        return list(gen(n))
+    provider.generator = gen
+    provider.final_action = save
+
+    res = ResourceExecutor.get_result(provider, {'n': 2}, {'suffix': '.png'})
+    assert res == ['0.png', '1.png']
+    assert events == [('produce', 0), ('save', 0), ('produce', 1),
+                      ('save', 1)]
@@ -0,0 +1,137 @@
+"""
+test_threadedbuild.py
+
+Tests for resolving the targets with several threads.
+"""
+import logging
+import threading
+
+import pytest
+
+from reportengine import namespaces
+from reportengine.configparser import (Config, ConfigError, BadInputType,
+                                       prefetchable)
+from reportengine.utils import ChainMap
+from reportengine.resourcebuilder import ResourceBuilder, FuzzyTarget
+
+#Waiting for longer than this means that the calls that should run
+#concurrently did not.
+TIMEOUT = 10
+
+
+class SlowConfig(Config):
+    """Config where the parse functions for the names in ``barriers`` wait
+    for the corresponding ``threading.Barrier``, so that they only finish
+    if enough of them run at the same time."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+        self.calls_lock = threading.Lock()
+        self.barriers = {}
+
+    def _record(self, name):
+        with self.calls_lock:
+            self.calls.append(name)
+        barrier = self.barriers.get(name)
+        if barrier is not None:
+            barrier.wait(TIMEOUT)
+
+    @prefetchable
+    def parse_shared(self, value:int):
+        self._record('shared')
+        return value
+
+    @prefetchable
+    def parse_big(self, value:int):
+        self._record('big')
+        return value
+
+    def parse_table(self, name:str, shared):
+        self._record(name)
+        if name == 'bad':
+            raise ConfigError("Bad table")
+        return (name, shared)
+
+
+class Provider:
+    def summary(self, table, big):
+        return table
+
+
+def make_builder(tables, provider):
+    inp = {'shared': 1, 'big': 2, **{f'ns{i}': {'table': t} for i, t in enumerate(tables)}}
+    targets = [FuzzyTarget('summary', (f'ns{i}',), (), ())
+               for i in range(len(tables))]
+    return ResourceBuilder(SlowConfig(inp), provider, targets)
+
+
+def edges(graph):
+    return {n.value: {i.value for i in n.inputs} for n in graph}
+
+
+def test_threaded_build():
+    tables = ['a', 'b', 'c', 'd']
+    provider = Provider()
+
+    sequential = make_builder(tables, provider)
+    sequential.resolve_fuzzytargets()
+
+    threaded = make_builder(tables, provider)
+    #All the tables are parsed at the same time
+    barrier = threading.Barrier(len(tables))
+    threaded.input_parser.barriers = dict.fromkeys(tables, barrier)
+    threaded.resolve_fuzzytargets(threads=4)
+    assert (sorted(threaded.input_parser.calls) ==
+            sorted(sequential.input_parser.calls))
+    #The root value needed by all the targets is computed only once.
+    assert threaded.input_parser.calls.count('big') == 1
+    assert edges(threaded.graph) == edges(sequential.graph)
+    assert threaded.input_parser.build_lock is None
+
+    threaded.execute_sequential()
+    assert namespaces.resolve(threaded.rootns, ('ns2',))['summary'] == ('c', 1)
+
+
+def test_threaded_build_error():
+    builder = make_builder(['a', 'bad', 'c'], Provider())
+    with pytest.raises(ConfigError, match="Bad table"):
+        builder.resolve_fuzzytargets(threads=2)
+
+
+def test_prefetch_inputs(caplog):
+    c = SlowConfig.from_yaml("shared: 1\nbig: 2\ntable: a\n")
+    #Both are parsed at the same time
+    barrier = threading.Barrier(2)
+    c.barriers = {'shared': barrier, 'big': barrier}
+    #parse_table is not prefetchable
+    assert c.prefetch_inputs(threads=2) == ['shared', 'big']
+    ns = ChainMap()
+    assert c.resolve_key('shared', ns)[1] == 1
+    assert c.resolve_key('big', ns)[1] == 2
+    assert sorted(c.calls) == ['big', 'shared']
+    assert c.resolve_key('table', ns)[1] == ('a', 1)
+    c.finish_prefetch()
+
+    c = SlowConfig.from_yaml("shared: wrong\nbig: wrong\n")
+    c.prefetch_inputs(threads=2)
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(BadInputType):
+            c.resolve_key('big', ChainMap())
+    assert "Failed processing key 'big' at line 2" in caplog.text
+    #The errors of the keys that are never resolved are reported
+    with caplog.at_level(logging.WARNING):
+        c.finish_prefetch()
+    assert "Prefetching the unused key 'shared' failed" in caplog.text
+    assert c._prefetched == {} and c._prefetch_executor is None
+
+    #Nested keys with the same name don't take the prefetched value
+    c = SlowConfig.from_yaml("shared: wrong\nns0: {shared: 5}\n")
+    c.prefetch_inputs(threads=1)
+    ns = ChainMap()
+    c.resolve_key('ns0', ns)
+    assert ns['ns0']['shared'] == 5
+    assert list(c._prefetched) == ['shared']
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        c.finish_prefetch()
+    assert "Prefetching the unused key 'shared' failed" in caplog.text
@@ -2,7 +2,16 @@
 Tests for the utils module.
 """
 
-from reportengine.utils import get_classmembers
+import functools
+import gc
+import inspect
+import pickle
+
+import pytest
+
+from reportengine import utils
+from reportengine.utils import (get_classmembers, get_signature, ChainMap,
+                                NSFrame, NSOverlay)
 
 class Meta(type):
     @property
@@ -22,3 +31,111 @@ def test_get_classmembers():
     assert list(m) == ['b', 'd', 'c']
     assert m['b'] == 4
 
+
+def test_get_signature():
+    def f(a, b=1):
+        pass
+
+    class C:
+        def method(self, x, y:int):
+            pass
+
+    assert get_signature(f) is get_signature(f)
+    assert get_signature(f) == inspect.signature(f)
+    #Different method objects share the cache
+    assert get_signature(C().method) is get_signature(C().method)
+    assert list(get_signature(C().method).parameters) == ['x', 'y']
+    p = functools.partial(f, b=2)
+    assert get_signature(p) == inspect.signature(p)
+    #The cache doesn't keep the functions alive.
+    n = len(utils._signature_cache)
+    del f, p
+    gc.collect()
+    assert len(utils._signature_cache) == n - 1
+
+
+def test_chainmap_cache():
+    root = ChainMap()
+    root['a'] = 'root'
+    child = root.new_child()
+    grandchild = child.new_child(NSFrame(b=1))
+    assert grandchild._index is not None
+    assert grandchild['a'] == 'root'
+    assert grandchild.get_where('a') == (2, 'root')
+    assert 'c' not in grandchild
+    #Writing to the maps directly shadows the cached lookups.
+    child.maps[0]['a'] = 'child'
+    assert grandchild.get_where('a') == (1, 'child')
+    assert root['a'] == 'root'
+    grandchild.maps[2]['c'] = 3
+    assert grandchild['c'] == 3
+    del child.maps[0]['a']
+    assert grandchild['a'] == 'root'
+    child.maps[0].update(a='updated')
+    assert grandchild['a'] == 'updated'
+    assert child.maps[0].pop('a') == 'updated'
+    assert grandchild.get('a') == 'root'
+    with pytest.raises(KeyError):
+        grandchild['missing']
+
+    base = {'x': 1}
+    overlay = NSOverlay(base)
+    ns = grandchild.new_child(overlay)
+    assert ns._index is not None
+    assert overlay.local is None
+    ns.maps[0]['x'] = 2
+    assert ns['x'] == 2 and base['x'] == 1
+    assert dict(overlay) == {'x': 2}
+    del overlay['x']
+    assert ns['x'] == 1
+    with pytest.raises(KeyError):
+        del overlay['x']
+
+    #The keys of a base that is not tracked must not change.
+    base['y'] = 1
+    with pytest.raises(RuntimeError):
+        ns['y']
+    del base['y']
+
+    copied = pickle.loads(pickle.dumps(ns))
+    assert dict(copied) == dict(ns)
+    assert isinstance(copied.maps[-1], NSFrame)
+    assert copied._gens is not None and copied._gens is not ns._gens
+
+    #Each tree has its own generations, which go away with it.
+    other = ChainMap().new_child().new_child().new_child()
+    assert other._index is not None
+    assert other._gens is not ns._gens
+    grandchild.maps[0]['other'] = 1
+    assert 'other' not in other._gens._keys
+    shared = NSFrame(z=1)
+    overlay = NSOverlay(shared)
+    ns.new_child(overlay)
+    #Writes to a frame of a different tree can't be tracked.
+    assert other.new_child(NSOverlay(shared))._index is None
+    shared['w'] = 2
+    assert ns.new_child(overlay)['w'] == 2
+
+    #Plain dictionaries are scanned each time.
+    plain = ChainMap({'y': 1}, {})
+    assert plain._index is None
+    plain.maps[0]['z'] = 1
+    assert plain.get_where('z') == (0, 1)
+
+
+def test_load_yaml_cached(tmp_path):
+    text = "a: 1\nb: [{c: 2}, {d: [3, 4]}]\n"
+    expected = {'a': 1, 'b': [{'c': 2}, {'d': [3, 4]}]}
+    assert utils.load_yaml_cached(text) == expected
+    assert utils.load_yaml_cached(text, tmp_path) == expected
+    path, = tmp_path.glob('*.pickle')
+    #The cached version is used
+    with open(path, 'wb') as f:
+        pickle.dump('cached', f)
+    assert utils.load_yaml_cached(text, tmp_path) == 'cached'
+    for i in range(3):
+        utils.load_yaml_cached(f"x: {i}", tmp_path, max_entries=2)
+    assert len(list(tmp_path.glob('*.pickle'))) == 2
+
+    assert utils.find_path(expected, expected['b'][1]['d']) == ('b', 1, 'd')
+    assert utils.find_path(expected, {'c': 2}) is None
@@ -7,9 +7,19 @@ from pathlib import Path
 
 import pytest
 
+from reportengine import metrics
+
 @pytest.fixture
 def tmp(tmpdir):
     """A fixture that returns a pathlib object representing
     a newly created temporary path."""
     return Path(tmpdir)
 
+
+@pytest.fixture
+def counters():
+    """A fixture that resets the counters of ``reportengine.metrics``
+    before and after the test, and returns ``get_counters``."""
+    metrics.reset_counters()
+    yield metrics.get_counters
+    metrics.reset_counters()
@@ -4,11 +4,21 @@ Collection of utilities needed in various parts of the library.
 
 import functools
 import collections
+import collections.abc
+import contextlib
+import hashlib
+import os
 import pickle
+import tempfile
 import inspect
+import itertools
 import re
 import importlib.util
 import pathlib
+import threading
+import types
+import weakref
+import ruamel.yaml
 from ruamel.yaml import YAML
 
 yaml_rt = YAML(typ="rt")
@@ -46,11 +56,100 @@ def normalize_name(name):
     return re.sub(bad, '', str(name))
 
 
+def load_yaml_cached(text, cache_folder=None, max_entries=16):
+    """Load the YAML document ``text`` with the fast safe loader, which
+    returns plain Python objects without line information. If
+    ``cache_folder`` is given, the result is pickled there, keyed by the
+    hash of the text, and reused the next time the same text is loaded.
+    Only the ``max_entries`` most recently used entries are kept."""
+    if cache_folder is None:
+        return yaml_safe.load(text)
+    digest = hashlib.sha256(
+        f'{ruamel.yaml.__version__}\n{text}'.encode()).hexdigest()
+    folder = pathlib.Path(cache_folder)
+    path = folder/f'{digest}.pickle'
+    try:
+        with open(path, 'rb') as f:
+            res = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    else:
+        #Mark as recently used
+        os.utime(path)
+        return res
+    res = yaml_safe.load(text)
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=folder, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, path)
+        entries = sorted(folder.glob('*.pickle'),
+                         key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in entries[max_entries:]:
+            old.unlink()
+    except OSError:
+        #The cache is only an optimization
+        pass
+    return res
+
+
+def find_path(obj, target):
+    """Return the tuple of keys and indexes leading from ``obj`` to
+    ``target`` (compared by identity) through nested mappings and lists,
+    or None if ``target`` is not found."""
+    stack = [(obj, ())]
+    while stack:
+        node, path = stack.pop()
+        if node is target:
+            return path
+        if isinstance(node, collections.abc.Mapping):
+            items = node.items()
+        elif isinstance(node, list):
+            items = enumerate(node)
+        else:
+            continue
+        stack.extend((v, (*path, k)) for k, v in items)
+    return None
+
+
+_signature_cache = weakref.WeakKeyDictionary()
+_bound_signature_cache = weakref.WeakKeyDictionary()
+
+def get_signature(func):
+    """Like ``inspect.signature``, but cached. The same provider, parse
+    and check functions are inspected many times while building the graph.
+
+    The cache is keyed weakly by the function, so that it doesn't keep
+    functions alive. Bound methods are cached by their underlying function,
+    since a new method object is created every time they are accessed.
+    Callables that cannot be weakly referenced, and partials (whose hash
+    can be expensive) are not cached. The ``__signature__`` attribute must
+    not be changed after the function has been inspected."""
+    if isinstance(func, functools.partial):
+        return inspect.signature(func)
+    if isinstance(func, types.MethodType):
+        #The signature of a bound method doesn't depend on the instance.
+        cache, key = _bound_signature_cache, func.__func__
+    else:
+        cache, key = _signature_cache, func
+    try:
+        return cache[key]
+    except (KeyError, TypeError):
+        pass
+    sig = inspect.signature(func)
+    try:
+        cache[key] = sig
+    except TypeError:
+        pass
+    return sig
+
+
 def saturate(func, d):
     """Call a function retrieving the arguments from d by name.
     Variable number of arguments is ignored, and the function cannot
     have positional only arguments."""
-    s = inspect.signature(func)
+    s = get_signature(func)
     #This doesn't work as it should
     #ba = s.bind(func, d)
     kwargs = {name: d[name] for name, param in s.parameters.items()
@@ -68,14 +167,424 @@ class comparepartial(functools.partial):
     def __hash__(self):
         return hash(pickle.dumps(self))
 
+class BuildLock:
+    """Reentrant lock serializing the construction of the graph when
+    targets are resolved by several threads. Unlike ``threading.RLock``,
+    it can be released completely with ``released``, regardless of how
+    many times the current thread has acquired it, so that other threads
+    can make progress while e.g. an expensive parse function runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __enter__(self):
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            self._lock.acquire()
+        self._local.depth = depth + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._local.depth -= 1
+        if not self._local.depth:
+            self._lock.release()
+
+    @contextlib.contextmanager
+    def released(self):
+        """Release the lock, if held by the current thread, for the
+        duration of the block."""
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            yield
+            return
+        self._local.depth = 0
+        self._lock.release()
+        try:
+            yield
+        finally:
+            self._lock.acquire()
+            self._local.depth = depth
+
+
+class Generations:
+    """Counters used to validate the lookups cached by the ``ChainMap``
+    objects of one tree of namespaces (a root namespace and the namespaces
+    derived from it). The generation of a key changes every time it is
+    written to or removed from an ``NSFrame`` of the tree. The counters
+    are shared by the namespaces and the frames of the tree and go away
+    with them. ``itertools.count`` is used so that the values never
+    repeat, even if several threads modify frames at the same time."""
+
+    __slots__ = ('_keys', '_counter')
+
+    def __init__(self):
+        self._keys = {}
+        self._counter = itertools.count(1)
+
+    def touch(self, key):
+        self._keys[key] = next(self._counter)
+
+
+class NSFrame(dict):
+    """A dictionary that records when its keys are written or removed, so
+    that the ``ChainMap`` objects containing it can cache where their keys
+    are found. It is attached to the ``Generations`` of a tree of
+    namespaces when it is first added to one of them."""
+
+    __slots__ = ('_gens',)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._gens = None
+
+    def __reduce__(self):
+        #The generations are only meaningful within a process.
+        return (type(self), (dict(self),))
+
+    def _touch(self, key):
+        gens = self._gens
+        if gens is not None:
+            gens.touch(key)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._touch(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._touch(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    _marker = object()
+
+    def pop(self, key, default=_marker):
+        if key in self:
+            res = dict.pop(self, key)
+            self._touch(key)
+            return res
+        if default is self._marker:
+            raise KeyError(key)
+        return default
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._touch(key)
+        return key, value
+
+    def clear(self):
+        keys = list(self)
+        dict.clear(self)
+        for key in keys:
+            self._touch(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def copy(self):
+        return type(self)(self)
+
+
+class NSOverlay(collections.abc.MutableMapping):
+    """A namespace level that reads from a shared mapping, ``base``, and
+    writes to an ``NSFrame`` (``local``) that is only created by the first
+    write, so that ``base`` itself is never modified.
+
+    The ``ChainMap`` objects containing the overlay cache their lookups.
+    If ``base`` is tracked (see ``ChainMap``) and is not part of another
+    tree, it becomes part of the tree of the overlay. Otherwise the keys
+    of ``base`` must not change: adding or removing keys after the
+    overlay is added to a tree makes the lookups through it fail with
+    ``RuntimeError``.
+
+    This replaces ``ChainMap({}, base)``, at a fraction of the memory."""
+
+    __slots__ = ('base', 'local', '_gens', '_baselen')
+
+    def __init__(self, base):
+        self.base = base
+        self.local = None
+        self._gens = None
+        self._baselen = None
+
+    def __getstate__(self):
+        return (self.base, self.local)
+
+    def __setstate__(self, state):
+        base, local = state
+        self.__init__(base)
+        self.local = local
+
+    def _check_base(self):
+        if len(self.base) != self._baselen:
+            raise RuntimeError("The keys of a mapping used as a namespace "
+                               "were modified directly. Write to the "
+                               "namespace instead.")
+
+    def __getitem__(self, key):
+        local = self.local
+        if local is not None and key in local:
+            return local[key]
+        if self._baselen is not None:
+            self._check_base()
+        return self.base[key]
+
+    def __contains__(self, key):
+        local = self.local
+        if local is not None and key in local:
+            return True
+        if self._baselen is not None:
+            self._check_base()
+        return key in self.base
+
+    def __setitem__(self, key, value):
+        if self.local is None:
+            self.local = NSFrame()
+            if self._gens is not _untracked:
+                self.local._gens = self._gens
+        self.local[key] = value
+
+    def __delitem__(self, key):
+        if self.local is None or key not in self.local:
+            raise KeyError(f"Key not found in the writable level: {key!r}")
+        del self.local[key]
+
+    def __iter__(self):
+        #Same order as a ChainMap
+        keys = dict.fromkeys(self.base)
+        if self.local is not None:
+            keys.update(dict.fromkeys(self.local))
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.local!r}, {self.base!r})'
+
+
+#Index of the tracked chains that are short enough to be scanned
+_no_index = types.MappingProxyType({})
+
+#Returned by _generations_of for the mappings whose changes can't be tracked
+_untracked = object()
+
+def _generations_of(mapping):
+    """Return the ``Generations`` the mapping is attached to, None if it
+    can be attached to any, or ``_untracked``."""
+    if isinstance(mapping, NSFrame):
+        return mapping._gens
+    if isinstance(mapping, NSOverlay):
+        return mapping._gens
+    if isinstance(mapping, ChainMap) and mapping._index is not None:
+        return mapping._gens
+    return _untracked
+
+def _attach(mapping, gens):
+    """Attach a mapping for which ``_generations_of`` returns None to
+    ``gens``. Return False if it can't be tracked as part of the tree."""
+    if isinstance(mapping, NSFrame):
+        mapping._gens = gens
+        return True
+    base = mapping.base
+    bgens = _generations_of(base)
+    if bgens is None:
+        if not _attach(base, gens):
+            mapping._gens = _untracked
+            return False
+    elif bgens is _untracked:
+        #The keys of the base are assumed not to change.
+        mapping._baselen = len(base)
+    elif bgens is not gens:
+        #Writes to the base are recorded in a different tree.
+        mapping._gens = _untracked
+        return False
+    mapping._gens = gens
+    if mapping.local is not None:
+        mapping.local._gens = gens
+    return True
+
+def _share_generations(maps):
+    """Return the ``Generations`` of the tree the maps belong to, attaching
+    the maps that are not part of any tree yet, or None if some map can't
+    be tracked or they belong to different trees."""
+    gens = None
+    for mapping in maps:
+        mgens = _generations_of(mapping)
+        if mgens is _untracked:
+            return None
+        if mgens is not None:
+            if gens is None:
+                gens = mgens
+            elif mgens is not gens:
+                return None
+    if gens is None:
+        gens = Generations()
+    for mapping in maps:
+        if _generations_of(mapping) is None and not _attach(mapping, gens):
+            return None
+    return gens
+
+
 class ChainMap(collections.ChainMap):
+    """A ``collections.ChainMap`` that caches the position of the keys it
+    looks up, so that the cost of a lookup doesn't grow with the number of
+    maps.
+
+    The cache is used when all the maps are ``NSFrame`` objects (which is
+    what ``new_child`` and the constructor create by default),
+    ``NSOverlay`` objects or cached ``ChainMap`` objects, since the changes
+    to their keys can be detected. Writing to them directly (e.g.
+    ``ns.maps[i][key] = value``) is fine. The maps become part of the tree
+    of namespaces of the chain, whose ``Generations`` record the changes,
+    and a chain mixing maps of different trees is not cached. Otherwise
+    the maps are scanned in order each time, as in the standard library.
+
+    A child created with ``new_child`` resolves the keys it doesn't
+    contain through the cache of its parent, so that namespaces sharing a
+    prefix share the work of looking up the keys. Chains of up to
+    ``SCAN_DEPTH`` maps are scanned rather than cached, which is as fast
+    and saves the memory of the cache.
+    """
+
+    SCAN_DEPTH = 3
+
+    def __init__(self, *maps):
+        self.maps = list(maps) or [NSFrame()]
+        self._parent = None
+        self._index = self._make_index(
+            _share_generations(self.maps) is not None)
+
+    @property
+    def _gens(self):
+        """The ``Generations`` of the tree of a cached instance, which all
+        its maps share."""
+        if self._index is None:
+            return None
+        return self.maps[-1]._gens
+
+    def _make_index(self, tracked):
+        #None means that the maps are not tracked
+        if not tracked:
+            return None
+        if len(self.maps) <= self.SCAN_DEPTH:
+            return _no_index
+        return {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        #The generations are only meaningful within a process.
+        del state['_parent'], state['_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._parent = None
+        self._index = self._make_index(
+            _share_generations(self.maps) is not None)
+
+    def new_child(self, m=None, **kwargs):
+        if m is None:
+            m = NSFrame(kwargs)
+        elif kwargs:
+            m.update(kwargs)
+        gens = self._gens
+        if gens is not None:
+            mgens = _generations_of(m)
+            if mgens is None and _attach(m, gens):
+                mgens = gens
+            if mgens is gens:
+                #Only the new map needs to be checked.
+                child = self.__class__.__new__(self.__class__)
+                #Same order as __init__, so that the instance dicts share
+                #their keys.
+                child.maps = list((m, *self.maps))
+                child._parent = self
+                child._index = child._make_index(True)
+                return child
+        return self.__class__(m, *self.maps)
+
+    def _find(self, key):
+        """Return the index of the first map containing ``key``, or -1 if
+        there is none. Only for cached instances."""
+        if self._index is _no_index:
+            for index, mapping in enumerate(self.maps):
+                if key in mapping:
+                    return index
+            return -1
+        #The generation must be read before looking at the maps, so that
+        #concurrent changes invalidate what we store.
+        gen = self._gens._keys.get(key, 0)
+        below = []
+        node = self
+        while True:
+            entry = node._index.get(key)
+            if entry is not None and entry[1] == gen:
+                index = entry[0]
+                break
+            parent = node._parent
+            shallow = node._index is _no_index
+            if shallow or parent is None or key in node.maps[0]:
+                for index, mapping in enumerate(node.maps):
+                    if key in mapping:
+                        break
+                else:
+                    index = -1
+                if not shallow:
+                    node._index[key] = (index, gen)
+                break
+            below.append(node)
+            node = parent
+        for node in reversed(below):
+            if index >= 0:
+                index += 1
+            node._index[key] = (index, gen)
+        return index
+
+    def __getitem__(self, key):
+        if self._index is None:
+            return super().__getitem__(key)
+        index = self._find(key)
+        if index < 0:
+            return self.__missing__(key)
+        return self.maps[index][key]
+
+    def __contains__(self, key):
+        if self._index is None:
+            return super().__contains__(key)
+        return self._find(key) >= 0
+
+    def get(self, key, default=None):
+        if self._index is None:
+            return super().get(key, default)
+        index = self._find(key)
+        if index < 0:
+            return default
+        return self.maps[index][key]
+
     def get_where(self, key):
-        for i, mapping in enumerate(self.maps):
-            try:
-                return i, mapping[key]             # can't use 'key in mapping' with defaultdict
-            except KeyError:
-                pass
-        return self.__missing__(key)            # support subclasses that define __missing__
+        """Return a tuple ``(index, value)`` with the index of the first
+        map containing ``key`` and the corresponding value."""
+        if self._index is None:
+            for i, mapping in enumerate(self.maps):
+                try:
+                    return i, mapping[key]             # can't use 'key in mapping' with defaultdict
+                except KeyError:
+                    pass
+            return self.__missing__(key)            # support subclasses that define __missing__
+        index = self._find(key)
+        if index < 0:
+            return self.__missing__(key)
+        return index, self.maps[index][key]
 
 def get_functions(obj):
     """Get the list of members of the object that are functions,